@@ -23,11 +23,20 @@ def pytest_addoption(parser):
         action="store_true",
         help="Run iTunes tests, see tests/sentry/utils/appleconnect/itunes",
     )
+    parser.addoption(
+        "--run-benchmarks",
+        action="store_true",
+        help="Run tests using the benchmark fixture, which requires pytest-benchmark",
+    )
 
 
 def pytest_runtest_setup(item):
     if item.get_closest_marker("itunes") and not item.config.getoption("--itunes"):
         pytest.skip("Test requires --itunes")
+    if "benchmark" in getattr(item, "fixturenames", ()) and not item.config.getoption(
+        "--run-benchmarks"
+    ):
+        pytest.skip("Test requires --run-benchmarks")
 
 
 # XXX: The below code is vendored code from https://github.com/utgwkk/pytest-github-actions-annotate-failures
@@ -1,4 +1,5 @@
 import re
+import threading
 from collections import namedtuple
 from dataclasses import asdict, dataclass, field
 from datetime import datetime
@@ -29,6 +30,7 @@ from sentry.search.utils import (
     parse_percentage,
 )
 from sentry.utils.compat import filter, map
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.snuba import is_duration_measurement, is_measurement, is_span_op_breakdown
 from sentry.utils.validators import is_event_id
 
@@ -447,6 +449,9 @@ class SearchVisitor(NodeVisitor):
             config = SearchConfig()
         self.config = config
         self.params = params if params is not None else {}
+        # Cleared when the result depends on ``params`` or on the current
+        # time, and can't be reused for other searches.
+        self.cacheable = True
 
     @cached_property
     def key_mappings_lookup(self):
@@ -585,6 +590,7 @@ class SearchVisitor(NodeVisitor):
         (search_key, _, value) = children
 
         if self.is_date_key(search_key.name):
+            self.cacheable = False
             try:
                 from_val, to_val = parse_datetime_range(value.text)
             except InvalidQuery as exc:
@@ -665,6 +671,7 @@ class SearchVisitor(NodeVisitor):
         try:
             # Even if the search value matches duration format, only act as
             # duration for certain columns
+            self.cacheable = self.cacheable and not self.params
             function = resolve_field(search_key.name, self.params, functions_acl=FUNCTIONS.keys())
 
             is_duration_key = False
@@ -701,6 +708,7 @@ class SearchVisitor(NodeVisitor):
         try:
             # Even if the search value matches percentage format, only act as
             # percentage for certain columns
+            self.cacheable = self.cacheable and not self.params
             function = resolve_field(search_key.name, self.params, functions_acl=FUNCTIONS.keys())
             if function.aggregate is not None and self.is_percentage_key(function.aggregate[0]):
                 aggregate_value = parse_percentage(search_value)
@@ -747,6 +755,7 @@ class SearchVisitor(NodeVisitor):
         operator = handle_negation(negation, operator)
         is_date_aggregate = any(key in search_key.name for key in self.config.date_keys)
         if is_date_aggregate:
+            self.cacheable = False
             try:
                 from_val, to_val = parse_datetime_range(search_value.text)
             except InvalidQuery as exc:
@@ -1037,9 +1046,27 @@ default_config = SearchConfig(
 )
 
 
-def parse_search_query(query, config=None, params=None) -> Sequence[SearchFilter]:
-    if config is None:
-        config = default_config
+# Both caches are bounded by the total length of the cached queries, as parse
+# trees and results grow with the query.
+PARSE_CACHE_SIZE = 100000
+
+# Parse trees by query. They don't depend on the config, so searches that
+# can't reuse results (see ``SearchVisitor.cacheable``) still skip parsing.
+_parse_tree_cache = LRUCache(PARSE_CACHE_SIZE, sizeof=lambda tree: len(tree.full_text))
+
+# ``(query, config, result)`` by query and config identity. Configs are
+# module level constants, and holding on to them makes sure the id isn't
+# reused while the result is cached.
+_parse_result_cache = LRUCache(PARSE_CACHE_SIZE, sizeof=lambda value: len(value[0]))
+
+_parse_cache_lock = threading.Lock()
+
+
+def parse_search_query_tree(query):
+    with _parse_cache_lock:
+        tree = _parse_tree_cache.get(query)
+    if tree is not None:
+        return tree
 
     try:
         tree = event_search_grammar.parse(query)
@@ -1053,4 +1080,36 @@ def parse_search_query(query, config=None, params=None) -> Sequence[SearchFilter
                 "This is commonly caused by unmatched parentheses. Enclose any text in double quotes.",
             )
         )
-    return SearchVisitor(config, params=params).visit(tree)
+
+    with _parse_cache_lock:
+        _parse_tree_cache[query] = tree
+    return tree
+
+
+def parse_search_query(query, config=None, params=None) -> Sequence[SearchFilter]:
+    """
+    Parses ``query`` into a list of search filters, boolean operators and
+    paren expressions.
+
+    Results that depend neither on ``params`` nor on the current time are
+    cached per process, and shared between all searches of the same query
+    and config. Callers get a new list, but must not modify its items.
+    """
+    if config is None:
+        config = default_config
+
+    cache_key = (query, id(config))
+    with _parse_cache_lock:
+        cached = _parse_result_cache.get(cache_key)
+    if cached is not None and cached[1] is config:
+        return list(cached[2])
+
+    tree = parse_search_query_tree(query)
+    visitor = SearchVisitor(config, params=params)
+    rv = visitor.visit(tree)
+
+    if visitor.cacheable:
+        with _parse_cache_lock:
+            _parse_result_cache[cache_key] = (query, config, rv)
+        return list(rv)
+    return rv
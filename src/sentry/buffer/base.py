@@ -1,6 +1,11 @@
 import logging
+from collections import defaultdict
 
-from django.db.models import F
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, router, transaction
+from django.db.models import F, Model
+from django.db.models.expressions import BaseExpression
+from psycopg2.extras import execute_values
 
 from sentry.signals import buffer_incr_complete
 from sentry.tasks.process_buffer import process_incr
@@ -28,7 +33,7 @@ class Buffer(Service, metaclass=BufferMount):
     keep up with the updates.
     """
 
-    __all__ = ("incr", "process", "process_pending", "validate")
+    __all__ = ("incr", "process", "process_batch", "process_pending", "validate")
 
     def incr(self, model, columns, filters, extra=None, signal_only=None):
         """
@@ -82,3 +87,189 @@ class Buffer(Service, metaclass=BufferMount):
             created=created,
             sender=model,
         )
+
+    def process_batch(self, payloads):
+        """
+        Applies many pending increments at once. ``payloads`` is a list of
+        ``(model, columns, filters, extra, signal_only)`` tuples as they would
+        be passed to ``process``.
+
+        Increments that share a model, column set and filter set are written
+        with a single ``UPDATE ... FROM (VALUES ...)`` statement. Anything that
+        can't be expressed that way, or whose row does not exist yet, goes
+        through ``process`` one at a time so creation semantics are preserved.
+
+        The pending increments have already been removed from the buffer, so
+        a failing update is logged and only loses its own increments.
+        """
+        fallback = []
+        grouped = defaultdict(list)
+
+        for payload in payloads:
+            model, columns, filters, extra, signal_only = payload
+            group_key = None if signal_only else self._get_bulk_group_key(*payload[:4])
+            if group_key is None:
+                fallback.append(payload)
+            else:
+                grouped[group_key].append(payload)
+
+        for group_key, batch in grouped.items():
+            if len(batch) == 1:
+                fallback.extend(batch)
+                continue
+
+            try:
+                updated = self._bulk_update(group_key, batch)
+            except Exception:
+                # Rows that were updated are rolled back with the statement,
+                # so all of them can be retried one at a time.
+                self.logger.exception("buffer.bulk-update-failed", extra={"size": len(batch)})
+                fallback.extend(batch)
+                continue
+
+            for idx, (model, columns, filters, extra, signal_only) in enumerate(batch):
+                if idx not in updated:
+                    fallback.append((model, columns, filters, extra, signal_only))
+                    continue
+                buffer_incr_complete.send_robust(
+                    model=model,
+                    columns=columns,
+                    filters=filters,
+                    extra=extra,
+                    created=False,
+                    sender=model,
+                )
+
+        # Subclasses override ``process`` to read from their own storage, so
+        # explicitly use the database-writing implementation here.
+        for payload in fallback:
+            try:
+                Buffer.process(self, *payload)
+            except Exception:
+                self.logger.exception("buffer.process-failed", extra={"model": payload[0].__name__})
+
+    def _has_computed_score(self, model, columns, extra):
+        # Mirrors the score HACK in ``process``.
+        from sentry.models import Group
+
+        return model is Group and "last_seen" in extra and "times_seen" in columns
+
+    def _get_bulk_group_key(self, model, columns, filters, extra):
+        """
+        Returns the key increments are grouped by for a bulk update, or
+        ``None`` if the increment has to go through ``process``.
+        """
+        extra = extra or {}
+        if not columns or not filters:
+            return None
+
+        has_score = self._has_computed_score(model, columns, extra)
+        for name in list(columns) + list(filters) + list(extra):
+            if name == "score" and has_score:
+                continue
+            if self._get_bulk_field(model, name) is None:
+                return None
+
+        for name, value in extra.items():
+            if isinstance(value, BaseExpression) and not (name == "score" and has_score):
+                return None
+
+        for value in filters.values():
+            if isinstance(value, BaseExpression):
+                return None
+
+        return (model, tuple(sorted(columns)), tuple(sorted(filters)), tuple(sorted(extra)))
+
+    def _get_bulk_field(self, model, name):
+        opts = model._meta
+        if name == "pk":
+            return opts.pk
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not getattr(field, "concrete", False) or field.many_to_many:
+            return None
+        return field
+
+    def _bulk_update(self, group_key, batch):
+        """
+        Runs one ``UPDATE ... FROM (VALUES ...)`` for a batch of increments
+        that share ``group_key`` and returns the indexes of the rows that
+        were updated.
+        """
+        model, column_names, filter_names, extra_names = group_key
+        has_score = self._has_computed_score(model, column_names, extra_names)
+        extra_names = tuple(name for name in extra_names if not (name == "score" and has_score))
+
+        using = router.db_for_write(model)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+
+        value_fields = (
+            [("i", name, self._get_bulk_field(model, name)) for name in column_names]
+            + [("e", name, self._get_bulk_field(model, name)) for name in extra_names]
+            + [("f", name, self._get_bulk_field(model, name)) for name in filter_names]
+        )
+        aliases = ["idx"] + [f"{kind}{i}" for i, (kind, _, _) in enumerate(value_fields)]
+
+        set_clauses = []
+        where_clauses = []
+        template = ["%s"]
+        times_seen_alias = last_seen_alias = None
+        for alias, (kind, name, field) in zip(aliases[1:], value_fields):
+            column = qn(field.column)
+            template.append(f"%s::{field.db_type(connection)}")
+            if kind == "i":
+                set_clauses.append(f"{column} = t.{column} + v.{alias}")
+                if name == "times_seen":
+                    times_seen_alias = alias
+            elif kind == "e":
+                set_clauses.append(f"{column} = v.{alias}")
+                if name == "last_seen":
+                    last_seen_alias = alias
+            else:
+                where_clauses.append(f"t.{column} = v.{alias}")
+
+        if has_score:
+            set_clauses.append(
+                f"{qn('score')} = log(t.{qn('times_seen')} + v.{times_seen_alias}) * 600 "
+                f"+ floor(extract(epoch from v.{last_seen_alias}))::int"
+            )
+
+        rows = []
+        for idx, (_, columns, filters, extra, _) in enumerate(batch):
+            row = [idx]
+            for kind, name, field in value_fields:
+                if kind == "i":
+                    value = columns[name]
+                elif kind == "e":
+                    value = extra[name]
+                else:
+                    value = filters[name]
+                if isinstance(value, Model):
+                    value = value.pk
+                row.append(field.get_db_prep_save(value, connection))
+            rows.append(row)
+
+        sql = (
+            f"UPDATE {qn(model._meta.db_table)} AS t "
+            f"SET {', '.join(set_clauses)} "
+            f"FROM (VALUES %s) AS v ({', '.join(aliases)}) "
+            f"WHERE {' AND '.join(where_clauses)} "
+            f"RETURNING v.idx"
+        )
+
+        # A savepoint keeps a failing statement from aborting a surrounding
+        # transaction, so that the increments can still be retried.
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            result = execute_values(
+                cursor,
+                sql,
+                rows,
+                template=f"({', '.join(template)})",
+                page_size=len(rows),
+                fetch=True,
+            )
+
+        return {idx for (idx,) in result}
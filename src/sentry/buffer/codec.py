@@ -0,0 +1,106 @@
+import pickle
+from datetime import datetime, timezone
+from typing import Any
+
+import msgpack
+from django.db import models
+
+from sentry.utils.codecs import Codec
+from sentry.utils.imports import import_string
+
+# Every payload starts with this header. Neither pickle (``\x80`` or an
+# opcode for protocol 0) nor JSON payloads can start with a null byte, which
+# lets readers tell the formats apart while old values are still around.
+MAGIC = b"\x00"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+
+EXT_DATETIME = 1
+EXT_MODEL = 2
+EXT_SCORE_CLAUSE = 3
+EXT_PICKLE = 4
+EXT_TUPLE = 5
+EXT_BIG_INT = 6
+
+
+def is_compact_value(value: bytes) -> bool:
+    return value.startswith(MAGIC)
+
+
+class BufferValueCodec(Codec[Any, bytes]):
+    """
+    Compact, versioned encoding for buffer ``filters`` and ``extra`` values.
+
+    Plain values are stored as msgpack. Tuples, integers that don't fit into
+    64 bits, datetimes, model instances and ``ScoreClause`` expressions get
+    their own tagged extension types; model instances only keep their class
+    and primary key, which is all the flush side needs to build filters.
+    Anything else, including subclasses of the plain types, falls back to a
+    tagged pickle so values keep their types like they did with pickle.
+    """
+
+    def encode(self, value: Any) -> bytes:
+        return HEADER + self._pack(value)
+
+    def decode(self, value: bytes) -> Any:
+        if not value.startswith(MAGIC):
+            raise ValueError("not a compact buffer value")
+        version = value[1]
+        if version != VERSION:
+            raise ValueError(f"unsupported buffer value version: {version}")
+        return self._unpack(value[2:])
+
+    def _pack(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=self._encode_ext, use_bin_type=True, strict_types=True)
+
+    def _unpack(self, value: bytes) -> Any:
+        return msgpack.unpackb(value, ext_hook=self._decode_ext, raw=False, strict_map_key=False)
+
+    def _encode_ext(self, value: Any) -> msgpack.ExtType:
+        from sentry.event_manager import ScoreClause
+
+        # The payloads of extension types are packed as lists, tuples would be
+        # tagged themselves.
+        if type(value) is tuple:
+            return msgpack.ExtType(EXT_TUPLE, self._pack(list(value)))
+        if type(value) is int:
+            # msgpack only falls back to ``default`` for integers that don't
+            # fit into 64 bits.
+            length = value.bit_length() // 8 + 1
+            return msgpack.ExtType(EXT_BIG_INT, value.to_bytes(length, "big", signed=True))
+        if isinstance(value, datetime):
+            aware = value.tzinfo is not None
+            ts = value.timestamp() if aware else value.replace(tzinfo=timezone.utc).timestamp()
+            seconds = int(ts // 1)
+            return msgpack.ExtType(EXT_DATETIME, self._pack([seconds, value.microsecond, aware]))
+        if isinstance(value, models.Model):
+            model = type(value)
+            return msgpack.ExtType(
+                EXT_MODEL, self._pack([f"{model.__module__}.{model.__name__}", value.pk])
+            )
+        if isinstance(value, ScoreClause):
+            return msgpack.ExtType(
+                EXT_SCORE_CLAUSE, self._pack([value.last_seen, value.times_seen])
+            )
+        return msgpack.ExtType(EXT_PICKLE, pickle.dumps(value))
+
+    def _decode_ext(self, code: int, data: bytes) -> Any:
+        if code == EXT_TUPLE:
+            return tuple(self._unpack(data))
+        if code == EXT_BIG_INT:
+            return int.from_bytes(data, "big", signed=True)
+        if code == EXT_DATETIME:
+            seconds, microsecond, aware = self._unpack(data)
+            rv = datetime.fromtimestamp(seconds, tz=timezone.utc).replace(microsecond=microsecond)
+            return rv if aware else rv.replace(tzinfo=None)
+        if code == EXT_MODEL:
+            path, pk = self._unpack(data)
+            return import_string(path)(pk=pk)
+        if code == EXT_SCORE_CLAUSE:
+            from sentry.event_manager import ScoreClause
+
+            last_seen, times_seen = self._unpack(data)
+            return ScoreClause(last_seen=last_seen, times_seen=times_seen)
+        if code == EXT_PICKLE:
+            return pickle.loads(data)
+        return msgpack.ExtType(code, data)
@@ -8,6 +8,7 @@ from django.utils import timezone
 from django.utils.encoding import force_bytes, force_text
 
 from sentry.buffer import Buffer
+from sentry.buffer.codec import BufferValueCodec, is_compact_value
 from sentry.exceptions import InvalidConfiguration
 from sentry.tasks.process_buffer import process_incr, process_pending
 from sentry.utils import json, metrics
@@ -19,6 +20,8 @@ from sentry.utils.redis import get_cluster_from_options
 _local_buffers = None
 _local_buffers_lock = threading.Lock()
 
+buffer_value_codec = BufferValueCodec()
+
 
 class PendingBuffer:
     def __init__(self, size):
@@ -47,16 +50,108 @@ class PendingBuffer:
         return rv
 
 
+class CoalescingBuffer:
+    """
+    Worker-local pre-aggregation of ``incr`` calls. Counters for the same
+    (model, filters) key are summed and ``extra`` values are last write
+    wins, mirroring what the Redis hash would end up containing anyway.
+    """
+
+    def __init__(self, max_keys, max_age):
+        assert max_keys > 0
+        self.max_keys = max_keys
+        self.max_age = max_age
+        self.items = {}
+        self.started_at = None
+        self.lock = threading.Lock()
+
+    def add(self, key, model, columns, filters, extra=None, signal_only=None):
+        """
+        Merges an increment into the buffer and returns ``True`` if the
+        buffer should be flushed.
+        """
+        with self.lock:
+            if not self.items:
+                self.started_at = time()
+
+            item = self.items.get(key)
+            if item is None:
+                item = self.items[key] = {
+                    "model": model,
+                    "columns": {},
+                    "filters": filters,
+                    "extra": {},
+                    "signal_only": None,
+                }
+
+            for column, amount in columns.items():
+                item["columns"][column] = item["columns"].get(column, 0) + amount
+            if extra:
+                item["extra"].update(extra)
+            if signal_only is True:
+                item["signal_only"] = True
+
+            return len(self.items) >= self.max_keys or time() - self.started_at >= self.max_age
+
+    def empty(self):
+        return not self.items
+
+    def flush(self):
+        with self.lock:
+            rv = self.items
+            self.items = {}
+            self.started_at = None
+        return rv
+
+
 class RedisBuffer(Buffer):
     key_expire = 60 * 60  # 1 hour
     pending_key = "b:p"
 
-    def __init__(self, pending_partitions=1, incr_batch_size=2, **options):
+    def __init__(
+        self,
+        pending_partitions=1,
+        incr_batch_size=2,
+        bulk_process=False,
+        coalesce=False,
+        coalesce_max_keys=1000,
+        coalesce_max_age=1.0,
+        compact_values=False,
+        pending_chunk_size=10000,
+        **options,
+    ):
         self.cluster, options = get_cluster_from_options("SENTRY_BUFFER_OPTIONS", options)
         self.pending_partitions = pending_partitions
         self.incr_batch_size = incr_batch_size
+        # How many pending keys ``process_pending`` holds in memory at once.
+        self.pending_chunk_size = pending_chunk_size
+        # When enabled, ``process`` reads a whole batch of keys with one
+        # pipeline per Redis host and applies them with ``process_batch``.
+        self.bulk_process = bulk_process
         assert self.pending_partitions > 0
         assert self.incr_batch_size > 0
+        assert self.pending_chunk_size > 0
+
+        # Write filters and extra values with ``BufferValueCodec`` instead of
+        # pickle. Readers accept both, so this can be enabled once every
+        # worker that processes buffers understands the compact format.
+        self.compact_values = compact_values
+
+        # When enabled, ``incr`` only aggregates in worker memory. The
+        # aggregate is written to Redis once it holds ``coalesce_max_keys``
+        # keys, is older than ``coalesce_max_age`` seconds, or a task or
+        # request finishes.
+        self.coalescing_buffer = None
+        if coalesce:
+            self.coalescing_buffer = CoalescingBuffer(coalesce_max_keys, coalesce_max_age)
+            self.connect_signals()
+
+    def connect_signals(self):
+        from celery.signals import task_postrun
+        from django.core.signals import request_finished
+
+        task_postrun.connect(self.flush_coalesced, weak=False)
+        request_finished.connect(self.flush_coalesced, weak=False)
 
     def validate(self):
         try:
@@ -142,6 +237,13 @@ class RedisBuffer(Buffer):
         else:
             raise TypeError(f"invalid type: {type_}")
 
+    def _encode_value(self, value):
+        if self.compact_values:
+            return buffer_value_codec.encode(value)
+        # TODO(dcramer): once this goes live in production, we can kill the pickle path
+        # (this is to ensure a zero downtime deploy where we can transition event processing)
+        return pickle.dumps(value)
+
     def incr(self, model, columns, filters, extra=None, signal_only=None):
         """
         Increment the key by doing the following:
@@ -156,42 +258,75 @@ class RedisBuffer(Buffer):
         # TODO(dcramer): longer term we'd rather not have to serialize values
         # here (unless it's to JSON)
         key = self._make_key(model, filters)
-        pending_key = self._make_pending_key_from_key(key)
+
+        metrics.incr(
+            "buffer.incr",
+            skip_internal=True,
+            tags={"module": model.__module__, "model": model.__name__},
+        )
+
+        if self.coalescing_buffer is not None:
+            if self.coalescing_buffer.add(key, model, columns, filters, extra, signal_only):
+                self.flush_coalesced()
+            return
+
         # We can't use conn.map() due to wanting to support multiple pending
         # keys (one per Redis partition)
         conn = self.cluster.get_local_client_for_key(key)
 
         pipe = conn.pipeline()
-        pipe.hsetnx(key, "m", f"{model.__module__}.{model.__name__}")
-        # TODO(dcramer): once this goes live in production, we can kill the pickle path
-        # (this is to ensure a zero downtime deploy where we can transition event processing)
-        pipe.hsetnx(key, "f", pickle.dumps(filters))
-        # pipe.hsetnx(key, 'f', json.dumps(self._dump_values(filters)))
+        self._queue_incr(pipe, key, model, columns, filters, extra, signal_only)
+        pipe.execute()
+
+    def flush_coalesced(self, **kwargs):
+        """
+        Writes everything aggregated by the coalescing buffer to Redis, using
+        one pipeline per Redis host.
+        """
+        if self.coalescing_buffer is None or self.coalescing_buffer.empty():
+            return
+
+        items = self.coalescing_buffer.flush()
+        with self.cluster.fanout() as conn:
+            for key, item in items.items():
+                self._queue_incr(
+                    conn.target_key(key),
+                    key,
+                    item["model"],
+                    item["columns"],
+                    item["filters"],
+                    item["extra"],
+                    item["signal_only"],
+                )
+
+        metrics.timing("buffer.coalesced-keys", len(items))
+
+    def _queue_incr(self, client, key, model, columns, filters, extra=None, signal_only=None):
+        """
+        Queues the commands for one increment on ``client``, which is either a
+        pipeline or a fanout client targeted at the host owning ``key``.
+        """
+        pending_key = self._make_pending_key_from_key(key)
+
+        client.hsetnx(key, "m", f"{model.__module__}.{model.__name__}")
+        client.hsetnx(key, "f", self._encode_value(filters))
+        # client.hsetnx(key, 'f', json.dumps(self._dump_values(filters)))
         for column, amount in columns.items():
-            pipe.hincrby(key, "i+" + column, amount)
+            client.hincrby(key, "i+" + column, amount)
 
         if extra:
             # Group tries to serialize 'score', so we'd need some kind of processing
             # hook here
             # e.g. "update score if last_seen or times_seen is changed"
             for column, value in extra.items():
-                # TODO(dcramer): once this goes live in production, we can kill the pickle path
-                # (this is to ensure a zero downtime deploy where we can transition event processing)
-                pipe.hset(key, "e+" + column, pickle.dumps(value))
-                # pipe.hset(key, 'e+' + column, json.dumps(self._dump_value(value)))
+                client.hset(key, "e+" + column, self._encode_value(value))
+                # client.hset(key, 'e+' + column, json.dumps(self._dump_value(value)))
 
         if signal_only is True:
-            pipe.hset(key, "s", "1")
+            client.hset(key, "s", "1")
 
-        pipe.expire(key, self.key_expire)
-        pipe.zadd(pending_key, {key: time()})
-        pipe.execute()
-
-        metrics.incr(
-            "buffer.incr",
-            skip_internal=True,
-            tags={"module": model.__module__, "model": model.__name__},
-        )
+        client.expire(key, self.key_expire)
+        client.zadd(pending_key, {key: time()})
 
     def process_pending(self, partition=None):
         if partition is None and self.pending_partitions > 1:
@@ -210,27 +345,38 @@ class RedisBuffer(Buffer):
         if not client.set(lock_key, "1", nx=True, ex=60):
             return
 
+        # Only drain keys that were pending when we started. Anything added
+        # while we work is picked up by the next run instead of keeping this
+        # one going forever.
+        horizon = time()
         pending_buffer = PendingBuffer(self.incr_batch_size)
 
         try:
             keycount = 0
-            with self.cluster.all() as conn:
-                results = conn.zrange(pending_key, 0, -1)
-
-            with self.cluster.all() as conn:
-                for host_id, keys in results.value.items():
+            for host_id in self.cluster.hosts:
+                # Keys are always added to the pending set on the host that
+                # owns them, so every batch queued here only touches one host.
+                conn = self.cluster.get_local_client(host_id)
+                while True:
+                    # Keys are removed after every chunk, so the start of the
+                    # set doubles as our cursor.
+                    keys = conn.zrangebyscore(
+                        pending_key, "-inf", horizon, start=0, num=self.pending_chunk_size
+                    )
                     if not keys:
-                        continue
+                        break
                     keycount += len(keys)
                     for key in keys:
                         pending_buffer.append(key.decode("utf-8"))
                         if pending_buffer.full():
                             process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
-                    conn.target([host_id]).zrem(pending_key, *keys)
+                    conn.zrem(pending_key, *keys)
+                    # a large backlog can take longer than the initial lock
+                    client.expire(lock_key, 60)
 
-            # queue up remainder of pending keys
-            if not pending_buffer.empty():
-                process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
+                # queue up remainder of pending keys for this host
+                if not pending_buffer.empty():
+                    process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
 
             metrics.timing("buffer.pending-size", keycount)
         finally:
@@ -243,9 +389,98 @@ class RedisBuffer(Buffer):
         if key is not None:
             batch_keys = [key]
 
+        if self.bulk_process and len(batch_keys) > 1:
+            self._process_batch_incr(batch_keys)
+            return
+
         for key in batch_keys:
             self._process_single_incr(key)
 
+    def _process_batch_incr(self, keys):
+        # Same per-key locks as ``_process_single_incr``, just acquired and
+        # released in one round-trip per host.
+        with self.cluster.map() as conn:
+            lock_results = [
+                (key, conn.set(self._make_lock_key(key), "1", nx=True, ex=10)) for key in keys
+            ]
+
+        locked_keys = []
+        for key, result in lock_results:
+            if result.value:
+                locked_keys.append(key)
+            else:
+                metrics.incr("buffer.revoked", tags={"reason": "locked"}, skip_internal=False)
+                self.logger.debug("buffer.revoked.locked", extra={"redis_key": key})
+
+        if not locked_keys:
+            return
+
+        try:
+            with self.cluster.fanout() as conn:
+                results = []
+                for key in locked_keys:
+                    c = conn.target_key(key)
+                    results.append((key, c.hgetall(key)))
+                    c.zrem(self._make_pending_key_from_key(key), key)
+                    c.delete(key)
+
+            payloads = []
+            for key, result in results:
+                values = {force_text(k): v for k, v in result.value.items()}
+                if not values:
+                    metrics.incr("buffer.revoked", tags={"reason": "empty"}, skip_internal=False)
+                    self.logger.debug("buffer.revoked.empty", extra={"redis_key": key})
+                    continue
+                try:
+                    payloads.append(self._load_payload(values))
+                except Exception:
+                    self.logger.exception("buffer.load-failed", extra={"redis_key": key})
+
+            metrics.timing("buffer.batch-size", len(payloads))
+            if payloads:
+                super().process_batch(payloads)
+        finally:
+            with self.cluster.map() as conn:
+                for key in locked_keys:
+                    conn.delete(self._make_lock_key(key))
+
+    def _load_payload(self, values):
+        """
+        Decodes a buffer hash into the ``(model, columns, filters, extra,
+        signal_only)`` arguments of ``Buffer.process``.
+        """
+        # XXX(py3): Note that ``import_string`` explicitly wants a str in
+        # python2, so we'll decode (for python3) and then translate back to
+        # a byte string (in python2) for import_string.
+        model = import_string(str(values.pop("m").decode("utf-8")))  # NOQA
+
+        if is_compact_value(values["f"]):
+            filters = buffer_value_codec.decode(values.pop("f"))
+        elif values["f"].startswith(b"{"):
+            filters = self._load_values(json.loads(values.pop("f").decode("utf-8")))
+        else:
+            # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
+            filters = pickle.loads(values.pop("f"))
+
+        incr_values = {}
+        extra_values = {}
+        signal_only = None
+        for k, v in values.items():
+            if k.startswith("i+"):
+                incr_values[k[2:]] = int(v)
+            elif k.startswith("e+"):
+                if is_compact_value(v):
+                    extra_values[k[2:]] = buffer_value_codec.decode(v)
+                elif v.startswith(b"["):
+                    extra_values[k[2:]] = self._load_value(json.loads(v.decode("utf-8")))
+                else:
+                    # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
+                    extra_values[k[2:]] = pickle.loads(v)
+            elif k == "s":
+                signal_only = bool(int(v))  # Should be 1 if set
+
+        return model, incr_values, filters, extra_values, signal_only
+
     def _process_single_incr(self, key):
         client = self.cluster.get_routing_client()
         lock_key = self._make_lock_key(key)
@@ -276,32 +511,6 @@ class RedisBuffer(Buffer):
                 self.logger.debug("buffer.revoked.empty", extra={"redis_key": key})
                 return
 
-            # XXX(py3): Note that ``import_string`` explicitly wants a str in
-            # python2, so we'll decode (for python3) and then translate back to
-            # a byte string (in python2) for import_string.
-            model = import_string(str(values.pop("m").decode("utf-8")))  # NOQA
-
-            if values["f"].startswith(b"{"):
-                filters = self._load_values(json.loads(values.pop("f").decode("utf-8")))
-            else:
-                # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
-                filters = pickle.loads(values.pop("f"))
-
-            incr_values = {}
-            extra_values = {}
-            signal_only = None
-            for k, v in values.items():
-                if k.startswith("i+"):
-                    incr_values[k[2:]] = int(v)
-                elif k.startswith("e+"):
-                    if v.startswith(b"["):
-                        extra_values[k[2:]] = self._load_value(json.loads(v.decode("utf-8")))
-                    else:
-                        # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
-                        extra_values[k[2:]] = pickle.loads(v)
-                elif k == "s":
-                    signal_only = bool(int(v))  # Should be 1 if set
-
-            super().process(model, incr_values, filters, extra_values, signal_only)
+            super().process(*self._load_payload(values))
         finally:
             client.delete(lock_key)
@@ -1291,6 +1291,34 @@ SENTRY_BUFFER_OPTIONS = {}
 SENTRY_CACHE = None
 SENTRY_CACHE_OPTIONS = {}
 
+# Number of grouping component trees each process keeps around, keyed by the
+# grouping config and the event interfaces grouping looks at. Events with
+# identical stack traces then skip running the grouping strategies. 0 disables
+# the cache.
+SENTRY_GROUPING_COMPONENT_CACHE_SIZE = 0
+
+# Approximate number of bytes of parsed minified sources and source maps each
+# process keeps around for the JavaScript processor, keyed by release, dist,
+# URL and checksum of the file. Events of the same release then skip parsing
+# the same, often multiple megabytes large, source maps over and over again.
+# 0 disables the cache.
+SENTRY_JS_PARSED_SOURCE_CACHE_SIZE = 0
+
+# Approximate number of bytes of release archive indexes (the central directory
+# and manifest of uploaded artifact bundles) each process keeps around. With
+# the cache enabled, artifacts are read from archives by seeking to them,
+# instead of loading whole archives into the cache. 0 disables the cache.
+SENTRY_RELEASE_ARCHIVE_INDEX_CACHE_SIZE = 0
+
+# Approximate number of bytes of ProGuard mapping files each process keeps
+# open for the Java processor, so that mappings are not opened and indexed
+# again for every event. 0 disables the cache.
+SENTRY_PROGUARD_MAPPER_CACHE_SIZE = 0
+
+# Number of remapped classes and frames each process keeps around, as the same
+# classes show up in many events of an app. 0 disables the cache.
+SENTRY_PROGUARD_REMAP_CACHE_SIZE = 0
+
 # Attachment blob cache backend
 SENTRY_ATTACHMENTS = "sentry.attachments.default.DefaultAttachmentCache"
 SENTRY_ATTACHMENTS_OPTIONS = {}
@@ -1338,10 +1366,27 @@ SENTRY_SNUBA = os.environ.get("SNUBA", "http://127.0.0.1:1218")
 SENTRY_SNUBA_TIMEOUT = 30
 SENTRY_SNUBA_CACHE_TTL_SECONDS = 60
 
+# Closed rollup buckets of Discover timeseries queries are cached for this
+# many seconds, so dashboards only query the buckets they haven't seen yet.
+# Buckets count as closed once they ended the given lag ago, which leaves
+# time for late events to arrive. A TTL of 0 disables the cache.
+SENTRY_DISCOVER_TIMESERIES_CACHE_TTL_SECONDS = 0
+SENTRY_DISCOVER_TIMESERIES_CACHE_CLOSED_LAG_SECONDS = 600
+
+# Identical Snuba queries that run at the same time are only sent once, the
+# other requests wait for the result of the first one. With a Redis cluster
+# configured, queries are also coalesced across processes.
+SENTRY_SNUBA_QUERY_COALESCING = False
+SENTRY_SNUBA_QUERY_COALESCING_REDIS_CLUSTER = None
+
 # Node storage backend
 SENTRY_NODESTORE = "sentry.nodestore.django.DjangoNodeStorage"
 SENTRY_NODESTORE_OPTIONS = {}
 
+# Approximate number of bytes of deduplicated interfaces (patchsets, see
+# ``deduplicate_interfaces`` in ``NodeStorage``) each process keeps in memory.
+SENTRY_NODESTORE_PATCHSET_CACHE_SIZE = 32 * 1024 * 1024
+
 # Tag storage backend
 SENTRY_TAGSTORE = os.environ.get("SENTRY_TAGSTORE", "sentry.tagstore.snuba.SnubaTagStorage")
 SENTRY_TAGSTORE_OPTIONS = {}
@@ -767,57 +767,62 @@ def _get_or_create_release_associated_models(jobs, projects):
 @metrics.wraps("save_event.tsdb_record_all_metrics")
 def _tsdb_record_all_metrics(jobs):
     """
-    Do all tsdb-related things for save_event in here s.t. we can potentially
-    put everything in a single redis pipeline someday.
+    Do all tsdb-related things for save_event in here s.t. the writes of all
+    jobs are sent together in a single write batch.
     """
 
     # XXX: validate whether anybody actually uses those metrics
 
-    for job in jobs:
-        incrs = []
-        frequencies = []
-        records = []
+    with tsdb.write_batch() as batch:
+        for job in jobs:
+            _tsdb_record_job_metrics(batch, job)
 
-        incrs.append((tsdb.models.project, job["project_id"]))
-        event = job["event"]
-        group = job["group"]
-        release = job["release"]
-        environment = job["environment"]
 
-        if group:
-            incrs.append((tsdb.models.group, group.id))
-            frequencies.append(
-                (tsdb.models.frequent_environments_by_group, {group.id: {environment.id: 1}})
-            )
+def _tsdb_record_job_metrics(batch, job):
+    incrs = []
+    frequencies = []
+    records = []
 
-            if release:
-                frequencies.append(
-                    (
-                        tsdb.models.frequent_releases_by_group,
-                        {group.id: {job["grouprelease"].id: 1}},
-                    )
-                )
+    incrs.append((tsdb.models.project, job["project_id"]))
+    event = job["event"]
+    group = job["group"]
+    release = job["release"]
+    environment = job["environment"]
+
+    if group:
+        incrs.append((tsdb.models.group, group.id))
+        frequencies.append(
+            (tsdb.models.frequent_environments_by_group, {group.id: {environment.id: 1}})
+        )
 
         if release:
-            incrs.append((tsdb.models.release, release.id))
+            frequencies.append(
+                (
+                    tsdb.models.frequent_releases_by_group,
+                    {group.id: {job["grouprelease"].id: 1}},
+                )
+            )
 
-        user = job["user"]
+    if release:
+        incrs.append((tsdb.models.release, release.id))
 
-        if user:
-            project_id = job["project_id"]
-            records.append((tsdb.models.users_affected_by_project, project_id, (user.tag_value,)))
+    user = job["user"]
 
-            if group:
-                records.append((tsdb.models.users_affected_by_group, group.id, (user.tag_value,)))
+    if user:
+        project_id = job["project_id"]
+        records.append((tsdb.models.users_affected_by_project, project_id, (user.tag_value,)))
 
-        if incrs:
-            tsdb.incr_multi(incrs, timestamp=event.datetime, environment_id=environment.id)
+        if group:
+            records.append((tsdb.models.users_affected_by_group, group.id, (user.tag_value,)))
 
-        if records:
-            tsdb.record_multi(records, timestamp=event.datetime, environment_id=environment.id)
+    if incrs:
+        batch.incr_multi(incrs, timestamp=event.datetime, environment_id=environment.id)
 
-        if frequencies:
-            tsdb.record_frequency_multi(frequencies, timestamp=event.datetime)
+    if records:
+        batch.record_multi(records, timestamp=event.datetime, environment_id=environment.id)
+
+    if frequencies:
+        batch.record_frequency_multi(frequencies, timestamp=event.datetime)
 
 
 @metrics.wraps("save_event.nodestore_save_many")
@@ -1716,6 +1721,16 @@ def _calculate_span_grouping(jobs, projects):
 
 @metrics.wraps("event_manager.save_transaction_events")
 def save_transaction_events(jobs, projects):
+    prepare_transaction_events(jobs, projects)
+    return store_transaction_events(jobs)
+
+
+def prepare_transaction_events(jobs, projects):
+    """
+    Looks up or creates everything the events of ``jobs`` refer to (releases,
+    users, environments). Nothing is stored for the events themselves, so
+    this can be retried.
+    """
     with metrics.timer("event_manager.save_transactions.collect_organization_ids"):
         organization_ids = {project.organization_id for project in projects.values()}
 
@@ -1751,6 +1766,13 @@ def save_transaction_events(jobs, projects):
     _materialize_metadata_many(jobs)
     _get_or_create_environment_many(jobs, projects)
     _get_or_create_release_associated_models(jobs, projects)
+
+
+def store_transaction_events(jobs):
+    """
+    Stores events prepared by ``prepare_transaction_events``: records their
+    metrics and outcomes, and writes them to nodestore and the eventstream.
+    """
     _tsdb_record_all_metrics(jobs)
     _materialize_event_metrics(jobs)
     _nodestore_save_many(jobs)
@@ -3,9 +3,11 @@ Eventstore compressor is responsible for pulling out repeating data across
 events such that they can be stored only once. For example SDK modules list, or
 debug_meta.
 
-This is not used in production yet, we are still collecting metrics there.
+Nodestore uses this when ``deduplicate_interfaces`` is enabled, see
+``NodeStorage.set_subkeys``.
 """
 
+import copy
 import hashlib
 
 from sentry.utils import json
@@ -13,6 +15,13 @@ from sentry.utils import json
 _INTERFACES = {}
 
 
+class MissingPatchsets(Exception):
+    """
+    Raised when a node references patchsets that are no longer stored. The
+    node can't be restored without them.
+    """
+
+
 def _deduplicate_interface(*keys):
     def inner(f):
         for k in keys:
@@ -51,15 +60,91 @@ class DebugMeta:
         return data
 
 
+@_deduplicate_interface("modules")
+class Modules:
+    """
+    The list of installed modules rarely changes between events of the same
+    release, so it is stored as a whole.
+    """
+
+    @staticmethod
+    def encode(data):
+        return {"modules": data}, None
+
+    @staticmethod
+    def decode(dedup, data):
+        return dedup.get("modules")
+
+
+@_deduplicate_interface("sdk")
+class Sdk:
+    _DEDUP_FIELDS = ("packages", "integrations")
+
+    @staticmethod
+    def encode(data):
+        dedup = {}
+
+        if data:
+            for name in Sdk._DEDUP_FIELDS:
+                if name in data:
+                    dedup[name] = data.pop(name)
+
+        return dedup, data
+
+    @staticmethod
+    def decode(dedup, data):
+        if data is not None:
+            data.update(dedup)
+
+        return data
+
+
+@_deduplicate_interface("contexts")
+class Contexts:
+    # Only contexts that describe the environment the SDK runs in. Others,
+    # such as ``trace``, are different for every event.
+    _DEDUP_CONTEXTS = ("os", "runtime", "browser")
+
+    @staticmethod
+    def encode(data):
+        dedup = {}
+
+        if data:
+            for name in Contexts._DEDUP_CONTEXTS:
+                if name in data:
+                    dedup[name] = data.pop(name)
+
+        return dedup, data
+
+    @staticmethod
+    def decode(dedup, data):
+        if data is not None:
+            data.update(dedup)
+
+        return data
+
+
 def deduplicate(data):
+    """
+    Returns a copy of ``data`` with repeating interfaces replaced by
+    references, plus a mapping of checksum to the deduplicated payloads.
+    ``data`` itself is not modified.
+    """
     patchsets = []
     extra_keys = {}
+    data = dict(data)
 
     for key, interface in _INTERFACES.items():
         if key not in data:
             continue
 
-        to_deduplicate, to_inline = interface.encode(data.pop(key))
+        value = data.pop(key)
+        to_deduplicate, to_inline = interface.encode(copy.deepcopy(value))
+        if not any(to_deduplicate.values()):
+            # Nothing worth sharing, a reference would only cost a lookup.
+            data[key] = value
+            continue
+
         to_deduplicate_serialized = json.dumps(to_deduplicate, sort_keys=True).encode("utf8")
         checksum = hashlib.md5(to_deduplicate_serialized).hexdigest()
         extra_keys[checksum] = to_deduplicate
@@ -80,10 +165,13 @@ def assemble(data, get_extra_keys):
         checksums.append(checksum)
 
     deduplicated_interfaces = get_extra_keys(checksums)
+    missing = [checksum for checksum in checksums if checksum not in deduplicated_interfaces]
+    if missing:
+        raise MissingPatchsets(missing)
 
     for key, checksum, inlined in data["__nodestore_patchsets"]:
         deduplicated = deduplicated_interfaces[checksum]
-        data[key] = _INTERFACES[key].decode(deduplicated, inlined)
+        data[key] = _INTERFACES[key].decode(copy.deepcopy(deduplicated), inlined)
 
     del data["__nodestore_patchsets"]
     return data
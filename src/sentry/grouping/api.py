@@ -1,4 +1,7 @@
 import re
+import threading
+
+from django.conf import settings
 
 from sentry import options
 from sentry.grouping.component import GroupingComponent
@@ -19,6 +22,9 @@ from sentry.grouping.variants import (
     FallbackVariant,
     SaltedComponentVariant,
 )
+from sentry.utils import json, metrics
+from sentry.utils.datastructures import LRUCache
+from sentry.utils.hashlib import md5_text
 from sentry.utils.safe import get_path
 
 HASH_RE = re.compile(r"^[0-9a-f]{32}$")
@@ -43,6 +49,23 @@ _synthetic_exception_type_re = re.compile(
 )
 
 
+# Interface keys that no grouping strategy looks at. They are left out of
+# component cache keys as they often differ between otherwise identical
+# events (e.g. local variables).
+_COMPONENT_CACHE_IGNORED_KEYS = frozenset(["vars", "pre_context", "post_context", "registers"])
+
+# Grouping component trees by ``get_grouping_components_cache_key``, see
+# ``SENTRY_GROUPING_COMPONENT_CACHE_SIZE``.
+_component_cache = LRUCache(0)
+_component_cache_lock = threading.Lock()
+
+# Fingerprinting rules by the hash of their config string. Rules compile
+# themselves on first use, so keeping them around per process saves parsing
+# and compiling them for every event.
+_fingerprinting_rules_cache = LRUCache(100)
+_fingerprinting_rules_cache_lock = threading.Lock()
+
+
 class GroupingConfigNotFound(LookupError):
     pass
 
@@ -179,18 +202,25 @@ def get_fingerprinting_config_for_project(project):
         return FingerprintingRules([])
 
     from sentry.utils.cache import cache
-    from sentry.utils.hashlib import md5_text
 
     cache_key = "fingerprinting-rules:" + md5_text(rules).hexdigest()
+    with _fingerprinting_rules_cache_lock:
+        rv = _fingerprinting_rules_cache.get(cache_key)
+    if rv is not None:
+        return rv
+
     rv = cache.get(cache_key)
     if rv is not None:
-        return FingerprintingRules.from_json(rv)
+        rv = FingerprintingRules.from_json(rv)
+    else:
+        try:
+            rv = FingerprintingRules.from_config_string(rules)
+        except InvalidFingerprintingConfig:
+            rv = FingerprintingRules([])
+        cache.set(cache_key, rv.to_json())
 
-    try:
-        rv = FingerprintingRules.from_config_string(rules)
-    except InvalidFingerprintingConfig:
-        rv = FingerprintingRules([])
-    cache.set(cache_key, rv.to_json())
+    with _fingerprinting_rules_cache_lock:
+        _fingerprinting_rules_cache[cache_key] = rv
     return rv
 
 
@@ -249,6 +279,59 @@ def _get_calculated_grouping_variants_for_event(event, context):
     return rv
 
 
+def _strip_ignored_keys(value):
+    if isinstance(value, dict):
+        return {
+            k: _strip_ignored_keys(v)
+            for k, v in value.items()
+            if k not in _COMPONENT_CACHE_IGNORED_KEYS
+        }
+    if isinstance(value, list):
+        return [_strip_ignored_keys(v) for v in value]
+    return value
+
+
+def get_grouping_components_cache_key(event, config):
+    """Returns a digest of everything the strategies of ``config`` look at
+    when grouping ``event``: the config itself with its enhancements, the
+    platform and the normalized interfaces the strategies are registered for.
+
+    Fingerprints are not part of the key, they are applied to the components
+    afterwards.
+    """
+    h = md5_text(config.id, "\x00", config.enhancements_config, "\x00", event.platform or "")
+    for interface in sorted({strategy.interface for strategy in config.strategies.values()}):
+        value = event.interfaces.get(interface)
+        if value is None:
+            continue
+        h.update(b"\x00" + interface.encode("utf-8") + b"\x00")
+        h.update(json.dumps(_strip_ignored_keys(value.to_json())).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _get_grouping_components_for_event(event, context):
+    cache_size = settings.SENTRY_GROUPING_COMPONENT_CACHE_SIZE
+    if not cache_size:
+        return _get_calculated_grouping_variants_for_event(event, context)
+
+    cache_key = get_grouping_components_cache_key(event, context.config)
+    with _component_cache_lock:
+        _component_cache.max_size = cache_size
+        components = _component_cache.get(cache_key)
+
+    if components is None:
+        metrics.incr("grouping.component_cache.miss")
+        components = _get_calculated_grouping_variants_for_event(event, context)
+        with _component_cache_lock:
+            _component_cache[cache_key] = components
+    else:
+        metrics.incr("grouping.component_cache.hit")
+
+    # Cached trees are shared between events. Only the top-level components
+    # are updated below, so copying those is enough.
+    return {variant: component.shallow_copy() for variant, component in components.items()}
+
+
 def get_grouping_variants_for_event(event, config=None):
     """Returns a dict of all grouping variants for this event."""
     # If a checksum is set the only variant that comes back from this
@@ -283,7 +366,7 @@ def get_grouping_variants_for_event(event, config=None):
 
     # At this point we need to calculate the default event values.  If the
     # fingerprint is salted we will wrap it.
-    components = _get_calculated_grouping_variants_for_event(event, context)
+    components = _get_grouping_components_for_event(event, context)
 
     # If no defaults are referenced we produce a single completely custom
     # fingerprint and mark all other variants as non-contributing
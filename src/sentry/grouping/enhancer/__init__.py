@@ -11,6 +11,7 @@ from sentry.grouping.component import GroupingComponent
 from sentry.utils.strings import unescape_string
 
 from .actions import Action, FlagAction, VarAction
+from .compiler import RuleIndex
 from .exceptions import InvalidEnhancerConfig
 from .matchers import (
     CalleeMatch,
@@ -116,6 +117,11 @@ class Enhancements:
         self._modifier_rules = [rule for rule in self.iter_rules() if rule.is_modifier]
         self._updater_rules = [rule for rule in self.iter_rules() if rule.is_updater]
 
+        # Built on first use, as instances are loaded for every event but
+        # not all of them get to look at stack traces.
+        self._modifier_index = None
+        self._updater_index = None
+
     def apply_modifications_to_frame(self, frames, platform, exception_data):
         """This applies the frame modifications to the frames itself.  This
         does not affect grouping.
@@ -125,9 +131,13 @@ class Enhancements:
 
         match_frames = [create_match_frame(frame, platform) for frame in frames]
 
-        for rule in self._modifier_rules:
+        if self._modifier_index is None:
+            self._modifier_index = RuleIndex(self._modifier_rules)
+        candidates = self._modifier_index.get_candidate_frames(match_frames)
+
+        for rule, frame_indexes in zip(self._modifier_rules, candidates):
             for idx, action in rule.get_matching_frame_actions(
-                match_frames, platform, exception_data, cache
+                match_frames, platform, exception_data, cache, frame_indexes
             ):
                 action.apply_modifications_to_frame(frames, match_frames, idx, rule=rule)
 
@@ -137,12 +147,16 @@ class Enhancements:
 
         match_frames = [create_match_frame(frame, platform) for frame in frames]
 
+        if self._updater_index is None:
+            self._updater_index = RuleIndex(self._updater_rules)
+        candidates = self._updater_index.get_candidate_frames(match_frames)
+
         stacktrace_state = StacktraceState()
         # Apply direct frame actions and update the stack state alongside
-        for rule in self._updater_rules:
+        for rule, frame_indexes in zip(self._updater_rules, candidates):
 
             for idx, action in rule.get_matching_frame_actions(
-                match_frames, platform, exception_data, cache
+                match_frames, platform, exception_data, cache, frame_indexes
             ):
                 action.update_frame_components_contributions(components, frames, idx, rule=rule)
                 action.modify_stacktrace_state(stacktrace_state, rule)
@@ -312,11 +326,16 @@ class Rule:
             matchers[matcher.key] = matcher.pattern
         return {"match": matchers, "actions": [str(x) for x in self.actions]}
 
-    def get_matching_frame_actions(self, frames, platform, exception_data=None, cache=None):
+    def get_matching_frame_actions(
+        self, frames, platform, exception_data=None, cache=None, frame_indexes=None
+    ):
         """Given a frame returns all the matching actions based on this rule.
         If the rule does not match `None` is returned.
+
+        If `frame_indexes` is given, only the frames at these indexes are
+        considered (see `RuleIndex`).
         """
-        if not self.matchers:
+        if not self.matchers or frame_indexes == []:
             return []
 
         # 1 - Check if exception matchers match
@@ -326,8 +345,11 @@ class Rule:
 
         rv = []
 
+        if frame_indexes is None:
+            frame_indexes = range(len(frames))
+
         # 2 - Check if frame matchers match
-        for idx, frame in enumerate(frames):
+        for idx in frame_indexes:
             if all(
                 m.matches_frame(frames, idx, platform, exception_data, cache)
                 for m in self._other_matchers
@@ -0,0 +1,165 @@
+"""
+Indexes enhancement rules by their frame matchers.
+
+Without an index every rule is checked against every frame. ``RuleIndex``
+picks one positive matcher of each rule as its anchor, a condition a frame
+has to fulfill for the rule to possibly match, and buckets the rules by it:
+
+* exact values for ``function`` and ``module`` patterns without wildcards,
+* literal prefixes for other ``function``, ``module``, ``package`` and
+  ``path`` patterns, grouped by prefix length so that every frame value is
+  looked up once per distinct length,
+* the families of ``family`` matchers.
+
+A single pass over the frames then yields the frames each rule has to be
+checked against. Rules without a usable anchor are checked against all
+frames. Anchors are never ``app`` or ``category`` matchers, as modifier rules
+change those values while rules are applied.
+
+The index only narrows down candidates, the rules themselves still decide
+whether they match, so glob semantics are entirely left to the matchers.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from .matchers import FamilyMatch, FunctionMatch, ModuleMatch, PathLikeMatch
+
+GLOB_CHARS = frozenset(b"*?[{\\")
+
+# Higher is more selective. Literal prefixes rank by their length.
+ANCHOR_LITERAL = 2
+ANCHOR_PREFIX = 1
+ANCHOR_FAMILY = 0
+
+
+def get_literal_prefix(pattern: bytes) -> bytes:
+    for i, c in enumerate(pattern):
+        if c in GLOB_CHARS:
+            return pattern[:i]
+    return pattern
+
+
+def normalize_path(value: bytes) -> bytes:
+    return value.replace(b"\\", b"/")
+
+
+def get_path_candidates(value: bytes) -> Sequence[bytes]:
+    # Mirrors ``path_like_match``, which also tries the value with a leading
+    # slash.
+    normalized = normalize_path(value)
+    if value.startswith(b"/"):
+        return (normalized,)
+    return (normalized, b"/" + normalized)
+
+
+def get_anchor(rule):
+    """
+    Returns the most selective anchor of a rule as a tuple of
+    ``(kind, field, value, score)``, or ``None``.
+    """
+    best = None
+    for matcher in rule.matchers:
+        if getattr(matcher, "negated", True):
+            continue
+
+        if isinstance(matcher, FamilyMatch):
+            if b"all" in matcher._flags:
+                continue
+            anchor = ("family", "family", matcher._flags, (ANCHOR_FAMILY, 0))
+        elif isinstance(matcher, (FunctionMatch, ModuleMatch)):
+            pattern = matcher._encoded_pattern
+            prefix = get_literal_prefix(pattern)
+            if prefix == pattern:
+                anchor = ("literal", matcher.key, pattern, (ANCHOR_LITERAL, len(pattern)))
+            elif prefix:
+                anchor = ("prefix", matcher.key, prefix, (ANCHOR_PREFIX, len(prefix)))
+            else:
+                continue
+        elif isinstance(matcher, PathLikeMatch):
+            # Paths are normalized before matching, so even patterns without
+            # wildcards are only used as prefixes.
+            prefix = get_literal_prefix(matcher._encoded_pattern)
+            if not prefix:
+                continue
+            anchor = ("prefix", matcher.field, prefix, (ANCHOR_PREFIX, len(prefix)))
+        else:
+            continue
+
+        if best is None or anchor[3] > best[3]:
+            best = anchor
+
+    return best
+
+
+class RuleIndex:
+    """
+    Finds the frames that each of ``rules`` could match. Build it once per
+    rule list and call ``get_candidate_frames`` once per stack trace.
+    """
+
+    def __init__(self, rules):
+        self.size = len(rules)
+        self.unindexed: List[int] = []
+        # field -> value -> rule positions
+        self.literals: Dict[str, Dict[bytes, List[int]]] = defaultdict(lambda: defaultdict(list))
+        # field -> prefix length -> prefix -> rule positions
+        self.prefixes: Dict[str, Dict[int, Dict[bytes, List[int]]]] = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(list))
+        )
+        # family -> rule positions
+        self.families: Dict[bytes, List[int]] = defaultdict(list)
+
+        for position, rule in enumerate(rules):
+            anchor = get_anchor(rule)
+            if anchor is None:
+                self.unindexed.append(position)
+                continue
+
+            kind, field, value, _ = anchor
+            if kind == "literal":
+                self.literals[field][value].append(position)
+            elif kind == "prefix":
+                self.prefixes[field][len(value)][value].append(position)
+            else:
+                for family in value:
+                    self.families[family].append(position)
+
+    def get_candidate_frames(self, match_frames) -> List[Optional[List[int]]]:
+        """
+        Returns, for every rule, the ascending indexes of the frames it has to
+        be checked against, or ``None`` if it has to be checked against all
+        frames.
+        """
+        candidates: List[Optional[List[int]]] = [[] for _ in range(self.size)]
+
+        for idx, frame in enumerate(match_frames):
+            positions = set()
+
+            for field, values in self.literals.items():
+                value = frame[field]
+                if value is not None:
+                    positions.update(values.get(value, ()))
+
+            for field, by_length in self.prefixes.items():
+                value = frame[field]
+                if value is None:
+                    continue
+                if field in ("path", "package"):
+                    frame_values = get_path_candidates(value)
+                else:
+                    frame_values = (value,)
+                for value in frame_values:
+                    for length, prefixes in by_length.items():
+                        if length <= len(value):
+                            positions.update(prefixes.get(value[:length], ()))
+
+            positions.update(self.families.get(frame["family"], ()))
+
+            for position in positions:
+                candidates[position].append(idx)
+
+        for position in self.unindexed:
+            candidates[position] = None
+
+        return candidates
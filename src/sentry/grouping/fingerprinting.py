@@ -11,6 +11,8 @@ from sentry.utils.strings import unescape_string
 
 VERSION = 1
 
+GLOB_CHARS = frozenset("*?[{\\")
+
 
 # Grammar is defined in EBNF syntax.
 fingerprinting_grammar = Grammar(
@@ -57,6 +59,22 @@ class InvalidFingerprintingConfig(Exception):
     pass
 
 
+def get_literal_prefix(pattern):
+    for i, c in enumerate(pattern):
+        if c in GLOB_CHARS:
+            return pattern[:i]
+    return pattern
+
+
+def get_path_candidates(value):
+    # Mirrors ``Match._positive_path_match``, which also tries the value with
+    # a leading slash.
+    normalized = value.replace("\\", "/")
+    if value.startswith("/"):
+        return (normalized,)
+    return (normalized, "/" + normalized)
+
+
 class EventAccess:
     def __init__(self, event):
         self.event = event
@@ -66,6 +84,7 @@ class EventAccess:
         self._log_info = None
         self._toplevel = None
         self._tags = None
+        self._prefixes = {}
 
     def get_messages(self):
         if self._messages is None:
@@ -161,6 +180,34 @@ class EventAccess:
     def get_values(self, match_group):
         return getattr(self, "get_" + match_group)()
 
+    def has_prefix(self, match_group, fields, path_like, prefix):
+        """
+        Checks whether any of ``fields`` of the values of ``match_group``
+        starts with the lowercase ``prefix``, ignoring case. The prefixes of
+        each length are collected once per event.
+        """
+        key = (match_group, fields, path_like, len(prefix))
+        if key not in self._prefixes:
+            self._prefixes[key] = self._get_prefixes(match_group, fields, path_like, len(prefix))
+        prefixes = self._prefixes[key]
+        return prefixes is None or prefix in prefixes
+
+    def _get_prefixes(self, match_group, fields, path_like, length):
+        rv = set()
+        for values in self.get_values(match_group):
+            for field in fields:
+                value = values.get(field)
+                if not isinstance(value, str):
+                    continue
+                for candidate in get_path_candidates(value) if path_like else (value,):
+                    candidate = candidate[:length]
+                    # Case insensitive matching folds some non-ASCII
+                    # characters to ASCII ones, so don't rule anything out.
+                    if not candidate.isascii():
+                        return None
+                    rv.add(candidate.lower())
+        return rv
+
 
 class FingerprintingRules:
     def __init__(self, rules, changelog=None, version=None):
@@ -174,6 +221,12 @@ class FingerprintingRules:
         return iter(self.rules)
 
     def get_fingerprint_values_for_event(self, event):
+        """
+        Returns the fingerprint of the first rule matching ``event``.
+
+        Rules that have an anchor (see ``Rule.get_anchor``) are only tested if
+        the event has a value starting with the literal part of the anchor.
+        """
         if not self.rules:
             return
         access = EventAccess(event)
@@ -335,6 +388,29 @@ class Match:
             negated = False
         return cls(key, obj[1], negated)
 
+    def get_anchor(self):
+        """
+        Returns ``(match_group, fields, path_like, prefix)`` if this matcher
+        can only match values where one of ``fields`` starts with the
+        lowercase literal ``prefix``, or ``None``.
+        """
+        if self.negated or self.key in ("family", "app"):
+            return None
+
+        prefix = get_literal_prefix(self.pattern)
+        if not prefix or not prefix.isascii():
+            return None
+
+        if self.key == "path":
+            fields, path_like = ("abs_path", "filename"), True
+        elif self.key == "package":
+            fields, path_like = ("package",), True
+        elif self.key == "message":
+            fields, path_like = ("message", "value"), False
+        else:
+            fields, path_like = (self.key,), False
+        return self.match_group, fields, path_like, prefix.lower()
+
     @property
     def text(self):
         return '{}{}:"{}"'.format(
@@ -349,13 +425,33 @@ class Rule:
         self.matchers = matchers
         self.fingerprint = fingerprint
         self.attributes = attributes
-
-    def get_fingerprint_values_for_event_access(self, access):
+        self._by_match_group = None
+        self._anchor = None
+
+    def get_anchor(self):
+        """
+        Returns the anchor of the matcher with the longest literal prefix.
+        Rules are only tested against events that have a value starting with
+        that prefix.
+        """
+        anchors = [x.get_anchor() for x in self.matchers]
+        return max((x for x in anchors if x is not None), key=lambda x: len(x[3]), default=None)
+
+    def _compile(self):
         by_match_group = {}
         for matcher in self.matchers:
             by_match_group.setdefault(matcher.match_group, []).append(matcher)
+        self._anchor = self.get_anchor()
+        self._by_match_group = by_match_group
+
+    def get_fingerprint_values_for_event_access(self, access):
+        if self._by_match_group is None:
+            self._compile()
+
+        if self._anchor is not None and not access.has_prefix(*self._anchor):
+            return
 
-        for match_group, matchers in by_match_group.items():
+        for match_group, matchers in self._by_match_group.items():
             for values in access.get_values(match_group):
                 if all(x.matches(values) for x in matchers):
                     break
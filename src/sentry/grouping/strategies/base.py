@@ -1,4 +1,5 @@
 import inspect
+import threading
 from typing import (
     TYPE_CHECKING,
     Any,
@@ -21,6 +22,7 @@ from sentry.eventstore.models import Event
 from sentry.grouping.component import GroupingComponent
 from sentry.grouping.enhancer import Enhancements
 from sentry.interfaces.base import Interface
+from sentry.utils.datastructures import LRUCache
 
 STRATEGIES: Dict[str, "Strategy[Any]"] = {}
 
@@ -37,6 +39,12 @@ ContextDict = Dict[str, ContextValue]
 
 DEFAULT_GROUPING_ENHANCEMENTS_BASE = "common:2019-03-23"
 
+# Enhancements by their serialized form. They compile their rule indexes on
+# first use, so sharing them between events saves rebuilding the indexes for
+# every event.
+_enhancements_cache = LRUCache(100)
+_enhancements_cache_lock = threading.Lock()
+
 ReturnedVariants = Dict[str, GroupingComponent]
 ConcreteInterface = TypeVar("ConcreteInterface", bound=Interface, contravariant=True)
 
@@ -285,6 +293,16 @@ class Strategy(Generic[ConcreteInterface]):
         return rv
 
 
+def _load_enhancements(enhancements: str) -> Enhancements:
+    with _enhancements_cache_lock:
+        rv = _enhancements_cache.get(enhancements)
+    if rv is None:
+        rv = Enhancements.loads(enhancements)
+        with _enhancements_cache_lock:
+            _enhancements_cache[enhancements] = rv
+    return rv
+
+
 class StrategyConfiguration:
     id: Optional[str] = None
     base: Optional[Type["StrategyConfiguration"]] = None
@@ -298,10 +316,12 @@ class StrategyConfiguration:
     enhancements_base: Optional[str] = DEFAULT_GROUPING_ENHANCEMENTS_BASE
 
     def __init__(self, enhancements: Optional[str] = None, **extra: Any):
+        # The serialized enhancements, which identify them in cache keys.
+        self.enhancements_config = enhancements or ""
         if enhancements is None:
             enhancements_instance = Enhancements([])
         else:
-            enhancements_instance = Enhancements.loads(enhancements)
+            enhancements_instance = _load_enhancements(enhancements)
         self.enhancements = enhancements_instance
 
     def __repr__(self) -> str:
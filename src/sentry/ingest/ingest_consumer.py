@@ -12,6 +12,7 @@ from typing import (
     NamedTuple,
     Optional,
     Sequence,
+    Set,
     Tuple,
     TypeVar,
     Union,
@@ -30,8 +31,14 @@ from sentry.ingest.types import ConsumerType
 from sentry.ingest.userreport import Conflict, save_userreport
 from sentry.killswitches import killswitch_matches_context
 from sentry.models import Project
+from sentry.nodestore.base import clear_local_cache
 from sentry.signals import event_accepted
-from sentry.tasks.store import preprocess_event
+from sentry.tasks.store import (
+    EventBatchNotSaved,
+    preprocess_event,
+    save_event_batch,
+    should_save_in_batch,
+)
 from sentry.utils import json, metrics
 from sentry.utils.batching_kafka_consumer import AbstractBatchWorker
 from sentry.utils.cache import cache_key_for_event
@@ -56,8 +63,87 @@ class AsyncResult(NamedTuple):  # TODO: Use Generic[T] with 3.7+
 Message = Any
 
 
+class EventSaveBatch:
+    """
+    Collects the events of a consumer batch that are saved together instead of
+    being sent through ``preprocess_event``, see
+    ``sentry.tasks.store.save_event_batch``.
+    """
+
+    def __init__(self) -> None:
+        self.events: MutableSequence[Mapping[str, Any]] = []
+        self.callbacks: MutableSequence[Callable[[], None]] = []
+        self.cache_keys: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def add(
+        self,
+        cache_key: str,
+        data: Any,
+        start_time: float,
+        event_id: str,
+        callback: Callable[[], None],
+    ) -> None:
+        # The deduplication key is only set once the batch has been saved, so
+        # duplicates within one batch have to be caught here.
+        if cache_key in self.cache_keys:
+            return
+        self.cache_keys.add(cache_key)
+        self.events.append(
+            {"cache_key": cache_key, "data": data, "start_time": start_time, "event_id": event_id}
+        )
+        self.callbacks.append(callback)
+
+    def save(self, projects: Mapping[int, Project]) -> None:
+        """
+        Saves the events and runs the callbacks of the ones that were saved.
+        If the batch fails before anything was stored, events are saved one at
+        a time, so that a single bad event doesn't fail the others. If it fails
+        later on, some events may have been counted or stored already, and the
+        batch is dropped instead of saving events twice.
+        """
+        if not self.events:
+            return
+
+        try:
+            save_event_batch(self.events, projects)
+        except EventBatchNotSaved:
+            logger.exception("ingest_consumer.save_event_batch.failed")
+            metrics.incr("ingest_consumer.save_event_batch.failed", tags={"retried": "true"})
+        except Exception:
+            logger.exception("ingest_consumer.save_event_batch.failed")
+            metrics.incr("ingest_consumer.save_event_batch.failed", tags={"retried": "false"})
+            return
+        else:
+            for callback in self.callbacks:
+                callback()
+            return
+
+        for event, callback in zip(self.events, self.callbacks):
+            # The failed batch may have modified the data in place, the
+            # processing store has it as it was received.
+            data = event_processing_store.get(event["cache_key"])
+            if data is not None:
+                event = dict(event, data=data)
+
+            try:
+                save_event_batch([event], projects)
+            except Exception:
+                logger.exception(
+                    "ingest_consumer.save_event.failed", extra={"event_id": event["event_id"]}
+                )
+                metrics.incr("ingest_consumer.save_event.failed")
+            else:
+                callback()
+
+
 class IngestConsumerWorker(AbstractBatchWorker):
-    def __init__(self, process_event_executor: Optional[ThreadPoolExecutor] = None) -> None:
+    def __init__(
+        self, process_event_executor: Optional[ThreadPoolExecutor] = None, batch_save: bool = False
+    ) -> None:
+        self.__batch_save = batch_save
         self.__process_event_executor = process_event_executor
         if self.__process_event_executor is None:
             self.__process_event = process_event
@@ -72,8 +158,14 @@ class IngestConsumerWorker(AbstractBatchWorker):
 
     def flush_batch(self, batch):
         mark_scope_as_unsafe()
-        with metrics.timer("ingest_consumer.flush_batch"):
-            return self._flush_batch(batch)
+        try:
+            with metrics.timer("ingest_consumer.flush_batch"):
+                return self._flush_batch(batch)
+        finally:
+            # Nodes are cached until the end of a request or task, the
+            # consumer has neither. Without this, nodes written while saving
+            # a batch would stay cached for as long as the consumer runs.
+            clear_local_cache()
 
     def _flush_batch(self, batch: Sequence[Message]):
         attachment_chunks = []
@@ -96,13 +188,18 @@ class IngestConsumerWorker(AbstractBatchWorker):
 
         projects_to_fetch = set()
 
+        # Events that don't need processing are saved together once all
+        # messages have been loaded, rather than one save_event task each.
+        save_batch = EventSaveBatch() if self.__batch_save else None
+        process_event_func = functools.partial(self.__process_event, save_batch=save_batch)
+
         with metrics.timer("ingest_consumer.prepare_messages"):
             for message in batch:
                 message_type = message["type"]
                 projects_to_fetch.add(message["project_id"])
 
                 if message_type == "event":
-                    other_messages.append((self.__process_event, message))
+                    other_messages.append((process_event_func, message))
                 elif message_type == "attachment_chunk":
                     attachment_chunks.append(message)
                 elif message_type == "attachment":
@@ -143,6 +240,10 @@ class IngestConsumerWorker(AbstractBatchWorker):
                 for future in as_completed(results.keys()):
                     results[future].callback(future)
 
+                if save_batch:
+                    with metrics.timer("ingest_consumer.save_event_batch"):
+                        save_batch.save(projects)
+
                 metrics.timing(
                     "ingest_consumer.process_other_messages_batch.normalized",
                     (time.monotonic() - other_messages_flush_start) / len(other_messages),
@@ -169,8 +270,12 @@ def trace_func(**span_kwargs):
 
 
 @metrics.wraps("ingest_consumer.process_event")
-def _do_process_event(message: Message, projects: Mapping[int, Project]) -> None:
-    result = _load_event(message, projects)
+def _do_process_event(
+    message: Message,
+    projects: Mapping[int, Project],
+    save_batch: Optional[EventSaveBatch] = None,
+) -> None:
+    result = _load_event(message, projects, save_batch)
     if result is None:
         return
 
@@ -179,7 +284,9 @@ def _do_process_event(message: Message, projects: Mapping[int, Project]) -> None
 
 
 def _load_event(
-    message: Message, projects: Mapping[int, Project]
+    message: Message,
+    projects: Mapping[int, Project],
+    save_batch: Optional[EventSaveBatch] = None,
 ) -> Optional[Tuple[Any, Callable[[str], None]]]:
     """
     Perform some initial filtering and deserialize the message payload. If the
@@ -187,6 +294,9 @@ def _load_event(
     function that can be called with the event's storage key to resume
     processing after the event has been persisted and is available to be read by
     other processing components.
+
+    If ``save_batch`` is given, events that don't need processing are added
+    to it instead of being passed to ``preprocess_event``.
     """
     payload = message["payload"]
     start_time = float(message["start_time"])
@@ -279,6 +389,19 @@ def _load_event(
                     cache_key, attachments=attachment_objects, timeout=CACHE_TIMEOUT
                 )
 
+        def finish() -> None:
+            # remember for an 1 hour that we saved this event (deduplication protection)
+            cache.set(deduplication_key, "", CACHE_TIMEOUT)
+
+            # emit event_accepted once everything is done
+            event_accepted.send_robust(
+                ip=remote_addr, data=data, project=project, sender=process_event
+            )
+
+        if save_batch is not None and should_save_in_batch(data):
+            save_batch.add(cache_key, data, start_time, event_id, finish)
+            return
+
         # Preprocess this event, which spawns either process_event or
         # save_event. Pass data explicitly to avoid fetching it again from the
         # cache.
@@ -291,11 +414,7 @@ def _load_event(
                 project=project,
             )
 
-        # remember for an 1 hour that we saved this event (deduplication protection)
-        cache.set(deduplication_key, "", CACHE_TIMEOUT)
-
-        # emit event_accepted once everything is done
-        event_accepted.send_robust(ip=remote_addr, data=data, project=project, sender=process_event)
+        finish()
 
     return data, dispatch_task
 
@@ -305,14 +424,21 @@ def _store_event(data) -> str:
 
 
 @trace_func(name="ingest_consumer.process_event")
-def process_event(message: Message, projects: Mapping[int, Project]) -> None:
-    return _do_process_event(message, projects)
+def process_event(
+    message: Message,
+    projects: Mapping[int, Project],
+    save_batch: Optional[EventSaveBatch] = None,
+) -> None:
+    return _do_process_event(message, projects, save_batch)
 
 
 def process_event_async(
-    executor: ThreadPoolExecutor, message: Message, projects: Mapping[int, Project]
+    executor: ThreadPoolExecutor,
+    message: Message,
+    projects: Mapping[int, Project],
+    save_batch: Optional[EventSaveBatch] = None,
 ) -> Optional["AsyncResult[str]"]:
-    result = _load_event(message, projects)
+    result = _load_event(message, projects, save_batch)
     if result is None:
         return None
 
@@ -411,14 +537,23 @@ def process_userreport(message, projects) -> None:
 
 
 def get_ingest_consumer(
-    consumer_types, once=False, executor: Optional[ThreadPoolExecutor] = None, **options
+    consumer_types,
+    once=False,
+    executor: Optional[ThreadPoolExecutor] = None,
+    batch_save: bool = False,
+    **options,
 ):
     """
     Handles events coming via a kafka queue.
 
     The events should have already been processed (normalized... ) upstream (by Relay).
+
+    With ``batch_save``, events that don't need processing are saved by the
+    consumer itself, one batched save per consumed batch.
     """
     topic_names = {ConsumerType.get_topic_name(consumer_type) for consumer_type in consumer_types}
     return create_batching_kafka_consumer(
-        topic_names=topic_names, worker=IngestConsumerWorker(executor), **options
+        topic_names=topic_names,
+        worker=IngestConsumerWorker(executor, batch_save=batch_save),
+        **options,
     )
@@ -0,0 +1,91 @@
+import os
+import threading
+
+from django.conf import settings
+from symbolic import ProguardMapper
+
+from sentry.utils import metrics
+from sentry.utils.datastructures import LRUCache
+
+__all__ = ["MappingView", "open_mapping_view"]
+
+# Opened mapping files shared by all processors of a process, see
+# ``SENTRY_PROGUARD_MAPPER_CACHE_SIZE``. Mappers are memory mapped, so evicted
+# views stay usable for as long as processors hold on to them.
+_mapper_cache = LRUCache(0, sizeof=lambda view: view.size)
+_mapper_cache_lock = threading.Lock()
+
+# Results of ``remap_class`` and ``remap_frame`` by mapping file and
+# arguments, see ``SENTRY_PROGUARD_REMAP_CACHE_SIZE``.
+_remap_cache = LRUCache(0)
+_remap_cache_lock = threading.Lock()
+
+_missing = object()
+
+
+class MappingView:
+    """
+    Wraps a ``ProguardMapper``, memoizing the results of remapping classes
+    and frames. Those only depend on the mapping file, so they are shared
+    between events.
+    """
+
+    def __init__(self, cache_key, mapper, size=0):
+        self.cache_key = cache_key
+        self.mapper = mapper
+        self.size = size
+
+    @property
+    def has_line_info(self):
+        return self.mapper.has_line_info
+
+    def _remap(self, key, remap):
+        cache_size = settings.SENTRY_PROGUARD_REMAP_CACHE_SIZE
+        if not cache_size:
+            return remap()
+
+        key = (self.cache_key,) + key
+        with _remap_cache_lock:
+            _remap_cache.max_size = cache_size
+            rv = _remap_cache.get(key, _missing)
+
+        if rv is _missing:
+            rv = remap()
+            with _remap_cache_lock:
+                _remap_cache[key] = rv
+        return rv
+
+    def remap_class(self, klass):
+        return self._remap(("class", klass), lambda: self.mapper.remap_class(klass))
+
+    def remap_frame(self, klass, method, line):
+        return self._remap(
+            ("frame", klass, method, line),
+            lambda: tuple(self.mapper.remap_frame(klass, method, line)),
+        )
+
+
+def open_mapping_view(debug_id, dif_path):
+    """
+    Returns a ``MappingView`` of the mapping file at ``dif_path``, reusing the
+    one opened for an earlier event if possible. Debug files are cached per
+    project, so projects only get to see their own mapping files.
+    """
+    cache_key = (debug_id, dif_path)
+    cache_size = settings.SENTRY_PROGUARD_MAPPER_CACHE_SIZE
+    if not cache_size:
+        return MappingView(cache_key, ProguardMapper.open(dif_path))
+
+    with _mapper_cache_lock:
+        _mapper_cache.max_size = cache_size
+        view = _mapper_cache.get(cache_key)
+
+    if view is not None:
+        metrics.incr("proguard.mapper_cache.hit")
+        return view
+
+    metrics.incr("proguard.mapper_cache.miss")
+    view = MappingView(cache_key, ProguardMapper.open(dif_path), os.path.getsize(dif_path))
+    with _mapper_cache_lock:
+        _mapper_cache[cache_key] = view
+    return view
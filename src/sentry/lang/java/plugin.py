@@ -1,5 +1,4 @@
-from symbolic import ProguardMapper
-
+from sentry.lang.java.cache import open_mapping_view
 from sentry.models import EventError, ProjectDebugFile
 from sentry.plugins.base.v2 import Plugin2
 from sentry.reprocessing import report_processing_issue
@@ -42,7 +41,7 @@ class JavaStacktraceProcessor(StacktraceProcessor):
             if dif_path is None:
                 error_type = EventError.PROGUARD_MISSING_MAPPING
             else:
-                view = ProguardMapper.open(dif_path)
+                view = open_mapping_view(debug_id, dif_path)
                 if not view.has_line_info:
                     error_type = EventError.PROGUARD_MISSING_LINENO
                 else:
@@ -1,8 +1,21 @@
+import threading
+from hashlib import sha1
+
+from django.conf import settings
 from symbolic import SourceView
 
+from sentry.utils import metrics
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.strings import codec_lookup
 
-__all__ = ["SourceCache", "SourceMapCache"]
+__all__ = ["SourceCache", "SourceMapCache", "get_parsed_view", "make_source_view"]
+
+# Parsed source views and source map views shared by all processors of a
+# process, see ``SENTRY_JS_PARSED_SOURCE_CACHE_SIZE``. Values are
+# ``(view, size)``, where the size is the one of the file the view was parsed
+# from.
+_parsed_cache = LRUCache(0, sizeof=lambda value: value[1])
+_parsed_cache_lock = threading.Lock()
 
 
 def is_utf8(codec):
@@ -10,6 +23,58 @@ def is_utf8(codec):
     return name in ("utf-8", "ascii")
 
 
+def make_source_view(source, encoding=None):
+    if isinstance(source, SourceView):
+        return source
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    # If an encoding is provided and it's not utf-8 compatible
+    # we try to re-encoding the source and create a source view
+    # from it.
+    elif encoding is not None and not is_utf8(encoding):
+        try:
+            source = source.decode(encoding).encode("utf-8")
+        except UnicodeError:
+            pass
+    return SourceView.from_bytes(source)
+
+
+def get_parsed_view(kind, ident, body, parse, release=None, dist=None):
+    """
+    Returns ``parse(body)``, reusing the view parsed for an earlier event if
+    the same ``kind`` of file with the same contents was fetched for the same
+    release and dist. ``ident`` identifies the file, e.g. by its URL.
+
+    Views are read-only, so they are shared between processors as they are.
+    """
+    cache_size = settings.SENTRY_JS_PARSED_SOURCE_CACHE_SIZE
+    if not cache_size:
+        return parse(body)
+
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    cache_key = (
+        kind,
+        release.id if release else None,
+        dist.id if dist else None,
+        ident,
+        sha1(body).hexdigest(),
+    )
+    with _parsed_cache_lock:
+        _parsed_cache.max_size = cache_size
+        value = _parsed_cache.get(cache_key)
+
+    if value is not None:
+        metrics.incr("sourcemaps.parsed_cache.hit", tags={"kind": kind})
+        return value[0]
+
+    metrics.incr("sourcemaps.parsed_cache.miss", tags={"kind": kind})
+    view = parse(body)
+    with _parsed_cache_lock:
+        _parsed_cache[cache_key] = (view, len(body))
+    return view
+
+
 class SourceCache:
     def __init__(self):
         self._cache = {}
@@ -38,20 +103,7 @@ class SourceCache:
 
     def add(self, url, source, encoding=None):
         url = self._get_canonical_url(url)
-
-        if not isinstance(source, SourceView):
-            if isinstance(source, str):
-                source = source.encode("utf-8")
-            # If an encoding is provided and it's not utf-8 compatible
-            # we try to re-encoding the source and create a source view
-            # from it.
-            elif encoding is not None and not is_utf8(encoding):
-                try:
-                    source = source.decode(encoding).encode("utf-8")
-                except UnicodeError:
-                    pass
-            source = SourceView.from_bytes(source)
-        self._cache[url] = source
+        self._cache[url] = make_source_view(source, encoding)
 
     def add_error(self, url, error):
         url = self._get_canonical_url(url)
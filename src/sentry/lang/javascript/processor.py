@@ -3,8 +3,10 @@ import errno
 import logging
 import re
 import sys
+import threading
 import time
 import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from io import BytesIO
 from os.path import splitext
@@ -13,15 +15,23 @@ from urllib.parse import urlsplit
 
 import sentry_sdk
 from django.conf import settings
+from django.db import close_old_connections
 from django.utils import timezone
 from django.utils.encoding import force_bytes, force_text
 from requests.utils import get_encoding_from_headers
+from sentry_sdk import Hub
 from symbolic import SourceMapView
 
 from sentry import http, options
 from sentry.interfaces.stacktrace import Stacktrace
 from sentry.models import EventError, Organization, ReleaseFile
-from sentry.models.releasefile import ARTIFACT_INDEX_FILENAME, ReleaseArchive, read_artifact_index
+from sentry.models.file import ChunkedFileBlobIndexWrapper, FileBlobIndex
+from sentry.models.releasefile import (
+    ARTIFACT_INDEX_FILENAME,
+    ReleaseArchive,
+    ReleaseArchiveIndex,
+    read_artifact_index,
+)
 from sentry.stacktraces.processing import StacktraceProcessor
 from sentry.utils import json, metrics
 
@@ -29,6 +39,7 @@ from sentry.utils import json, metrics
 # holding the results of attempting to fetch both kinds of files, either from the
 # database or from the internet
 from sentry.utils.cache import cache
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.files import compress_file
 from sentry.utils.hashlib import md5_text
 from sentry.utils.http import is_valid_origin
@@ -36,7 +47,7 @@ from sentry.utils.retries import ConditionalRetryPolicy, exponential_delay
 from sentry.utils.safe import get_path
 from sentry.utils.urls import non_standard_url_join
 
-from .cache import SourceCache, SourceMapCache
+from .cache import SourceCache, SourceMapCache, get_parsed_view, make_source_view
 
 __all__ = ["JavaScriptStacktraceProcessor"]
 
@@ -77,6 +88,18 @@ CACHE_MAX_VALUE_SIZE = settings.SENTRY_CACHE_MAX_VALUE_SIZE
 
 logger = logging.getLogger(__name__)
 
+# Thread pools for fetching sources and source maps concurrently, keyed by
+# concurrency, see ``processing.javascript-fetch-concurrency``.
+_fetch_executors = {}
+_fetch_executors_lock = threading.Lock()
+
+# Indexes of release archives read by this process, see
+# ``SENTRY_RELEASE_ARCHIVE_INDEX_CACHE_SIZE``. Values are ``(blob indexes,
+# archive index)``, the blob indexes of the archive file are kept so that
+# files can be read from the archive without looking them up again.
+_archive_index_cache = LRUCache(0, sizeof=lambda value: value[1].size)
+_archive_index_cache_lock = threading.Lock()
+
 
 class UnparseableSourcemap(http.BadSource):
     error_type = EventError.JS_INVALID_SOURCEMAP
@@ -508,6 +531,100 @@ def fetch_release_archive_for_url(release, dist, url) -> Optional[IO]:
             return file_
 
 
+def get_release_archive_index(release, dist, info) -> Optional[tuple]:
+    """Return the blob indexes and the ``ReleaseArchiveIndex`` of the archive
+    of the artifact index entry ``info``.
+
+    Archives are only read once per process. Uploading an archive with the
+    same name again changes the creation date in the artifact index, which is
+    part of the cache key.
+    """
+    cache_key = (
+        release.id,
+        dist.id if dist else None,
+        info["archive_ident"],
+        info.get("date_created"),
+    )
+    with _archive_index_cache_lock:
+        _archive_index_cache.max_size = settings.SENTRY_RELEASE_ARCHIVE_INDEX_CACHE_SIZE
+        rv = _archive_index_cache.get(cache_key)
+    if rv is not None:
+        metrics.incr("sourcemaps.archive_index_cache.hit")
+        return rv
+
+    metrics.incr("sourcemaps.archive_index_cache.miss")
+    try:
+        with sentry_sdk.start_span(op="get_release_archive_index.get_releasefile_db_entry"):
+            releasefile = ReleaseFile.objects.filter(
+                release_id=release.id,
+                dist_id=dist.id if dist else dist,
+                ident=info["archive_ident"],
+            ).select_related("file")[0]
+    except IndexError:
+        # This should not happen when there is an archive_ident in the manifest
+        logger.error("sourcemaps.missing_archive", exc_info=sys.exc_info())
+        return None
+
+    def read_index():
+        indexes = list(
+            FileBlobIndex.objects.filter(file=releasefile.file)
+            .select_related("blob")
+            .order_by("offset")
+        )
+        with ChunkedFileBlobIndexWrapper(indexes) as fp:
+            return indexes, ReleaseArchiveIndex(fp)
+
+    with sentry_sdk.start_span(op="get_release_archive_index.read_index") as span:
+        span.set_data("file_size", releasefile.file.size)
+        rv = fetch_retry_policy(read_index)
+
+    with _archive_index_cache_lock:
+        _archive_index_cache[cache_key] = rv
+    return rv
+
+
+def fetch_release_artifact_from_index(url, release, dist, cache_key, cache_key_meta):
+    """Same as the archive part of ``fetch_release_artifact``, but only reads
+    the requested file from the archive, using ``get_release_archive_index``.
+
+    Returns ``None`` if the file is not in an archive, and ``-1`` if the
+    artifact index is wrong about it.
+    """
+    with sentry_sdk.start_span(op="fetch_release_artifact_from_index.get_index_entry"):
+        info = get_index_entry(release, dist, url)
+    if info is None:
+        return None
+
+    try:
+        archive = get_release_archive_index(release, dist, info)
+    except Exception as exc:
+        logger.error("Failed to read archive index for release %s", release.id, exc_info=exc)
+        return None
+    if archive is None:
+        return None
+
+    indexes, archive_index = archive
+    for candidate in ReleaseFile.normalize(url):
+        try:
+            filename, headers = archive_index.get_filename_by_url(candidate)
+        except KeyError:
+            continue
+        break
+    else:
+        # The manifest mapped the url to an archive, but the file is not there.
+        logger.error("Release artifact %r not found in archive %s", url, info["archive_ident"])
+        cache.set(cache_key, -1, 60)
+        return -1
+
+    def read_file():
+        with ChunkedFileBlobIndexWrapper(indexes) as fp:
+            return BytesIO(archive_index.read(filename, fp))
+
+    return fetch_and_cache_artifact(
+        url, read_file, cache_key, cache_key_meta, headers, compress_fn=compress
+    )
+
+
 def compress(fp: IO) -> Tuple[bytes, bytes]:
     """Alternative for compress_file when fp does not support chunks"""
     content = fp.read()
@@ -532,7 +649,14 @@ def fetch_release_artifact(url, release, dist):
         return result_from_cache(url, result)
 
     start = time.monotonic()
-    archive_file = fetch_release_archive_for_url(release, dist, url)
+    if settings.SENTRY_RELEASE_ARCHIVE_INDEX_CACHE_SIZE:
+        result = fetch_release_artifact_from_index(url, release, dist, cache_key, cache_key_meta)
+        if result is not None:
+            metrics.timing("sourcemaps.release_artifact_from_archive", time.monotonic() - start)
+            return result if result != -1 else None
+        archive_file = None
+    else:
+        archive_file = fetch_release_archive_for_url(release, dist, url)
     if archive_file is not None:
         try:
             archive = ReleaseArchive(archive_file)
@@ -729,6 +853,8 @@ def fetch_sourcemap(url, project=None, release=None, dist=None, allow_scraping=T
             )
         except TypeError as e:
             raise UnparseableSourcemap({"url": "<base64>", "reason": str(e)})
+        # The contents identify inline source maps well enough.
+        ident = None
     else:
         # look in the database and, if not found, optionally try to scrape the web
         result = fetch_file(
@@ -739,8 +865,16 @@ def fetch_sourcemap(url, project=None, release=None, dist=None, allow_scraping=T
             allow_scraping=allow_scraping,
         )
         body = result.body
+        ident = result.url
     try:
-        return SourceMapView.from_json_bytes(body)
+        return get_parsed_view(
+            "sourcemap",
+            ident,
+            body,
+            SourceMapView.from_json_bytes,
+            release=release,
+            dist=dist,
+        )
     except Exception as exc:
         # This is in debug because the product shows an error already.
         logger.debug(str(exc), exc_info=True)
@@ -782,6 +916,16 @@ def is_valid_frame(frame):
     return frame is not None and frame.get("lineno") is not None
 
 
+def _get_fetch_executor(concurrency):
+    with _fetch_executors_lock:
+        executor = _fetch_executors.get(concurrency)
+        if executor is None:
+            executor = _fetch_executors[concurrency] = ThreadPoolExecutor(
+                max_workers=concurrency, thread_name_prefix="js-fetch"
+            )
+        return executor
+
+
 class JavaScriptStacktraceProcessor(StacktraceProcessor):
     """
     Attempts to fetch source code for javascript frames.
@@ -1119,69 +1263,22 @@ class JavaScriptStacktraceProcessor(StacktraceProcessor):
         Look for and (if found) cache a source file and its associated source
         map (if any).
         """
-
-        sourcemaps = self.sourcemaps
-        cache = self.cache
-
-        self.fetch_count += 1
-
-        if self.fetch_count > self.max_fetches:
-            cache.add_error(filename, {"type": EventError.JS_TOO_MANY_REMOTE_SOURCES})
+        if not self._count_fetch(filename):
             return
 
-        # TODO: respect cache-control/max-age headers to some extent
-        logger.debug("Attempting to cache source %r", filename)
         try:
-            # this both looks in the database and tries to scrape the internet
-            with sentry_sdk.start_span(
-                op="JavaScriptStacktraceProcessor.cache_source.fetch_file"
-            ) as span:
-                span.set_data("filename", filename)
-                result = fetch_file(
-                    filename,
-                    project=self.project,
-                    release=self.release,
-                    dist=self.dist,
-                    allow_scraping=self.allow_scraping,
-                )
+            result = self._fetch_file(filename)
         except http.BadSource as exc:
-            # most people don't upload release artifacts for their third-party libraries,
-            # so ignore missing node_modules files
-            if exc.data["type"] == EventError.JS_MISSING_SOURCE and "node_modules" in filename:
-                pass
-            else:
-                cache.add_error(filename, exc.data)
-
-            # either way, there's no more for us to do here, since we don't have
-            # a valid file to cache
-            return
-        cache.add(filename, result.body, result.encoding)
-        cache.alias(result.url, filename)
-
-        sourcemap_url = discover_sourcemap(result)
-        if not sourcemap_url:
+            self._add_fetch_error(filename, exc)
             return
 
-        logger.debug(
-            "Found sourcemap URL %r for minified script %r", sourcemap_url[:256], result.url
-        )
-        sourcemaps.link(filename, sourcemap_url)
-        if sourcemap_url in sourcemaps:
+        sourcemap_url = self._add_source(filename, result)
+        if sourcemap_url is None:
             return
 
         # pull down sourcemap
         try:
-            with sentry_sdk.start_span(
-                op="JavaScriptStacktraceProcessor.cache_source.fetch_sourcemap"
-            ) as span:
-                span.set_data("sourcemap_url", sourcemap_url)
-                sourcemap_view = fetch_sourcemap(
-                    sourcemap_url,
-                    project=self.project,
-                    release=self.release,
-                    dist=self.dist,
-                    allow_scraping=self.allow_scraping,
-                )
+            sourcemap_view = self._fetch_sourcemap(sourcemap_url)
         except http.BadSource as exc:
             # we don't perform the same check here as above, because if someone has
             # uploaded a node_modules file, which has a sourceMappingURL, they
@@ -1189,10 +1286,93 @@ class JavaScriptStacktraceProcessor(StacktraceProcessor):
             # working, if that's the case). If they're not looking for it to be
             # mapped, then they shouldn't be uploading the source file in the
             # first place.
-            cache.add_error(filename, exc.data)
+            self.cache.add_error(filename, exc.data)
             return
 
-        sourcemaps.add(sourcemap_url, sourcemap_view)
+        self._add_sourcemap(sourcemap_url, sourcemap_view)
+
+    def _count_fetch(self, filename):
+        """
+        Counts the fetch of ``filename`` towards ``max_fetches`` and returns
+        whether it's still within the budget.
+        """
+        self.fetch_count += 1
+
+        if self.fetch_count > self.max_fetches:
+            self.cache.add_error(filename, {"type": EventError.JS_TOO_MANY_REMOTE_SOURCES})
+            return False
+        return True
+
+    def _fetch_file(self, filename, hub=None):
+        # TODO: respect cache-control/max-age headers to some extent
+        logger.debug("Attempting to cache source %r", filename)
+        # this both looks in the database and tries to scrape the internet
+        with (hub or Hub.current).start_span(
+            op="JavaScriptStacktraceProcessor.cache_source.fetch_file"
+        ) as span:
+            span.set_data("filename", filename)
+            return fetch_file(
+                filename,
+                project=self.project,
+                release=self.release,
+                dist=self.dist,
+                allow_scraping=self.allow_scraping,
+            )
+
+    def _add_fetch_error(self, filename, exc):
+        # most people don't upload release artifacts for their third-party libraries,
+        # so ignore missing node_modules files
+        if exc.data["type"] == EventError.JS_MISSING_SOURCE and "node_modules" in filename:
+            pass
+        else:
+            self.cache.add_error(filename, exc.data)
+
+        # either way, there's no more for us to do here, since we don't have
+        # a valid file to cache
+
+    def _add_source(self, filename, result):
+        """
+        Caches the source file fetched for ``filename``, and returns the URL
+        of its source map if that still needs to be fetched.
+        """
+        source_view = get_parsed_view(
+            "source",
+            (result.url, result.encoding),
+            result.body,
+            lambda body: make_source_view(body, result.encoding),
+            release=self.release,
+            dist=self.dist,
+        )
+        self.cache.add(filename, source_view)
+        self.cache.alias(result.url, filename)
+
+        sourcemap_url = discover_sourcemap(result)
+        if not sourcemap_url:
+            return None
+
+        logger.debug(
+            "Found sourcemap URL %r for minified script %r", sourcemap_url[:256], result.url
+        )
+        self.sourcemaps.link(filename, sourcemap_url)
+        if sourcemap_url in self.sourcemaps:
+            return None
+        return sourcemap_url
+
+    def _fetch_sourcemap(self, sourcemap_url, hub=None):
+        with (hub or Hub.current).start_span(
+            op="JavaScriptStacktraceProcessor.cache_source.fetch_sourcemap"
+        ) as span:
+            span.set_data("sourcemap_url", sourcemap_url)
+            return fetch_sourcemap(
+                sourcemap_url,
+                project=self.project,
+                release=self.release,
+                dist=self.dist,
+                allow_scraping=self.allow_scraping,
+            )
+
+    def _add_sourcemap(self, sourcemap_url, sourcemap_view):
+        self.sourcemaps.add(sourcemap_url, sourcemap_view)
 
         # cache any inlined sources
         for src_id, source_name in sourcemap_view.iter_sources():
@@ -1200,6 +1380,68 @@ class JavaScriptStacktraceProcessor(StacktraceProcessor):
             if source_view is not None:
                 self.cache.add(non_standard_url_join(sourcemap_url, source_name), source_view)
 
+    def _fetch_concurrently(self, fetch, urls, concurrency):
+        """
+        Calls ``fetch`` for all ``urls`` on the fetch thread pool, and returns
+        the results or ``BadSource`` errors in the same order. Unexpected
+        errors are logged and returned as generic fetch errors, so that they
+        don't fail the other fetches.
+        """
+
+        def run(url, hub):
+            # Fetches look up release files in the database. Pool threads
+            # aren't managed by Django, so their connections are checked like
+            # around a request, and broken or expired ones are not reused.
+            close_old_connections()
+            try:
+                return fetch(url, hub=hub)
+            except http.BadSource as exc:
+                return exc
+            except Exception as exc:
+                logger.error("sourcemaps.fetch_failed", exc_info=exc)
+                return http.CannotFetch(
+                    {"type": EventError.FETCH_GENERIC_ERROR, "url": http.expose_url(url)}
+                )
+            finally:
+                close_old_connections()
+
+        executor = _get_fetch_executor(concurrency)
+        futures = [executor.submit(run, url, Hub(Hub.current)) for url in urls]
+        return [future.result() for future in futures]
+
+    def cache_sources(self, filenames, concurrency):
+        """
+        Same as calling ``cache_source`` for all ``filenames``, but fetches
+        all source files, and then all of their source maps, with up to
+        ``concurrency`` fetches at once.
+        """
+        filenames = [filename for filename in filenames if self._count_fetch(filename)]
+
+        # source map URL -> files that refer to it
+        pending_sourcemaps = {}
+        for filename, result in zip(
+            filenames, self._fetch_concurrently(self._fetch_file, filenames, concurrency)
+        ):
+            if isinstance(result, http.BadSource):
+                self._add_fetch_error(filename, result)
+                continue
+
+            sourcemap_url = self._add_source(filename, result)
+            if sourcemap_url is not None:
+                pending_sourcemaps.setdefault(sourcemap_url, []).append(filename)
+
+        sourcemap_urls = list(pending_sourcemaps)
+        for sourcemap_url, result in zip(
+            sourcemap_urls,
+            self._fetch_concurrently(self._fetch_sourcemap, sourcemap_urls, concurrency),
+        ):
+            if isinstance(result, http.BadSource):
+                for filename in pending_sourcemaps[sourcemap_url]:
+                    self.cache.add_error(filename, result.data)
+                continue
+
+            self._add_sourcemap(sourcemap_url, result)
+
     def populate_source_cache(self, frames):
         """
         Fetch all sources that we know are required (being referenced directly
@@ -1221,6 +1463,15 @@ class JavaScriptStacktraceProcessor(StacktraceProcessor):
                 continue
             pending_file_list.add(f["abs_path"])
 
+        concurrency = options.get("processing.javascript-fetch-concurrency")
+        if concurrency > 1 and len(pending_file_list) > 1:
+            with sentry_sdk.start_span(
+                op="JavaScriptStacktraceProcessor.populate_source_cache.cache_sources"
+            ) as span:
+                span.set_data("num_files", len(pending_file_list))
+                self.cache_sources(pending_file_list, concurrency)
+            return
+
         for idx, filename in enumerate(pending_file_list):
             with sentry_sdk.start_span(
                 op="JavaScriptStacktraceProcessor.populate_source_cache.cache_source"
@@ -0,0 +1,85 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Trains a zstd dictionary for nodestore payloads of a platform from recent events"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--project", action="append", type=int, dest="projects", help="project ID to sample"
+        )
+        parser.add_argument("--platform", dest="platform", help="platform to train for")
+        parser.add_argument(
+            "--output",
+            dest="output",
+            help="directory the <platform>.<dict_id>.dict file is written to",
+        )
+        parser.add_argument("--days", type=int, default=7, help="how far back to sample events")
+        parser.add_argument("--samples", type=int, default=1000, help="number of events to sample")
+        parser.add_argument(
+            "--dict-size", type=int, default=112640, help="dictionary size in bytes"
+        )
+
+    def handle(self, **options):
+        from sentry import eventstore
+        from sentry.nodestore.base import json_dumps
+        from sentry.nodestore.encoding import (
+            get_dictionary_filename,
+            load_dictionaries,
+            train_dictionary,
+        )
+
+        if not options["projects"] or not options["platform"] or not options["output"]:
+            raise CommandError("--project, --platform and --output are required")
+
+        platform = options["platform"]
+        now = timezone.now()
+        snuba_filter = eventstore.Filter(
+            project_ids=options["projects"],
+            conditions=[["platform", "=", platform]],
+            start=now - timedelta(days=options["days"]),
+            end=now,
+        )
+
+        samples = []
+        offset = 0
+        while len(samples) < options["samples"]:
+            events = eventstore.get_events(
+                filter=snuba_filter,
+                limit=min(100, options["samples"] - len(samples)),
+                offset=offset,
+                referrer="management.train_nodestore_dictionaries",
+            )
+            if not events:
+                break
+            offset += len(events)
+            samples.extend(json_dumps(dict(event.data)).encode("utf8") for event in events)
+
+        if not samples:
+            raise CommandError(f"No events found for platform {platform!r}")
+
+        # Nodes name the dictionary they were compressed with by its ID, so
+        # the new dictionary must not reuse the ID of an existing one. IDs
+        # grow over time, the largest one of a platform is used for writes.
+        existing = load_dictionaries.__wrapped__(options["output"])
+        dict_id = max(
+            [int(time.time())]
+            + [d.dict_id() + 1 for dictionaries in existing.values() for d in dictionaries]
+        )
+        dictionary = train_dictionary(samples, dict_size=options["dict_size"], dict_id=dict_id)
+
+        path = os.path.join(options["output"], get_dictionary_filename(platform, dictionary))
+        # "x" never overwrites an existing dictionary.
+        with open(path, "xb") as f:
+            f.write(dictionary.as_bytes())
+
+        self.stdout.write(
+            f"Trained dictionary {dictionary.dict_id()} from {len(samples)} events: {path}\n"
+            "Keep the previous dictionaries of this platform around for as long as nodes "
+            "compressed with them are stored."
+        )
@@ -7,7 +7,8 @@ from django.utils import timezone
 from sentry.db.models import Model, sane_repr
 from sentry.db.models.fields import FlexibleForeignKey, JSONField
 from sentry.models import ActorTuple
-from sentry.ownership.grammar import Rule, load_schema, resolve_actors
+from sentry.ownership.grammar import Rule, resolve_actors
+from sentry.ownership.ruleset import get_ownership_ruleset
 from sentry.utils import metrics
 from sentry.utils.cache import cache
 
@@ -98,9 +99,13 @@ class ProjectOwnership(Model):
             ownership = cls(project_id=project_id)
 
         codeowners = ProjectCodeOwners.get_codeowners_cached(project_id)
-        ownership.schema = cls.get_combined_schema(ownership, codeowners)
 
-        rules = cls._matching_ownership_rules(ownership, project_id, data)
+        # Same as matching the rules of ``get_combined_schema``, but lets both
+        # schemas keep their own compiled ruleset.
+        rules = [
+            *(cls._matching_ownership_rules(codeowners, project_id, data) if codeowners else ()),
+            *cls._matching_ownership_rules(ownership, project_id, data),
+        ]
 
         if not rules:
             return cls.Everyone if ownership.fallthrough else [], None
@@ -188,13 +193,11 @@ class ProjectOwnership(Model):
     def _matching_ownership_rules(
         cls, ownership: "ProjectOwnership", project_id: int, data: Mapping[str, Any]
     ) -> Sequence["Rule"]:
-        rules = []
-        if ownership.schema is not None:
-            for rule in load_schema(ownership.schema):
-                if rule.test(data):
-                    rules.append(rule)
+        if ownership.schema is None:
+            return []
 
-        return rules
+        ruleset = get_ownership_ruleset((type(ownership).__name__, project_id), ownership.schema)
+        return ruleset.get_matching_rules(data)
 
 
 # Signals update the cached reads used in post_processing
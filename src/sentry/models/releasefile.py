@@ -1,7 +1,9 @@
 import errno
 import logging
 import os
+import struct
 import zipfile
+import zlib
 from contextlib import contextmanager
 from hashlib import sha1
 from io import BytesIO
@@ -225,6 +227,74 @@ class ReleaseArchive:
         return temp_dir
 
 
+# Fixed part of the local file header that precedes every file in a ZIP archive
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+class ReleaseArchiveIndex:
+    """Central directory and manifest of an uploaded ZIP-archive of release files.
+
+    Unlike ``ReleaseArchive``, the index does not hold on to the archive. Files
+    are read from any file object of the same archive by seeking to them, so
+    only the parts of the archive that hold the requested file are read.
+    """
+
+    def __init__(self, fileobj: IO):
+        with zipfile.ZipFile(fileobj) as zip_file:
+            manifest_bytes = zip_file.read("manifest.json")
+            # filename -> (offset of the local header, compressed size, compression, CRC)
+            self._infos = {
+                info.filename: (
+                    info.header_offset,
+                    info.compress_size,
+                    # Encrypted files are left to ``zipfile``
+                    info.compress_type if not info.flag_bits & 0x1 else None,
+                    info.CRC,
+                )
+                for info in zip_file.infolist()
+            }
+
+        self.manifest = json.loads(manifest_bytes.decode("utf-8"))
+        files = self.manifest.get("files", {})
+        self._entries_by_url = {entry["url"]: (path, entry) for path, entry in files.items()}
+
+        # Rough estimate of the memory taken up by the index
+        self.size = len(manifest_bytes) * 2 + sum(len(name) + 200 for name in self._infos)
+
+    def get_filename_by_url(self, url: str) -> Tuple[str, dict]:
+        """Return the name of the file in the archive and its headers.
+
+        May raise ``KeyError``
+        """
+        filename, entry = self._entries_by_url[url]
+        return filename, entry.get("headers", {})
+
+    def read(self, filename: str, fileobj: IO) -> bytes:
+        """Read a file from ``fileobj``, which has to contain this archive.
+
+        May raise ``KeyError``
+        """
+        header_offset, compress_size, compress_type, crc = self._infos[filename]
+        if compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            with zipfile.ZipFile(fileobj) as zip_file:
+                return zip_file.read(filename)
+
+        fileobj.seek(header_offset)
+        header = _LOCAL_HEADER.unpack(fileobj.read(_LOCAL_HEADER.size))
+        if header[0] != _LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad magic number for file header of {filename!r}")
+        # Skip the file name and extra field
+        fileobj.seek(header_offset + _LOCAL_HEADER.size + header[10] + header[11])
+
+        data = fileobj.read(compress_size)
+        if compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        if zlib.crc32(data) != crc:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for file {filename!r}")
+        return data
+
+
 class _ArtifactIndexData:
     """Holds data of artifact index and keeps track of changes"""
 
@@ -1,12 +1,24 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from threading import local
+from time import time
 
 import sentry_sdk
+from celery.signals import task_failure, task_success
+from django.conf import settings
 from django.core.cache import InvalidCacheBackendError, caches
+from django.core.signals import request_finished
 
-from sentry.utils import json
+from sentry.nodestore.encoding import NodeEncoder, load_dictionaries
+from sentry.utils import json, metrics
 from sentry.utils.cache import memoize
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.services import Service
 
+logger = logging.getLogger(__name__)
+
 # Cache an instance of the encoder we want to use
 json_dumps = json.JSONEncoder(
     separators=(",", ":"),
@@ -22,6 +34,48 @@ json_dumps = json.JSONEncoder(
 
 json_loads = json._default_decoder.decode
 
+# Nodes, scoped to the current request, task or consumer batch. See
+# ``NodeStorage.local_cache_size``. Callers mutate the nodes they get, so the
+# cache holds nodes serialized to JSON and decodes a fresh copy on every hit,
+# which is cheaper than deep-copying them.
+_local_cache = threading.local()
+
+# Worker threads for concurrent fetches, shared by all nodestore instances
+# with the same concurrency. They are kept around since backends hold their
+# clients in thread-local state.
+_fetch_executors = {}
+_fetch_executors_lock = threading.Lock()
+
+
+# Patchsets written or read by this process, keyed by ``(id(nodestore),
+# checksum)``. Values are ``(written_at, payload, stored_size, size)`` where
+# ``written_at`` is ``None`` if the patchset was only read, and ``size`` is
+# the size of the serialized payload. Bounded by
+# ``SENTRY_NODESTORE_PATCHSET_CACHE_SIZE`` bytes.
+_patchset_cache = LRUCache(0, sizeof=lambda entry: entry[3])
+_patchset_cache_lock = threading.Lock()
+
+PATCHSETS_KEY = "__nodestore_patchsets"
+
+
+def clear_local_cache(**kwargs):
+    _local_cache.caches = {}
+
+
+request_finished.connect(clear_local_cache)
+task_failure.connect(clear_local_cache)
+task_success.connect(clear_local_cache)
+
+
+def _get_fetch_executor(concurrency):
+    with _fetch_executors_lock:
+        executor = _fetch_executors.get(concurrency)
+        if executor is None:
+            executor = _fetch_executors[concurrency] = ThreadPoolExecutor(
+                max_workers=concurrency, thread_name_prefix="nodestore-fetch"
+            )
+        return executor
+
 
 class NodeStorage(local, Service):
     """
@@ -56,6 +110,33 @@ class NodeStorage(local, Service):
 
     This is used in reprocessing to store a snapshot of the event from multiple
     stages of the pipeline.
+
+    :param fetch_concurrency: When larger than ``1``, ``get_multi`` splits
+        its ids into chunks of ``fetch_chunk_size`` that are fetched and
+        decoded concurrently on this many threads. Only enable this for
+        backends that don't depend on per-thread resources being cleaned up
+        (the Django backend opens a database connection per thread).
+    :param fetch_chunk_size: How many ids one concurrent fetch covers.
+    :param local_cache_size: How many nodes to keep in memory for
+        the duration of the current request, task or consumer batch (see
+        ``clear_local_cache``). ``0`` disables the cache.
+    :param deduplicate_interfaces: Store interfaces that repeat across
+        events (see ``sentry.eventstore.compressor``) once, under a
+        content-addressed id, and only keep a reference in the node. Nodes
+        written this way are read back transparently whether or not this is
+        enabled.
+    :param patchset_refresh_interval: How many seconds a process trusts
+        that a patchset it wrote is still stored. Patchsets are kept for this
+        much longer than the nodes written along with them, and are rewritten
+        after this so they outlive every node referencing them.
+    :param compression: ``"zstd"`` to compress payloads before handing them
+        to the backend, see ``sentry.nodestore.encoding``. Payloads are read
+        back regardless of this setting.
+    :param compression_dictionaries: A directory of zstd dictionaries per
+        platform, as written by ``sentry django train_nodestore_dictionaries``.
+        The newest dictionary of a platform is used for writes. Older ones
+        must stay in the directory while nodes compressed with them exist.
+    :param compression_level: The zstd compression level.
     """
 
     __all__ = (
@@ -70,6 +151,39 @@ class NodeStorage(local, Service):
         "bootstrap",
     )
 
+    fetch_concurrency = 1
+    fetch_chunk_size = 100
+    local_cache_size = 0
+    deduplicate_interfaces = False
+    patchset_refresh_interval = 3600
+    encoder = NodeEncoder()
+
+    def __init__(
+        self,
+        fetch_concurrency=1,
+        fetch_chunk_size=100,
+        local_cache_size=0,
+        deduplicate_interfaces=False,
+        patchset_refresh_interval=3600,
+        compression=None,
+        compression_dictionaries=None,
+        compression_level=3,
+    ):
+        assert fetch_concurrency > 0
+        assert fetch_chunk_size > 0
+        self.fetch_concurrency = fetch_concurrency
+        self.fetch_chunk_size = fetch_chunk_size
+        self.local_cache_size = local_cache_size
+        self.deduplicate_interfaces = deduplicate_interfaces
+        self.patchset_refresh_interval = patchset_refresh_interval
+        self.encoder = NodeEncoder(
+            compression=compression,
+            dictionaries=(
+                load_dictionaries(compression_dictionaries) if compression_dictionaries else None
+            ),
+            level=compression_level,
+        )
+
     def delete(self, id):
         """
         >>> nodestore.delete('key1')
@@ -92,6 +206,7 @@ class NodeStorage(local, Service):
         if value is None:
             return None
 
+        value = self.encoder.decode(value)
         lines_iter = iter(value.splitlines())
         try:
             if subkey is not None:
@@ -136,6 +251,9 @@ class NodeStorage(local, Service):
             span.set_tag("subkey", str(subkey))
             bytes_data = self._get_bytes(id)
             rv = self._decode(bytes_data, subkey=subkey)
+            items = {id: rv}
+            self._assemble_many(items)
+            rv = items[id]
             if subkey is None:
                 # set cache item only after we know decoding did not fail
                 self._set_cache_item(id, rv)
@@ -179,10 +297,8 @@ class NodeStorage(local, Service):
             else:
                 uncached_ids = id_list
 
-            items = {
-                id: self._decode(value, subkey=subkey)
-                for id, value in self._get_bytes_multi(uncached_ids).items()
-            }
+            items = self._get_multi_decoded(uncached_ids, subkey, span)
+            self._assemble_many(items)
             if subkey is None:
                 self._set_cache_items(items)
                 items.update(cache_items)
@@ -192,6 +308,30 @@ class NodeStorage(local, Service):
 
             return items
 
+    def _fetch_and_decode(self, id_list, subkey):
+        return {
+            id: self._decode(value, subkey=subkey)
+            for id, value in self._get_bytes_multi(id_list).items()
+        }
+
+    def _get_multi_decoded(self, id_list, subkey, span):
+        if self.fetch_concurrency <= 1 or len(id_list) <= self.fetch_chunk_size:
+            return self._fetch_and_decode(id_list, subkey)
+
+        chunks = [
+            id_list[i : i + self.fetch_chunk_size]
+            for i in range(0, len(id_list), self.fetch_chunk_size)
+        ]
+        span.set_tag("fetch_chunks", len(chunks))
+
+        executor = _get_fetch_executor(self.fetch_concurrency)
+        futures = [executor.submit(self._fetch_and_decode, chunk, subkey) for chunk in chunks]
+
+        items = {}
+        for future in futures:
+            items.update(future.result())
+        return items
+
     def _encode(self, data):
         """
         Encode data dict in a way where its keys can be deserialized
@@ -201,12 +341,14 @@ class NodeStorage(local, Service):
         >>> _encode({"unprocessed": {}, None: {"stacktrace": {}}})
         b'{"stacktrace": {}}\nunprocessed\n{}'
         """
-        lines = [json_dumps(data.pop(None)).encode("utf8")]
+        node = data.pop(None)
+        lines = [json_dumps(node).encode("utf8")]
         for key, value in data.items():
             lines.append(key.encode("ascii"))
             lines.append(json_dumps(value).encode("utf8"))
 
-        return b"\n".join(lines)
+        platform = node.get("platform") if isinstance(node, dict) else None
+        return self.encoder.encode(b"\n".join(lines), platform=platform)
 
     def _set_bytes(self, id, data, ttl=None):
         """
@@ -241,39 +383,229 @@ class NodeStorage(local, Service):
             span.set_tag("node_id", id)
             span.set_data("subkeys_count", len(data))
             cache_item = data.get(None)
+            patchset_sizes = None
+            if self.deduplicate_interfaces and cache_item:
+                data[None], patchset_sizes = self._write_patchsets(cache_item, ttl=ttl)
             bytes_data = self._encode(data)
             self._set_bytes(id, bytes_data, ttl=ttl)
+            if patchset_sizes is not None:
+                written, total = patchset_sizes
+                metrics.timing(
+                    "nodestore.dedup.ratio",
+                    (len(bytes_data) + written) / (len(bytes_data) + total),
+                )
             # set cache only after encoding and write to nodestore has succeeded
             self._set_cache_item(id, cache_item)
 
+    def _get_patchset_id(self, checksum):
+        return f"ps:{checksum}"
+
+    def _set_patchset_bytes(self, id, data, ttl=None):
+        """
+        Writes a patchset referenced by nodes written with ``ttl`` during the
+        next ``patchset_refresh_interval`` seconds. Backends have to keep it
+        for at least as long as the last of those nodes.
+        """
+        if ttl is not None:
+            ttl += timedelta(seconds=self.patchset_refresh_interval)
+        self._set_bytes(id, data, ttl=ttl)
+
+    def _write_patchsets(self, data, ttl=None):
+        """
+        Moves repeating interfaces of ``data`` into patchsets and writes the
+        ones this process hasn't written recently. Returns the deduplicated
+        node and ``(bytes written, bytes deduplicated)`` for metrics.
+        """
+        from sentry.eventstore.compressor import deduplicate
+
+        data, patchsets = deduplicate(data)
+        if ttl is not None and patchsets:
+            # Patchsets are written with the TTL of their nodes, and a shorter
+            # TTL must never replace a longer one. Nodes with an explicit TTL
+            # get patchsets of their own.
+            suffix = f".{int(ttl.total_seconds())}"
+            patchsets = {checksum + suffix: payload for checksum, payload in patchsets.items()}
+            for reference in data[PATCHSETS_KEY]:
+                reference[1] += suffix
+
+        now = time()
+        written = total = 0
+
+        for checksum, payload in patchsets.items():
+            cache_key = (id(self), checksum)
+            with _patchset_cache_lock:
+                entry = _patchset_cache.get(cache_key)
+
+            if (
+                entry is not None
+                and entry[0] is not None
+                and now - entry[0] < self.patchset_refresh_interval
+            ):
+                metrics.incr("nodestore.dedup.patchsets", tags={"written": "false"})
+                total += entry[2]
+                continue
+
+            bytes_data = self._encode({None: payload})
+            self._set_patchset_bytes(self._get_patchset_id(checksum), bytes_data, ttl=ttl)
+            metrics.incr("nodestore.dedup.patchsets", tags={"written": "true"})
+            written += len(bytes_data)
+            total += len(bytes_data)
+            self._cache_patchset(checksum, now, payload, len(bytes_data))
+
+        return data, (written, total)
+
+    def _cache_patchset(self, checksum, written_at, payload, stored_size):
+        entry = (written_at, payload, stored_size, len(json_dumps(payload)))
+        with _patchset_cache_lock:
+            _patchset_cache.max_size = settings.SENTRY_NODESTORE_PATCHSET_CACHE_SIZE
+            _patchset_cache[(id(self), checksum)] = entry
+
+    def _get_patchsets(self, checksums):
+        rv = {}
+        missing = []
+        with _patchset_cache_lock:
+            for checksum in checksums:
+                entry = _patchset_cache.get((id(self), checksum))
+                if entry is not None:
+                    rv[checksum] = entry[1]
+                else:
+                    missing.append(checksum)
+
+        if missing:
+            patchset_ids = {self._get_patchset_id(checksum): checksum for checksum in missing}
+            for patchset_id, value in self._get_bytes_multi(list(patchset_ids)).items():
+                payload = self._decode(value, subkey=None)
+                if payload is None:
+                    continue
+                checksum = patchset_ids[patchset_id]
+                rv[checksum] = payload
+                self._cache_patchset(checksum, None, payload, len(value))
+
+        metrics.incr("nodestore.dedup.patchset_reads", amount=len(missing))
+        return rv
+
+    def _assemble_many(self, items):
+        """
+        Restores deduplicated interfaces of the nodes in ``items``, a mapping
+        of node IDs to nodes, in place. The patchsets they reference are read
+        with one ``_get_bytes_multi`` call.
+
+        Nodes with missing patchsets are replaced with ``None`` in ``items``.
+        Returning them without the interfaces would look like the events
+        never had them, but other nodes are still returned.
+        """
+        nodes = {
+            id: node
+            for id, node in items.items()
+            if isinstance(node, dict) and node.get(PATCHSETS_KEY)
+        }
+        if not nodes:
+            return
+
+        from sentry.eventstore.compressor import assemble
+
+        checksums = {checksum for node in nodes.values() for _, checksum, _ in node[PATCHSETS_KEY]}
+        patchsets = self._get_patchsets(checksums)
+        missing = checksums - patchsets.keys()
+        if missing:
+            metrics.incr("nodestore.dedup.missing_patchsets", amount=len(missing))
+
+        for id, node in nodes.items():
+            node_missing = {checksum for _, checksum, _ in node[PATCHSETS_KEY]} & missing
+            if node_missing:
+                logger.error(
+                    "nodestore.dedup.missing_patchsets",
+                    extra={"node_id": id, "checksums": sorted(node_missing)},
+                )
+                items[id] = None
+                continue
+            assemble(node, lambda checksums: patchsets)
+
     def cleanup(self, cutoff_timestamp):
         raise NotImplementedError
 
     def bootstrap(self):
         raise NotImplementedError
 
+    def _get_local_cache(self):
+        if not self.local_cache_size:
+            return None
+
+        caches = getattr(_local_cache, "caches", None)
+        if caches is None:
+            caches = _local_cache.caches = {}
+
+        cache = caches.get(id(self))
+        if cache is None:
+            cache = caches[id(self)] = LRUCache(self.local_cache_size)
+        return cache
+
     def _get_cache_item(self, id):
+        local_cache = self._get_local_cache()
+        if local_cache is not None and id in local_cache:
+            metrics.incr("nodestore.local_cache", tags={"result": "hit"}, skip_internal=True)
+            return json_loads(local_cache[id])
+
         if self.cache:
-            return self.cache.get(id)
+            rv = self.cache.get(id)
+            if local_cache is not None and rv:
+                local_cache[id] = json_dumps(rv)
+            return rv
 
     def _get_cache_items(self, id_list):
-        if self.cache:
-            return self.cache.get_many(id_list)
-        return {}
+        rv = {}
+        local_cache = self._get_local_cache()
+        if local_cache is not None:
+            rv.update((id, json_loads(local_cache[id])) for id in id_list if id in local_cache)
+            if rv:
+                metrics.incr(
+                    "nodestore.local_cache",
+                    amount=len(rv),
+                    tags={"result": "hit"},
+                    skip_internal=True,
+                )
+            id_list = [id for id in id_list if id not in rv]
+
+        if self.cache and id_list:
+            cache_items = self.cache.get_many(id_list)
+            if local_cache is not None:
+                local_cache.update((id, json_dumps(v)) for id, v in cache_items.items() if v)
+            rv.update(cache_items)
+
+        return rv
 
     def _set_cache_item(self, id, data):
+        local_cache = self._get_local_cache()
+        if local_cache is not None:
+            local_cache.pop(id, None)
+            if data:
+                local_cache[id] = json_dumps(data)
+
         if self.cache and data:
             self.cache.set(id, data)
 
     def _set_cache_items(self, items):
+        local_cache = self._get_local_cache()
+        if local_cache is not None:
+            local_cache.update((id, json_dumps(v)) for id, v in items.items() if v)
+
         if self.cache:
             self.cache.set_many(items)
 
     def _delete_cache_item(self, id):
+        local_cache = self._get_local_cache()
+        if local_cache is not None:
+            local_cache.pop(id, None)
+
         if self.cache:
             self.cache.delete(id)
 
     def _delete_cache_items(self, id_list):
+        local_cache = self._get_local_cache()
+        if local_cache is not None:
+            for id in id_list:
+                local_cache.pop(id, None)
+
         if self.cache:
             self.cache.delete_many([id for id in id_list])
 
@@ -18,6 +18,16 @@ class BigtableNodeStorage(NodeStorage):
         valid for reading + returning)
     :param compression: A boolean whether to enable zlib-compression, or the
         string "zstd" to use zstd.
+    :param fetch_concurrency: How many threads ``get_multi`` may use to read
+        rows concurrently. See ``NodeStorage``.
+    :param fetch_chunk_size: How many rows one concurrent read covers.
+    :param local_cache_size: How many decoded nodes to keep in memory for the
+        duration of the current request or task.
+    :param deduplicate_interfaces: Store repeating event interfaces only once.
+        See ``NodeStorage``.
+    :param node_compression: Passed to ``NodeStorage`` as ``compression``.
+        Use ``"zstd"`` together with ``compression_dictionaries`` for
+        dictionary compression, and disable ``compression`` in that case.
 
     >>> BigtableNodeStorage(
     ...     project='some-project',
@@ -38,8 +48,26 @@ class BigtableNodeStorage(NodeStorage):
         automatic_expiry=False,
         default_ttl=None,
         compression=False,
+        fetch_concurrency=1,
+        fetch_chunk_size=100,
+        local_cache_size=0,
+        deduplicate_interfaces=False,
+        patchset_refresh_interval=3600,
+        node_compression=None,
+        compression_dictionaries=None,
+        compression_level=3,
         **client_options,
     ):
+        super().__init__(
+            fetch_concurrency=fetch_concurrency,
+            fetch_chunk_size=fetch_chunk_size,
+            local_cache_size=local_cache_size,
+            deduplicate_interfaces=deduplicate_interfaces,
+            patchset_refresh_interval=patchset_refresh_interval,
+            compression=node_compression,
+            compression_dictionaries=compression_dictionaries,
+            compression_level=compression_level,
+        )
         if compression is True:
             compression = "zlib"
         elif compression is False:
@@ -67,6 +95,9 @@ class BigtableNodeStorage(NodeStorage):
     def _set_bytes(self, id, data, ttl=None):
         self.store.set(id, data, ttl)
 
+    def _set_patchset_bytes(self, id, data, ttl=None):
+        super()._set_patchset_bytes(id, data, ttl=ttl or self.store.default_ttl)
+
     def delete(self, id):
         if self.skip_deletes:
             return
@@ -1,6 +1,7 @@
 import logging
 import math
 import pickle
+from datetime import timedelta
 
 from django.utils import timezone
 
@@ -23,6 +24,7 @@ class DjangoNodeStorage(NodeStorage):
             return None
 
         try:
+            value = self.encoder.decode(value)
             if value.startswith(b"{"):
                 return NodeStorage._decode(self, value, subkey=subkey)
 
@@ -51,6 +53,12 @@ class DjangoNodeStorage(NodeStorage):
     def _set_bytes(self, id, data, ttl=None):
         create_or_update(Node, id=id, values={"data": compress(data), "timestamp": timezone.now()})
 
+    def _set_patchset_bytes(self, id, data, ttl=None):
+        # ``cleanup`` deletes by timestamp. Nodes written until the patchset
+        # is rewritten reference it, so it is dated to the end of that window.
+        timestamp = timezone.now() + timedelta(seconds=self.patchset_refresh_interval)
+        create_or_update(Node, id=id, values={"data": compress(data), "timestamp": timestamp})
+
     def cleanup(self, cutoff_timestamp):
         from sentry.db.deletion import BulkDeleteQuery
 
@@ -0,0 +1,168 @@
+"""
+Envelope encodings for nodestore payloads.
+
+Encoded payloads start with a header byte naming the encoding. Plain JSON
+payloads start with ``{`` and legacy pickled payloads of the Django backend
+with ``\\x80`` or a printable opcode, so payloads written before an encoding
+was enabled can always be told apart and are returned unchanged.
+"""
+
+import functools
+import os
+import time
+from typing import Mapping, Optional, Sequence
+
+import zstandard
+
+HEADER_ZSTD = b"\x01"
+HEADER_ZSTD_DICT = b"\x02"
+
+DICTIONARY_SUFFIX = ".dict"
+
+
+class UnknownDictionary(Exception):
+    pass
+
+
+def get_dictionary_filename(platform: str, dictionary: zstandard.ZstdCompressionDict) -> str:
+    return f"{platform}.{dictionary.dict_id()}{DICTIONARY_SUFFIX}"
+
+
+@functools.lru_cache(maxsize=None)
+def load_dictionaries(path: str) -> Mapping[str, Sequence[zstandard.ZstdCompressionDict]]:
+    """
+    Loads all ``<platform>.<dict_id>.dict`` files from ``path``, as written by
+    the ``train_nodestore_dictionaries`` command, and returns the dictionaries
+    of every platform from oldest to newest. Files from before dictionaries
+    were versioned (``<platform>.dict``) count as the oldest.
+    """
+    # platform -> [(versioned, dict_id, dictionary)]
+    found = {}
+    dict_ids = set()
+    for filename in sorted(os.listdir(path)):
+        if not filename.endswith(DICTIONARY_SUFFIX):
+            continue
+        with open(os.path.join(path, filename), "rb") as f:
+            dictionary = zstandard.ZstdCompressionDict(f.read())
+
+        name = filename[: -len(DICTIONARY_SUFFIX)]
+        platform, _, version = name.rpartition(".")
+        if not platform or not version.isdigit():
+            platform, version = name, None
+        elif int(version) != dictionary.dict_id():
+            raise ValueError(f"{filename} contains dictionary {dictionary.dict_id()}")
+
+        # Payloads only name the ID of their dictionary.
+        if dictionary.dict_id() in dict_ids:
+            raise ValueError(f"more than one dictionary with id {dictionary.dict_id()}")
+        dict_ids.add(dictionary.dict_id())
+
+        found.setdefault(platform, []).append(
+            (version is not None, dictionary.dict_id(), dictionary)
+        )
+
+    return {
+        platform: [dictionary for _, _, dictionary in sorted(entries, key=lambda x: x[:2])]
+        for platform, entries in found.items()
+    }
+
+
+def train_dictionary(
+    samples, dict_size=112640, level=3, dict_id=None
+) -> zstandard.ZstdCompressionDict:
+    """
+    Trains a dictionary from ``samples``. IDs default to the current time, so
+    newer dictionaries have larger IDs.
+    """
+    if dict_id is None:
+        dict_id = int(time.time())
+    return zstandard.train_dictionary(dict_size, samples, dict_id=dict_id, level=level)
+
+
+class NodeEncoder:
+    """
+    Wraps serialized nodes in an envelope.
+
+    :param compression: ``None`` to write payloads as they are, or ``"zstd"``
+        to compress them. Payloads of a platform that has a trained
+        dictionary are compressed with its newest dictionary.
+    :param dictionaries: A mapping of platform to its
+        ``zstandard.ZstdCompressionDict`` instances, oldest first (see
+        ``load_dictionaries``). Payloads name the dictionary they were
+        compressed with, so every dictionary that was ever used has to be
+        kept around for as long as nodes compressed with it are stored.
+    :param level: The zstd compression level.
+
+    Instances are not thread-safe. ``NodeStorage`` is thread-local and keeps
+    one encoder per thread.
+    """
+
+    def __init__(
+        self,
+        compression: Optional[str] = None,
+        dictionaries: Optional[Mapping[str, Sequence[zstandard.ZstdCompressionDict]]] = None,
+        level: int = 3,
+    ) -> None:
+        if compression not in (None, "zstd"):
+            raise ValueError(f"unsupported compression: {compression!r}")
+
+        self.compression = compression
+        self.level = level
+        self.dictionaries = {
+            platform: platform_dictionaries[-1]
+            for platform, platform_dictionaries in (dictionaries or {}).items()
+            if platform_dictionaries
+        }
+        self.dictionaries_by_id = {
+            d.dict_id(): d
+            for platform_dictionaries in (dictionaries or {}).values()
+            for d in platform_dictionaries
+        }
+        self._compressors = {}
+        self._decompressors = {}
+
+    def _get_compressor(self, platform: Optional[str]) -> zstandard.ZstdCompressor:
+        if platform not in self.dictionaries:
+            platform = None
+        compressor = self._compressors.get(platform)
+        if compressor is None:
+            if platform is None:
+                compressor = zstandard.ZstdCompressor(level=self.level)
+            else:
+                compressor = zstandard.ZstdCompressor(
+                    level=self.level, dict_data=self.dictionaries[platform]
+                )
+            self._compressors[platform] = compressor
+        return compressor
+
+    def _get_decompressor(self, dict_id: int) -> zstandard.ZstdDecompressor:
+        decompressor = self._decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id == 0:
+                decompressor = zstandard.ZstdDecompressor()
+            else:
+                try:
+                    dictionary = self.dictionaries_by_id[dict_id]
+                except KeyError:
+                    raise UnknownDictionary(f"no zstd dictionary with id {dict_id}")
+                decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+            self._decompressors[dict_id] = decompressor
+        return decompressor
+
+    def encode(self, value: bytes, platform: Optional[str] = None) -> bytes:
+        if self.compression is None:
+            return value
+
+        use_dictionary = platform in self.dictionaries
+        header = HEADER_ZSTD_DICT if use_dictionary else HEADER_ZSTD
+        return header + self._get_compressor(platform if use_dictionary else None).compress(value)
+
+    def decode(self, value: bytes) -> bytes:
+        header = value[:1]
+        if header == HEADER_ZSTD:
+            return self._get_decompressor(0).decompress(value[1:])
+        if header == HEADER_ZSTD_DICT:
+            frame = value[1:]
+            dict_id = zstandard.get_frame_parameters(frame).dict_id
+            return self._get_decompressor(dict_id).decompress(frame)
+        return value
@@ -217,6 +217,8 @@ register("snuba.search.max-pre-snuba-candidates", default=5000)
 register("snuba.search.chunk-growth-rate", default=1.5)
 register("snuba.search.max-chunk-size", default=2000)
 register("snuba.search.max-total-chunk-time-seconds", default=30.0)
+# Number of chunks fetched from snuba at once when post-filtering, after the first.
+register("snuba.search.parallel-chunks", default=1)
 register("snuba.search.hits-sample-size", default=100)
 register("snuba.track-outcomes-sample-rate", default=0.0)
 
@@ -354,6 +356,10 @@ register("processing.release-archive-min-files", default=10)
 # Try to read release artifacts from zip archives
 register("processing.use-release-archives-sample-rate", default=0.0)  # unused
 
+# Number of source files and source maps of an event the JavaScript processor fetches at
+# once. 1 fetches them one after the other.
+register("processing.javascript-fetch-concurrency", default=1)
+
 # All Relay options (statically authenticated Relays can be registered here)
 register("relay.static_auth", default={}, flags=FLAG_NOSTORE)
 
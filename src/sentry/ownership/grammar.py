@@ -1,7 +1,7 @@
 import operator
 import re
 from collections import namedtuple
-from functools import reduce
+from functools import lru_cache, reduce
 from typing import Iterable, List, Mapping, Pattern, Tuple
 
 from django.db.models import Q
@@ -233,6 +233,7 @@ class OwnershipVisitor(NodeVisitor):
         return children or node
 
 
+@lru_cache(maxsize=10000)
 def _path_to_regex(pattern: str) -> Pattern[str]:
     """
     ported from https://github.com/hmarr/codeowners/blob/d0452091447bd2a29ee508eebc5a79874fb5d4ff/match.go#L33
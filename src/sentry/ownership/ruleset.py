@@ -0,0 +1,201 @@
+"""
+Compiled ownership rules.
+
+Testing rules one at a time runs every rule against every frame of an
+event, which gets slow for CODEOWNERS files with thousands of lines.
+``OwnershipRuleset`` loads a schema once and collects the distinct paths and
+modules of an event up front, so that every rule looks at each value once.
+
+``codeowners`` rules are additionally indexed by a literal part of their
+pattern. A pattern containing a slash is anchored and can only match paths
+starting with its literal prefix (optionally after a slash), other patterns
+can only match where a path segment starts with their prefix or, if they
+start with a wildcard (e.g. ``*.py``), where a segment ends with their
+literal suffix. Each path is then looked up once per segment and distinct
+literal length, and only the rules found this way, plus the few without any
+literal part (e.g. ``*``), are tested with their regular expression.
+
+Compiled rulesets are kept per process, see ``get_ownership_ruleset``.
+"""
+
+import copy
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, Optional, Pattern, Sequence, Set, Tuple
+
+from sentry.utils import metrics
+from sentry.utils.datastructures import LRUCache
+from sentry.utils.glob import glob_match
+
+from .grammar import CODEOWNERS, MODULE, PATH, Rule, _iter_frames, _path_to_regex, load_schema
+
+PATH_KEYS = ("filename", "abs_path")
+
+ANCHOR_START = "start"
+ANCHOR_SEGMENT_START = "segment_start"
+ANCHOR_SEGMENT_END = "segment_end"
+
+_ruleset_cache = LRUCache(1000)
+_ruleset_cache_lock = threading.Lock()
+
+
+def get_codeowners_anchor(pattern: str) -> Optional[Tuple[str, str]]:
+    """
+    Returns ``(kind, literal)`` for a ``codeowners`` pattern, where every path
+    the pattern matches
+
+    * starts with ``literal`` (optionally after a slash) for ``ANCHOR_START``,
+    * has a segment starting with ``literal`` for ``ANCHOR_SEGMENT_START``,
+    * has a segment ending with ``literal`` for ``ANCHOR_SEGMENT_END``.
+
+    Mirrors ``_path_to_regex``.
+    """
+    if not pattern or pattern[0] == "\\":
+        return None
+
+    slash_pos = pattern.find("/")
+    anchored = slash_pos > -1 and slash_pos != len(pattern) - 1
+
+    pattern = pattern.rstrip("/")
+    if anchored and pattern[:1] == "/":
+        pattern = pattern[1:]
+
+    wildcards = [i for i, ch in enumerate(pattern) if ch in "*?"]
+    if not wildcards:
+        prefix = suffix = pattern
+    else:
+        prefix = pattern[: wildcards[0]]
+        suffix = pattern[wildcards[-1] + 1 :]
+
+    if prefix:
+        return (ANCHOR_START if anchored else ANCHOR_SEGMENT_START), prefix
+    if suffix and not anchored:
+        return ANCHOR_SEGMENT_END, suffix
+    return None
+
+
+class OwnershipRuleset:
+    """
+    The rules of an ownership schema, prepared for testing many events.
+    """
+
+    def __init__(self, rules: Sequence[Rule]) -> None:
+        self.rules = list(rules)
+        self._has_codeowners = False
+        # codeowners rules that have to be tested against every path
+        self._unindexed: List[int] = []
+        # anchor kind -> literal length -> literal -> rule positions
+        self._index: Dict[str, Dict[int, Dict[str, List[int]]]] = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(list))
+        )
+        self._regexes: Dict[int, Pattern[str]] = {}
+
+        for position, rule in enumerate(self.rules):
+            if rule.matcher.type != CODEOWNERS:
+                continue
+
+            self._has_codeowners = True
+            anchor = get_codeowners_anchor(rule.matcher.pattern)
+            if anchor is None:
+                self._unindexed.append(position)
+                continue
+
+            kind, literal = anchor
+            self._index[kind][len(literal)][literal].append(position)
+
+    @classmethod
+    def from_schema(cls, schema: Mapping[str, Any]) -> "OwnershipRuleset":
+        return cls(load_schema(schema))
+
+    def _get_regex(self, position: int) -> Pattern[str]:
+        regex = self._regexes.get(position)
+        if regex is None:
+            regex = self._regexes[position] = _path_to_regex(self.rules[position].matcher.pattern)
+        return regex
+
+    def _get_codeowners_candidates(self, path: str) -> Set[int]:
+        candidates = set(self._unindexed)
+
+        starts = [path]
+        if path[:1] == "/":
+            starts.append(path[1:])
+        for length, literals in self._index.get(ANCHOR_START, {}).items():
+            for value in starts:
+                candidates.update(literals.get(value[:length], ()))
+
+        # Literals at the start of a segment may span several segments.
+        offsets = [0]
+        offsets.extend(i + 1 for i, ch in enumerate(path) if ch == "/")
+        for length, literals in self._index.get(ANCHOR_SEGMENT_START, {}).items():
+            for offset in offsets:
+                candidates.update(literals.get(path[offset : offset + length], ()))
+
+        segments = path.split("/")
+        for length, literals in self._index.get(ANCHOR_SEGMENT_END, {}).items():
+            for segment in segments:
+                candidates.update(literals.get(segment[-length:], ()))
+
+        return candidates
+
+    def _get_codeowners_matches(self, paths: Set[str]) -> Set[int]:
+        matched: Set[int] = set()
+        for path in paths:
+            for position in self._get_codeowners_candidates(path) - matched:
+                if self._get_regex(position).search(path):
+                    matched.add(position)
+        return matched
+
+    def get_matching_rules(self, data: Mapping[str, Any]) -> List[Rule]:
+        """
+        Returns the rules matching the event ``data`` in schema order, same as
+        testing every rule with ``Rule.test``.
+        """
+        paths = set()
+        modules = set()
+        for frame in _iter_frames(data):
+            path = next((frame.get(key) for key in PATH_KEYS if frame.get(key)), None)
+            if path:
+                paths.add(path)
+            module = frame.get("module")
+            if module:
+                modules.add(module)
+
+        codeowners = self._get_codeowners_matches(paths) if self._has_codeowners else set()
+
+        rv = []
+        for position, rule in enumerate(self.rules):
+            matcher = rule.matcher
+            if matcher.type == CODEOWNERS:
+                matches = position in codeowners
+            elif matcher.type in (PATH, MODULE):
+                matches = any(
+                    glob_match(value, matcher.pattern, ignorecase=True, path_normalize=True)
+                    for value in (paths if matcher.type == PATH else modules)
+                )
+            else:
+                matches = matcher.test(data)
+
+            if matches:
+                rv.append(rule)
+
+        return rv
+
+
+def get_ownership_ruleset(key: Any, schema: Mapping[str, Any]) -> OwnershipRuleset:
+    """
+    Returns the compiled ruleset for ``schema``. ``key`` identifies where the
+    schema comes from, the ruleset last compiled for it is reused as long as
+    the schema is unchanged.
+    """
+    with _ruleset_cache_lock:
+        cached = _ruleset_cache.get(key)
+
+    if cached is not None and cached[0] == schema:
+        metrics.incr("ownership.ruleset_cache.hit")
+        return cached[1]
+
+    metrics.incr("ownership.ruleset_cache.miss")
+    ruleset = OwnershipRuleset.from_schema(schema)
+    with _ruleset_cache_lock:
+        _ruleset_cache[key] = (copy.deepcopy(schema), ruleset)
+    return ruleset
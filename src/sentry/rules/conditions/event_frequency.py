@@ -10,6 +10,7 @@ from sentry import release_health, tsdb
 from sentry.receivers.rules import DEFAULT_RULE_LABEL
 from sentry.rules.conditions.base import EventCondition
 from sentry.utils import metrics
+from sentry.utils.dates import to_datetime
 from sentry.utils.snuba import options_override
 
 standard_intervals = {
@@ -76,13 +77,134 @@ class EventFrequencyForm(forms.Form):
             return
 
 
+class FrequencyQueryBatch:
+    """
+    Fetches the TSDB queries of the frequency conditions of all rules that
+    are evaluated for an event together.
+
+    Conditions register the windows they are going to query up front and
+    then query the batch in place of the TSDB. They all end their windows at
+    ``now``, so identical windows of different rules are fetched once. Sums
+    of windows with the same rollup that overlap or touch (e.g. a window and
+    its percent comparison window) are taken from a single ``get_range``
+    call, which is made once the first of them is queried. Queries that were
+    not registered go to the TSDB.
+    """
+
+    def __init__(self, tsdb=tsdb, now=None):
+        self.tsdb = tsdb
+        self.models = tsdb.models
+        self.now = now if now is not None else timezone.now()
+        self._pending = set()
+        self._results = {}
+
+    def add_sums(self, model, key, start, end, environment_id=None):
+        self._add(("get_sums", model, key, start, end, environment_id))
+
+    def add_distinct_counts_totals(self, model, key, start, end, environment_id=None):
+        self._add(("get_distinct_counts_totals", model, key, start, end, environment_id))
+
+    def _add(self, request):
+        if request not in self._results:
+            self._pending.add(request)
+
+    def get_sums(self, model, keys, start, end, rollup=None, environment_id=None, use_cache=False):
+        return self._get("get_sums", model, keys, start, end, rollup, environment_id, use_cache)
+
+    def get_distinct_counts_totals(
+        self, model, keys, start, end=None, rollup=None, environment_id=None, use_cache=False
+    ):
+        return self._get(
+            "get_distinct_counts_totals", model, keys, start, end, rollup, environment_id, use_cache
+        )
+
+    def _get(self, method, model, keys, start, end, rollup, environment_id, use_cache):
+        if rollup is None and len(keys) == 1:
+            request = (method, model, keys[0], start, end, environment_id)
+            if request in self._pending:
+                self._fetch(request)
+            if request in self._results:
+                return {keys[0]: self._results[request]}
+
+        return getattr(self.tsdb, method)(
+            model=model,
+            keys=keys,
+            start=start,
+            end=end,
+            rollup=rollup,
+            environment_id=environment_id,
+            use_cache=use_cache,
+        )
+
+    def _fetch(self, request):
+        method, model, key, start, end, environment_id = request
+        self._pending.discard(request)
+
+        if method != "get_sums":
+            self._results[request] = getattr(self.tsdb, method)(
+                model=model,
+                keys=[key],
+                start=start,
+                end=end,
+                environment_id=environment_id,
+                use_cache=True,
+            )[key]
+            return
+
+        # ``get_sums`` adds up the buckets of ``get_range`` at the optimal
+        # rollup of the window, so windows with the same rollup can share
+        # the buckets of one query.
+        rollup, series = self.tsdb.get_optimal_rollup_series(start, end)
+        candidates = {}
+        for other in self._pending:
+            if other[:3] == request[:3] and other[5] == environment_id:
+                other_rollup, other_series = self.tsdb.get_optimal_rollup_series(other[3], other[4])
+                if other_rollup == rollup:
+                    candidates[other] = other_series
+
+        windows = {request: series}
+        first, last = series[0], series[-1]
+        merged = True
+        while merged:
+            merged = False
+            for other, other_series in candidates.items():
+                if (
+                    other not in windows
+                    and other_series[0] <= last + rollup
+                    and other_series[-1] >= first - rollup
+                ):
+                    windows[other] = other_series
+                    first = min(first, other_series[0])
+                    last = max(last, other_series[-1])
+                    merged = True
+
+        with metrics.timer("rules.conditions.batch.get_range", tags={"windows": len(windows)}):
+            points = dict(
+                self.tsdb.get_range(
+                    model=model,
+                    keys=[key],
+                    start=to_datetime(first),
+                    end=to_datetime(last),
+                    rollup=rollup,
+                    environment_ids=[environment_id] if environment_id is not None else None,
+                    use_cache=True,
+                )[key]
+            )
+
+        for other, other_series in windows.items():
+            self._pending.discard(other)
+            self._results[other] = sum(points.get(ts, 0) for ts in other_series)
+
+
 class BaseEventFrequencyCondition(EventCondition):
     intervals = standard_intervals
     form_cls = EventFrequencyForm
     label = NotImplemented  # subclass must implement
 
     def __init__(self, *args, **kwargs):
-        self.tsdb = kwargs.pop("tsdb", tsdb)
+        # With a ``FrequencyQueryBatch``, queries go through the batch
+        self.batch = kwargs.pop("batch", None)
+        self.tsdb = kwargs.pop("tsdb", tsdb) if self.batch is None else self.batch
         self.form_fields = {
             "value": {"type": "number", "placeholder": 100},
             "interval": {
@@ -127,19 +249,40 @@ class BaseEventFrequencyCondition(EventCondition):
         """ """
         raise NotImplementedError  # subclass must implement
 
-    def get_rate(self, event, interval, environment_id):
+    def batch_hook(self, event, start, end, environment_id):
+        """Registers the TSDB query ``query_hook`` makes with ``self.batch``."""
+
+    def add_to_batch(self, event):
+        """Registers the TSDB queries ``passes`` makes with ``self.batch``."""
+        interval = self.get_option("interval")
+        if not interval:
+            return
+
+        for start, end in self.get_query_windows(interval, self.batch.now):
+            self.batch_hook(event, start, end, self.rule.environment_id)
+
+    def get_query_windows(self, interval, end):
         _, duration = self.intervals[interval]
-        end = timezone.now()
-        result = self.query(event, end - duration, end, environment_id=environment_id)
+        windows = [(end - duration, end)]
         comparison_type = self.get_option("comparisonType", COMPARISON_TYPE_COUNT)
         if comparison_type == COMPARISON_TYPE_PERCENT:
             comparison_interval = comparison_intervals[self.get_option("comparisonInterval")][1]
             comparison_end = end - comparison_interval
+            windows.append((comparison_end - duration, comparison_end))
+        return windows
+
+    def get_rate(self, event, interval, environment_id):
+        end = self.batch.now if self.batch is not None else timezone.now()
+        windows = self.get_query_windows(interval, end)
+        start, end = windows[0]
+        result = self.query(event, start, end, environment_id=environment_id)
+        if len(windows) > 1:
+            comparison_start, comparison_end = windows[1]
             # TODO: Figure out if there's a way we can do this less frequently. All queries are
             # automatically cached for 10s. We could consider trying to cache this and the main
             # query for 20s to reduce the load.
             comparison_result = self.query(
-                event, comparison_end - duration, comparison_end, environment_id=environment_id
+                event, comparison_start, comparison_end, environment_id=environment_id
             )
             result = (
                 int(max(0, ((result / comparison_result) * 100) - 100))
@@ -174,6 +317,9 @@ class EventFrequencyCondition(BaseEventFrequencyCondition):
             use_cache=True,
         )[event.group_id]
 
+    def batch_hook(self, event, start, end, environment_id):
+        self.batch.add_sums(self.tsdb.models.group, event.group_id, start, end, environment_id)
+
 
 class EventUniqueUserFrequencyCondition(BaseEventFrequencyCondition):
     label = "The issue is seen by more than {value} users in {interval}"
@@ -188,6 +334,11 @@ class EventUniqueUserFrequencyCondition(BaseEventFrequencyCondition):
             use_cache=True,
         )[event.group_id]
 
+    def batch_hook(self, event, start, end, environment_id):
+        self.batch.add_distinct_counts_totals(
+            self.tsdb.models.users_affected_by_group, event.group_id, start, end, environment_id
+        )
+
 
 percent_intervals = {
     "1m": ("1 minute", timedelta(minutes=1)),
@@ -283,3 +434,6 @@ class EventFrequencyPercentCondition(BaseEventFrequencyCondition):
             return 100 * round(issue_count / avg_sessions_in_interval, 4)
 
         return 0
+
+    def batch_hook(self, event, start, end, environment_id):
+        self.batch.add_sums(self.tsdb.models.group, event.group_id, start, end, environment_id)
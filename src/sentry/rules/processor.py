@@ -10,6 +10,7 @@ from django.utils import timezone
 from sentry import analytics
 from sentry.models import GroupRuleStatus, Rule
 from sentry.rules import EventState, rules
+from sentry.rules.conditions.event_frequency import BaseEventFrequencyCondition, FrequencyQueryBatch
 from sentry.utils.hashlib import hash_values
 from sentry.utils.safe import safe_execute
 
@@ -30,6 +31,7 @@ class RuleProcessor:
         self.has_reappeared = has_reappeared
 
         self.grouped_futures = {}
+        self.frequency_batch = None
 
     def get_rules(self):
         """
@@ -106,9 +108,22 @@ class RuleProcessor:
             self.logger.warning("Unregistered condition %r", condition["id"])
             return
 
-        condition_inst = condition_cls(self.project, data=condition, rule=rule)
+        condition_inst = self.get_condition_instance(condition_cls, condition, rule)
         return safe_execute(condition_inst.passes, self.event, state, _with_transaction=False)
 
+    def get_condition_instance(self, condition_cls, condition, rule):
+        if self.frequency_batch is not None and issubclass(
+            condition_cls, BaseEventFrequencyCondition
+        ):
+            return condition_cls(
+                self.project, data=condition, rule=rule, batch=self.frequency_batch
+            )
+        return condition_cls(self.project, data=condition, rule=rule)
+
+    def is_frequency_condition(self, condition):
+        condition_cls = rules.get(condition["id"])
+        return condition_cls is not None and issubclass(condition_cls, BaseEventFrequencyCondition)
+
     def get_rule_type(self, condition):
         rule_cls = rules.get(condition["id"])
         if rule_cls is None:
@@ -134,6 +149,51 @@ class RuleProcessor:
             return lambda bool_iter: not any(bool_iter)
         return None
 
+    def is_rule_muted(self, rule, status, now):
+        """
+        Rules only apply to events of their environment, and at most once
+        every `frequency` minutes.
+        """
+        if (
+            rule.environment_id is not None
+            and self.event.get_environment().id != rule.environment_id
+        ):
+            return True
+
+        frequency = rule.data.get("frequency") or Rule.DEFAULT_FREQUENCY
+        freq_offset = now - timedelta(minutes=frequency)
+        return bool(status.last_active and status.last_active > freq_offset)
+
+    def add_rule_to_batch(self, rule, status):
+        """
+        Registers the TSDB queries of the frequency conditions of the rule
+        with `frequency_batch`, so they can be fetched together with those of
+        the other rules.
+        """
+        if self.is_rule_muted(rule, status, self.frequency_batch.now):
+            return
+
+        for condition in rule.data.get("conditions", ()):
+            if not self.is_frequency_condition(condition):
+                continue
+
+            condition_cls = rules.get(condition["id"])
+            condition_inst = self.get_condition_instance(condition_cls, condition, rule)
+            safe_execute(condition_inst.add_to_batch, self.event, _with_transaction=False)
+
+    def filters_pass(self, filter_list, filter_match, state, rule):
+        # if filters exist evaluate them, otherwise pass
+        if not filter_list:
+            return True
+
+        filter_iter = (self.condition_matches(f, state, rule) for f in filter_list)
+        filter_func = self.get_match_function(filter_match)
+        if filter_func:
+            return filter_func(filter_iter)
+
+        self.logger.error("Unsupported filter_match %r for rule %d", filter_match, rule.id)
+        return False
+
     def apply_rule(self, rule, status):
         """
         If all conditions and filters pass, execute every action.
@@ -146,15 +206,9 @@ class RuleProcessor:
         rule_condition_list = rule.data.get("conditions", ())
         frequency = rule.data.get("frequency") or Rule.DEFAULT_FREQUENCY
 
-        if (
-            rule.environment_id is not None
-            and self.event.get_environment().id != rule.environment_id
-        ):
-            return
-
         now = timezone.now()
         freq_offset = now - timedelta(minutes=frequency)
-        if status.last_active and status.last_active > freq_offset:
+        if self.is_rule_muted(rule, status, now):
             return
 
         state = self.get_state()
@@ -167,13 +221,32 @@ class RuleProcessor:
             else:
                 filter_list.append(rule_cond)
 
+        filter_results = []
+
+        def filters_pass():
+            if not filter_results:
+                filter_results.append(self.filters_pass(filter_list, filter_match, state, rule))
+            return filter_results[0]
+
         # if conditions exist evaluate them, otherwise move to the filters section
         if condition_list:
-            condition_iter = (self.condition_matches(c, state, rule) for c in condition_list)
+            # Frequency conditions query TSDB, so they go last and are only
+            # evaluated if the other conditions leave the match undecided and
+            # the filters pass. If the filters fail, the rule does not apply
+            # no matter what the conditions say.
+            frequency_conditions = [c for c in condition_list if self.is_frequency_condition(c)]
+            other_conditions = [c for c in condition_list if c not in frequency_conditions]
+
+            def condition_iter():
+                for c in other_conditions:
+                    yield self.condition_matches(c, state, rule)
+                if frequency_conditions and filters_pass():
+                    for c in frequency_conditions:
+                        yield self.condition_matches(c, state, rule)
 
             condition_func = self.get_match_function(condition_match)
             if condition_func:
-                condition_passed = condition_func(condition_iter)
+                condition_passed = condition_func(condition_iter())
             else:
                 self.logger.error(
                     "Unsupported condition_match %r for rule %d", condition_match, rule.id
@@ -183,17 +256,7 @@ class RuleProcessor:
             if not condition_passed:
                 return
 
-        # if filters exist evaluate them, otherwise pass
-        if filter_list:
-            filter_iter = (self.condition_matches(f, state, rule) for f in filter_list)
-            filter_func = self.get_match_function(filter_match)
-            if filter_func:
-                passed = filter_func(filter_iter)
-            else:
-                self.logger.error("Unsupported filter_match %r for rule %d", filter_match, rule.id)
-                return
-        else:
-            passed = True
+        passed = filters_pass()
 
         if passed:
             passed = (
@@ -245,6 +308,11 @@ class RuleProcessor:
         self.grouped_futures.clear()
         rules = self.get_rules()
         rule_statuses = self.bulk_get_rule_status(rules)
+
+        self.frequency_batch = FrequencyQueryBatch()
+        for rule in rules:
+            self.add_rule_to_batch(rule, rule_statuses[rule.id])
+
         for rule in rules:
             self.apply_rule(rule, rule_statuses[rule.id])
         return self.grouped_futures.values()
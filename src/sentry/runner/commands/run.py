@@ -485,6 +485,12 @@ def batching_kafka_options(group):
     default=None,
     help="Thread pool size (only utilitized for message types that support concurrent processing)",
 )
+@click.option(
+    "--batch-save",
+    default=False,
+    is_flag=True,
+    help="Save events that need no processing (transactions) in the consumer, batched per consumed batch, instead of spawning one save_event task per event.",
+)
 @configuration
 def ingest_consumer(consumer_types, all_consumer_types, **options):
     """
@@ -121,7 +121,60 @@ class AbstractQueryExecutor(metaclass=ABCMeta):
         * a sorted list of (group_id, group_score) tuples sorted descending by score,
         * the count of total results (rows) available for this query.
         """
+        query, sort_field = self._get_snuba_search_query(
+            start=start,
+            end=end,
+            project_ids=project_ids,
+            environment_ids=environment_ids,
+            sort_field=sort_field,
+            organization_id=organization_id,
+            cursor=cursor,
+            group_ids=group_ids,
+            limit=limit,
+            offset=offset,
+            get_sample=get_sample,
+            search_filters=search_filters,
+        )
+        snuba_results = snuba.aliased_query(**query)
+        return self._get_snuba_search_results(snuba_results, sort_field, get_sample)
+
+    def bulk_snuba_search(self, chunks, **kwargs):
+        """
+        Same as `snuba_search` for several `(limit, offset)` chunks of the
+        same search, which are queried concurrently. Returns the results in
+        the order of `chunks`.
+        """
+        queries = [
+            self._get_snuba_search_query(limit=limit, offset=offset, **kwargs)
+            for limit, offset in chunks
+        ]
+        results = snuba.bulk_aliased_query(
+            [query for query, _ in queries], referrer=queries[0][0]["referrer"]
+        )
+        return [
+            self._get_snuba_search_results(snuba_results, sort_field, kwargs.get("get_sample"))
+            for snuba_results, (_, sort_field) in zip(results, queries)
+        ]
 
+    def _get_snuba_search_query(
+        self,
+        start,
+        end,
+        project_ids,
+        environment_ids,
+        sort_field,
+        organization_id,
+        cursor=None,
+        group_ids=None,
+        limit=None,
+        offset=0,
+        get_sample=False,
+        search_filters=None,
+    ):
+        """
+        Returns the arguments to `aliased_query` for `snuba_search`, and the
+        field the results are sorted by.
+        """
         filters = {"project_id": project_ids}
 
         environments = None
@@ -199,7 +252,7 @@ class AbstractQueryExecutor(metaclass=ABCMeta):
             ]  # ensure stable sort within the same score
             referrer = "search"
 
-        snuba_results = snuba.aliased_query(
+        query = dict(
             dataset=self.dataset,
             start=start,
             end=end,
@@ -218,6 +271,9 @@ class AbstractQueryExecutor(metaclass=ABCMeta):
             sample=1,  # Don't use clickhouse sampling, even when in turbo mode.
             condition_resolver=snuba.get_snuba_column_name,
         )
+        return query, sort_field
+
+    def _get_snuba_search_results(self, snuba_results, sort_field, get_sample):
         rows = snuba_results["data"]
         total = snuba_results["totals"]["total"]
 
@@ -432,6 +488,26 @@ class PostgresSnubaQueryExecutor(AbstractQueryExecutor):
         max_time = options.get("snuba.search.max-total-chunk-time-seconds")
         time_start = time.time()
 
+        search_kwargs = dict(
+            start=start,
+            end=end,
+            project_ids=[p.id for p in projects],
+            environment_ids=environments and [environment.id for environment in environments],
+            organization_id=projects[0].organization_id,
+            sort_field=sort_field,
+            cursor=cursor,
+            group_ids=group_ids,
+            search_filters=search_filters,
+        )
+        # When post-filtering needs more than one chunk, the following chunks
+        # are fetched several at once, assuming that every chunk is full. They
+        # are only used if the loop asks for the very same chunk, so results
+        # are the same as fetching one chunk at a time.
+        parallel_chunks = options.get("snuba.search.parallel-chunks")
+        # {(chunk_limit, offset): (snuba_groups, total), ...}
+        prefetched_chunks = {}
+        num_prefetched_chunks = 0
+
         # Do smaller searches in chunks until we have enough results
         # to answer the query (or hit the end of possible results). We do
         # this because a common case for search is to return 100 groups
@@ -448,19 +524,26 @@ class PostgresSnubaQueryExecutor(AbstractQueryExecutor):
             chunk_limit = max(chunk_limit, len(group_ids))
 
             # {group_id: group_score, ...}
-            snuba_groups, total = self.snuba_search(
-                start=start,
-                end=end,
-                project_ids=[p.id for p in projects],
-                environment_ids=environments and [environment.id for environment in environments],
-                organization_id=projects[0].organization_id,
-                sort_field=sort_field,
-                cursor=cursor,
-                group_ids=group_ids,
-                limit=chunk_limit,
-                offset=offset,
-                search_filters=search_filters,
-            )
+            if (chunk_limit, offset) in prefetched_chunks:
+                snuba_groups, total = prefetched_chunks.pop((chunk_limit, offset))
+                num_prefetched_chunks += 1
+            elif parallel_chunks > 1 and not group_ids and num_chunks > 1:
+                chunks = [(chunk_limit, offset)]
+                while len(chunks) < parallel_chunks:
+                    prev_limit, prev_offset = chunks[-1]
+                    chunks.append(
+                        (
+                            min(int(prev_limit * chunk_growth), max_chunk_size),
+                            prev_offset + prev_limit,
+                        )
+                    )
+                results = self.bulk_snuba_search(chunks, **search_kwargs)
+                snuba_groups, total = results[0]
+                prefetched_chunks = dict(zip(chunks[1:], results[1:]))
+            else:
+                snuba_groups, total = self.snuba_search(
+                    limit=chunk_limit, offset=offset, **search_kwargs
+                )
             metrics.timing("snuba.search.num_snuba_results", len(snuba_groups))
             count = len(snuba_groups)
             more_results = count >= limit and (offset + limit) < total
@@ -531,6 +614,10 @@ class PostgresSnubaQueryExecutor(AbstractQueryExecutor):
             paginator_results.prev.has_results = True
 
         metrics.timing("snuba.search.num_chunks", num_chunks)
+        if parallel_chunks > 1 and num_chunks > 1:
+            # Every prefetched chunk that was used saved a round trip to snuba.
+            metrics.timing("snuba.search.num_prefetched_chunks", num_prefetched_chunks)
+            metrics.timing("snuba.search.num_wasted_chunks", len(prefetched_chunks))
 
         groups = Group.objects.in_bulk(paginator_results.results)
         paginator_results.results = [groups[k] for k in paginator_results.results if k in groups]
@@ -22,6 +22,7 @@ from sentry.search.events.fields import (
     resolve_field_list,
 )
 from sentry.search.events.filter import get_filter
+from sentry.snuba import timeseries_cache
 from sentry.tagstore.base import TOP_VALUES_DEFAULT_LIMIT
 from sentry.utils.compat import filter
 from sentry.utils.math import mean, nice_int
@@ -106,20 +107,17 @@ def zerofill(data, start, end, rollup, orderby):
     data_by_time = {}
 
     for obj in data:
-        if obj["time"] in data_by_time:
-            data_by_time[obj["time"]].append(obj)
-        else:
-            data_by_time[obj["time"]] = [obj]
+        data_by_time.setdefault(obj["time"], []).append(obj)
 
     for key in range(start, end, rollup):
-        if key in data_by_time and len(data_by_time[key]) > 0:
-            rv = rv + data_by_time[key]
-            data_by_time[key] = []
+        rows = data_by_time.get(key)
+        if rows:
+            rv.extend(rows)
         else:
             rv.append({"time": key})
 
     if "-time" in orderby:
-        return list(reversed(rv))
+        rv.reverse()
 
     return rv
 
@@ -525,7 +523,9 @@ def timeseries_query(
             comp_query_params.start -= comparison_delta
             comp_query_params.end -= comparison_delta
             query_params_list.append(comp_query_params)
-        query_results = bulk_raw_query(query_params_list, referrer=referrer)
+        query_results = timeseries_cache.bulk_timeseries_query(
+            query_params_list, referrer=referrer, query_fn=bulk_raw_query
+        )
 
     with sentry_sdk.start_span(
         op="discover.discover", description="timeseries.transform_results"
@@ -752,10 +752,16 @@ def top_events_timeseries(
                 "limit": 10000,
                 "referrer": referrer + ".other",
             }
-            result, other_result = bulk_raw_query(
+            result, other_result = timeseries_cache.bulk_timeseries_query(
                 [SnubaQueryParams(**top_5_query), SnubaQueryParams(**other_query)],
                 referrer=referrer,
+                query_fn=bulk_raw_query,
             )
+        elif timeseries_cache.is_enabled():
+            (result,) = timeseries_cache.bulk_timeseries_query(
+                [SnubaQueryParams(**top_5_query)], referrer=referrer, query_fn=bulk_raw_query
+            )
+            other_result = {"data": []}
         else:
             result = raw_query(**top_5_query)
             other_result = {"data": []}
@@ -0,0 +1,255 @@
+"""
+Caches the closed rollup buckets of timeseries queries.
+
+Dashboards refresh their timeseries over and over again, with windows that
+mostly consist of buckets that have long been closed. The rows of those
+buckets are kept per query (everything but the time window, see
+``get_fingerprint``), and only the buckets that aren't cached, plus the
+still open ones at the end of the window, are queried from Snuba.
+
+A bucket counts as closed once it ends at least
+``SENTRY_DISCOVER_TIMESERIES_CACHE_CLOSED_LAG_SECONDS`` in the past. Only
+buckets that lie completely within the window are cached, as Snuba counts
+just the part of a bucket that overlaps the window. The first bucket of
+windows that don't start on a bucket boundary is queried separately.
+"""
+
+import math
+from copy import deepcopy
+from hashlib import sha1
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from sentry.utils import json, metrics
+from sentry.utils.dates import to_datetime, to_timestamp
+from sentry.utils.snuba import (
+    SnubaQueryParams,
+    bulk_raw_query,
+    naiveify_datetime,
+    to_naive_timestamp,
+)
+
+# Entries keep at most this many buckets, the most recent ones win.
+MAX_CACHED_BUCKETS = 2000
+
+
+def get_fingerprint(query_params: SnubaQueryParams) -> Optional[str]:
+    """
+    Returns the key the buckets of ``query_params`` are cached under, or
+    ``None`` if the query can't be cached.
+    """
+    if not query_params.rollup or query_params.groupby[:1] != ["time"]:
+        return None
+    if query_params.start is None or query_params.end is None:
+        return None
+    # Snuba moves the start of queries for issues to when the issue was
+    # first seen, which breaks the assumptions about the window.
+    if "group_id" in query_params.filter_keys:
+        return None
+
+    hashable = json.dumps(
+        {
+            "dataset": query_params.dataset.value,
+            "groupby": query_params.groupby,
+            "conditions": query_params.conditions,
+            "filter_keys": query_params.filter_keys,
+            "aggregations": query_params.aggregations,
+            "rollup": query_params.rollup,
+            "is_grouprelease": query_params.is_grouprelease,
+            "kwargs": query_params.kwargs,
+        }
+    )
+    return f"tsc:{sha1(hashable.encode('utf-8')).hexdigest()}"
+
+
+class _CachedQuery:
+    def __init__(self, query_params: SnubaQueryParams, fingerprint: str, now: float) -> None:
+        self.query_params = query_params
+        self.fingerprint = fingerprint
+        rollup = query_params.rollup
+        self.start = to_naive_timestamp(naiveify_datetime(query_params.start))
+        self.end = to_naive_timestamp(naiveify_datetime(query_params.end))
+        closed = min(self.end, now - settings.SENTRY_DISCOVER_TIMESERIES_CACHE_CLOSED_LAG_SECONDS)
+
+        # The buckets from ``first_bucket`` up to ``closed_end`` are
+        # completely within the window and closed.
+        self.first_bucket = math.ceil(self.start / rollup) * rollup
+        self.closed_end = max(self.first_bucket, math.floor(closed / rollup) * rollup)
+        self.entry: Dict[str, Any] = {"meta": None, "buckets": {}}
+        self.tail_start = self.first_bucket
+        self.cached_rows: List[Mapping[str, Any]] = []
+
+    def load(self, entry: Dict[str, Any]) -> None:
+        """
+        Uses the cache ``entry`` (see ``load_entry``), which is shared and
+        updated by all queries with the same fingerprint. The cached rows are
+        copied, since other queries may update the entry before ``merge``.
+        """
+        self.entry = entry
+        buckets = entry["buckets"]
+        rollup = self.query_params.rollup
+        tail_start = self.first_bucket
+        while tail_start < self.closed_end and tail_start in buckets:
+            tail_start += rollup
+        self.tail_start = tail_start
+        self.cached_rows = [
+            dict(row) for ts in range(self.first_bucket, tail_start, rollup) for row in buckets[ts]
+        ]
+
+    def get_query_params(self) -> List[SnubaQueryParams]:
+        """
+        Returns the queries for the missing parts of the window: the part of
+        the first bucket within the window if the window doesn't start on a
+        bucket boundary, and everything from the first bucket missing from
+        the cache.
+        """
+        if self.tail_start == self.first_bucket:
+            return [deepcopy(self.query_params)]
+
+        rv = []
+        if self.start < self.first_bucket:
+            rv.append(self._copy_query_params(self.query_params.start, self.first_bucket))
+        if self.tail_start < self.end:
+            rv.append(self._copy_query_params(self.tail_start, self.query_params.end))
+        return rv
+
+    def _copy_query_params(self, start, end) -> SnubaQueryParams:
+        query_params = deepcopy(self.query_params)
+        query_params.start = start if not isinstance(start, int) else to_datetime(start)
+        query_params.end = end if not isinstance(end, int) else to_datetime(end)
+        return query_params
+
+    def merge(self, results: Sequence[Mapping[str, Any]]) -> Tuple[Mapping[str, Any], bool]:
+        """
+        Returns the result for the whole window from the results of the
+        queries of ``get_query_params``, and whether the cache entry was
+        updated.
+        """
+        rollup = self.query_params.rollup
+        buckets = self.entry["buckets"]
+
+        head: Sequence[Mapping[str, Any]] = ()
+        tail: Mapping[str, Any] = {"data": [], "meta": self.entry["meta"]}
+        if self.tail_start == self.first_bucket:
+            (tail,) = results
+        elif self.tail_start < self.end:
+            *head, tail = results
+        else:
+            head = results
+
+        data = []
+        for result in head:
+            data.extend(result["data"])
+        data.extend(self.cached_rows)
+        data.extend(tail["data"])
+
+        # Results that hit the limit may be missing buckets.
+        limit = self.query_params.kwargs.get("limit")
+        updated = False
+        if self.tail_start < self.closed_end and (limit is None or len(tail["data"]) < limit):
+            for ts in range(self.tail_start, self.closed_end, rollup):
+                buckets[ts] = []
+            for row in tail["data"]:
+                if row["time"] in buckets and self.tail_start <= row["time"] < self.closed_end:
+                    buckets[row["time"]].append(row)
+            self.entry["meta"] = tail.get("meta")
+            updated = True
+
+        result = dict(tail)
+        result["data"] = data
+        return result, updated
+
+
+def load_entry(value: Optional[str]) -> Dict[str, Any]:
+    if value is None:
+        return {"meta": None, "buckets": {}}
+
+    entry = json.loads(value)
+    return {
+        "meta": entry["meta"],
+        "buckets": {int(ts): rows for ts, rows in entry["buckets"].items()},
+    }
+
+
+def dump_entry(entry: Mapping[str, Any]) -> str:
+    # Trimmed only once all queries sharing the entry have been merged.
+    buckets = sorted(entry["buckets"].items())[-MAX_CACHED_BUCKETS:]
+    return json.dumps(
+        {
+            "meta": entry["meta"],
+            "buckets": {str(ts): rows for ts, rows in buckets},
+        }
+    )
+
+
+def is_enabled() -> bool:
+    return bool(settings.SENTRY_DISCOVER_TIMESERIES_CACHE_TTL_SECONDS)
+
+
+def bulk_timeseries_query(
+    snuba_param_list: Sequence[SnubaQueryParams],
+    referrer: Optional[str] = None,
+    query_fn: Callable[..., Sequence[Mapping[str, Any]]] = bulk_raw_query,
+) -> List[Mapping[str, Any]]:
+    """
+    Same as ``bulk_raw_query`` for timeseries queries (grouped by ``time``
+    first), but takes closed buckets from the cache. All queries, including
+    the ones for the missing parts of the windows, are sent together with
+    ``query_fn``.
+    """
+    if not is_enabled():
+        return list(query_fn(snuba_param_list, referrer=referrer))
+
+    now = to_timestamp(timezone.now())
+    cached_queries: List[Optional[_CachedQuery]] = []
+    for query_params in snuba_param_list:
+        fingerprint = get_fingerprint(query_params)
+        cached_queries.append(
+            _CachedQuery(query_params, fingerprint, now) if fingerprint is not None else None
+        )
+
+    fingerprints = {x.fingerprint for x in cached_queries if x is not None}
+    values = cache.get_many(list(fingerprints)) if fingerprints else {}
+    entries = {fingerprint: load_entry(values.get(fingerprint)) for fingerprint in fingerprints}
+
+    to_query: List[SnubaQueryParams] = []
+    positions: List[Tuple[int, int]] = []
+    for cached_query, query_params in zip(cached_queries, snuba_param_list):
+        if cached_query is None:
+            query_params_list = [query_params]
+        else:
+            cached_query.load(entries[cached_query.fingerprint])
+            metrics.incr(
+                "discover.timeseries_cache.hit"
+                if cached_query.tail_start > cached_query.first_bucket
+                else "discover.timeseries_cache.miss",
+                tags={"referrer": referrer} if referrer else None,
+            )
+            query_params_list = cached_query.get_query_params()
+        positions.append((len(to_query), len(to_query) + len(query_params_list)))
+        to_query.extend(query_params_list)
+
+    results = list(query_fn(to_query, referrer=referrer)) if to_query else []
+
+    rv = []
+    updated_fingerprints = set()
+    for cached_query, (start, end) in zip(cached_queries, positions):
+        if cached_query is None:
+            rv.append(results[start])
+            continue
+
+        result, updated = cached_query.merge(results[start:end])
+        if updated:
+            updated_fingerprints.add(cached_query.fingerprint)
+        rv.append(result)
+
+    if updated_fingerprints:
+        cache.set_many(
+            {fp: dump_entry(entries[fp]) for fp in updated_fingerprints},
+            settings.SENTRY_DISCOVER_TIMESERIES_CACHE_TTL_SECONDS,
+        )
+
+    return rv
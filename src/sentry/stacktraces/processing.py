@@ -7,6 +7,7 @@ from django.utils import timezone
 
 from sentry.models import Project, Release
 from sentry.stacktraces.functions import set_in_app, trim_function_name
+from sentry.utils import metrics
 from sentry.utils.cache import cache
 from sentry.utils.hashlib import hash_values
 from sentry.utils.safe import get_path, safe_execute
@@ -441,10 +442,10 @@ def get_crash_frame_from_event_data(data, frame_filter=None):
 
 
 def lookup_frame_cache(keys):
-    rv = {}
-    for key in keys:
-        rv[key] = cache.get(key)
-    return rv
+    rv = cache.get_many(list(keys))
+    metrics.incr("stacktraces.frame_cache.hit", amount=len(rv))
+    metrics.incr("stacktraces.frame_cache.miss", amount=len(keys) - len(rv))
+    return {key: rv.get(key) for key in keys}
 
 
 def get_stacktrace_processing_task(infos, processors):
@@ -468,11 +469,12 @@ def get_stacktrace_processing_task(infos, processors):
                 processable_frame
             )
             if processable_frame.cache_key is not None:
-                to_lookup[processable_frame.cache_key] = processable_frame
+                to_lookup.setdefault(processable_frame.cache_key, []).append(processable_frame)
 
     frame_cache = lookup_frame_cache(to_lookup)
-    for cache_key, processable_frame in to_lookup.items():
-        processable_frame.cache_value = frame_cache.get(cache_key)
+    for cache_key, processable_frames in to_lookup.items():
+        for processable_frame in processable_frames:
+            processable_frame.cache_value = frame_cache[cache_key]
 
     return StacktraceProcessingTask(
         processable_stacktraces=by_stacktrace_info, processors=by_processor
@@ -46,6 +46,14 @@ class RetrySymbolication(Exception):
         self.retry_after = retry_after
 
 
+class EventBatchNotSaved(Exception):
+    """
+    Raised by ``save_event_batch`` if saving a batch of several events failed
+    before anything was stored for them, so they can still be saved one by
+    one.
+    """
+
+
 @metrics.wraps("should_process")
 def should_process(data):
     """Quick check if processing is needed at all."""
@@ -1049,3 +1057,119 @@ def save_event(
     cache_key=None, data=None, start_time=None, event_id=None, project_id=None, **kwargs
 ):
     _do_save_event(cache_key, data, start_time, event_id, project_id, **kwargs)
+
+
+def should_save_in_batch(data):
+    """
+    Whether an event can skip ``preprocess_event`` and be saved together with
+    other events through ``save_event_batch``. Only transactions qualify: they
+    never need processing and are saved without grouping.
+    """
+    from sentry.lang.native.processing import should_process_with_symbolicator
+
+    return data.get("type") == "transaction" and not should_process_with_symbolicator(data)
+
+
+def save_event_batch(events, projects):
+    """
+    Saves events that passed ``should_save_in_batch`` with a single
+    ``save_transaction_events`` call instead of one ``save_event`` task per
+    event, which batches nodestore writes, eventstream produces, release and
+    environment lookups and TSDB increments across the whole batch.
+
+    ``events`` is a sequence of dicts holding the ``cache_key``, ``data``,
+    ``start_time`` and ``event_id`` that would have been passed to
+    ``save_event``. ``projects`` maps project IDs to projects and has to
+    contain the project of every event.
+
+    Raises ``EventBatchNotSaved`` if several events failed to save before
+    anything was stored for them. Any other error may come after some of the
+    events have been counted or stored, so they must not be saved again.
+    """
+    from sentry.event_manager import prepare_transaction_events, store_transaction_events
+    from sentry.signals import first_transaction_received
+
+    jobs = []
+    saved = []
+    for event in events:
+        cache_key = event["cache_key"]
+        data = CanonicalKeyDict(event["data"])
+        project_id = data["project"]
+
+        if reprocessing.event_supports_reprocessing(data):
+            delete_raw_event(project_id, event["event_id"], allow_hint_clear=True)
+
+        if killswitch_matches_context(
+            "store.load-shed-save-event-projects",
+            {
+                "project_id": project_id,
+                "event_type": data.get("type") or "none",
+                "platform": data.get("platform") or "none",
+            },
+        ):
+            if cache_key:
+                event_processing_store.delete_by_key(cache_key)
+                attachment_cache.delete(cache_key)
+            continue
+
+        jobs.append({"data": data, "start_time": event["start_time"]})
+        saved.append(event)
+
+    if not jobs:
+        return
+
+    metrics.timing("tasks.store.save_event_batch.size", len(jobs))
+
+    try:
+        with metrics.timer("tasks.store.save_event_batch.prepare_transaction_events"):
+            prepare_transaction_events(jobs, projects)
+    except Exception as e:
+        # Nothing has been stored for the events yet. A single event is
+        # finished like any other failed save.
+        if len(jobs) > 1:
+            raise EventBatchNotSaved() from e
+        _finish_batch_events(jobs, saved)
+        raise
+
+    try:
+        with metrics.timer("tasks.store.save_event_batch.store_transaction_events"):
+            store_transaction_events(jobs)
+
+        notified_projects = set()
+        for job in jobs:
+            project = projects[job["project_id"]]
+            if not project.flags.has_transactions and project.id not in notified_projects:
+                notified_projects.add(project.id)
+                first_transaction_received.send_robust(
+                    project=project, event=job["event"], sender=Project
+                )
+
+        # Put the updated events back into the cache so that post_process
+        # has the most recent data.
+        with metrics.timer("tasks.store.save_event_batch.write_processing_cache"):
+            for job in jobs:
+                event_processing_store.store(dict(job["event"].data.data.items()))
+    finally:
+        _finish_batch_events(jobs, saved)
+
+
+def _finish_batch_events(jobs, events):
+    for job, event in zip(jobs, events):
+        data = job["data"]
+        reprocessing2.mark_event_reprocessed(data)
+        if event["cache_key"]:
+            attachment_cache.delete(event["cache_key"])
+
+        if event["start_time"]:
+            metrics.timing(
+                "events.time-to-process",
+                time() - event["start_time"],
+                instance=data["platform"],
+                tags={
+                    "is_reprocessing2": "true"
+                    if reprocessing2.is_reprocessed_event(data)
+                    else "false",
+                },
+            )
+
+        time_synthetic_monitoring_event(data, data["project"], event["start_time"])
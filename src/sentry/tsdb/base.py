@@ -3,9 +3,11 @@ from collections.abc import Callable
 from datetime import timedelta
 from enum import Enum
 
+import sentry_sdk
 from django.conf import settings
 from django.utils import timezone
 
+from sentry.utils import metrics
 from sentry.utils.compat import map
 from sentry.utils.dates import to_datetime, to_timestamp
 from sentry.utils.services import Service
@@ -96,6 +98,67 @@ class TSDBModel(Enum):
     sentry_app_component_interacted = 801
 
 
+class TSDBWriteBatch:
+    """
+    Collects counter, distinct counter and frequency table writes and hands
+    them to the backend in one go when the managed block exits, so backends
+    can send all of them together. Nothing is written if the block raises.
+
+    The methods take the same arguments as their ``BaseTSDB`` counterparts.
+    """
+
+    def __init__(self, tsdb):
+        self.tsdb = tsdb
+        self.operations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.flush()
+
+    def incr(self, model, key, timestamp=None, count=1, environment_id=None):
+        self.incr_multi([(model, key)], timestamp, count, environment_id)
+
+    def incr_multi(self, items, timestamp=None, count=1, environment_id=None):
+        self.operations.append(
+            (
+                "incr_multi",
+                (items,),
+                {"timestamp": timestamp, "count": count, "environment_id": environment_id},
+            )
+        )
+
+    def record(self, model, key, values, timestamp=None, environment_id=None):
+        self.record_multi(((model, key, values),), timestamp, environment_id)
+
+    def record_multi(self, items, timestamp=None, environment_id=None):
+        self.operations.append(
+            ("record_multi", (items,), {"timestamp": timestamp, "environment_id": environment_id})
+        )
+
+    def record_frequency_multi(self, requests, timestamp=None, environment_id=None):
+        self.operations.append(
+            (
+                "record_frequency_multi",
+                (requests,),
+                {"timestamp": timestamp, "environment_id": environment_id},
+            )
+        )
+
+    def flush(self):
+        operations, self.operations = self.operations, []
+        if not operations:
+            return
+
+        with sentry_sdk.start_span(op="tsdb.write_batch") as span, metrics.timer(
+            "tsdb.write_batch.flush"
+        ):
+            span.set_data("operations", len(operations))
+            self.tsdb.flush_write_batch(operations)
+
+
 class BaseTSDB(Service):
     __read_methods__ = frozenset(
         [
@@ -140,6 +203,7 @@ class BaseTSDB(Service):
                 "models_with_environment_support",
                 "normalize_to_epoch",
                 "rollup",
+                "write_batch",
             ]
         )
         | __write_methods__
@@ -542,3 +606,24 @@ class BaseTSDB(Service):
         Delete all data.
         """
         raise NotImplementedError
+
+    def write_batch(self):
+        """
+        Returns a ``TSDBWriteBatch`` that collects writes and performs them
+        together once the block exits:
+
+        >>> with tsdb.write_batch() as batch:
+        ...     batch.incr_multi([(TimeSeriesModel.project, 1)])
+        ...     batch.record(TimeSeriesModel.users_affected_by_project, 1, ["foo"])
+        """
+        return TSDBWriteBatch(self)
+
+    def flush_write_batch(self, operations):
+        """
+        Performs the operations collected by a ``TSDBWriteBatch``, a sequence
+        of ``(method name, args, kwargs)`` tuples. Backends that can send
+        writes together should override this; by default every operation is
+        performed on its own.
+        """
+        for method, args, kwargs in operations:
+            getattr(self, method)(*args, **kwargs)
@@ -1,18 +1,25 @@
+import functools
 import itertools
 import logging
 import operator
 import random
+import threading
+import time
 import uuid
 from collections import defaultdict, namedtuple
 from functools import reduce
 from hashlib import md5
 
+from django.core.cache import cache
 from django.utils import timezone
 from django.utils.encoding import force_bytes
 from pkg_resources import resource_string
+from redis.client import EMPTY_RESPONSE, Script
 
 from sentry.tsdb.base import BaseTSDB
+from sentry.utils import metrics
 from sentry.utils.compat import crc32, map, zip
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.dates import to_datetime, to_timestamp
 from sentry.utils.redis import SentryScript, check_cluster_versions, get_cluster_from_options
 from sentry.utils.versioning import Version
@@ -23,6 +30,9 @@ SketchParameters = namedtuple("SketchParameters", "depth width capacity")
 
 CountMinScript = SentryScript(None, resource_string("sentry", "scripts/tsdb/cmsketch.lua"))
 
+# Placeholder response of pipelined script evaluations that failed.
+SCRIPT_FAILED = object()
+
 
 class SuppressionWrapper:
     """\
@@ -50,6 +60,129 @@ class SuppressionWrapper:
         return True
 
 
+class CounterReadCache:
+    """\
+    Caches counter values of closed rollup buckets for ``RedisTSDB.get_range``.
+
+    Values are keyed by ``(hash key, hash field)`` as returned by
+    ``RedisTSDB.make_counter_key``. They are kept in a per-process LRU of
+    ``local_size`` items for ``local_ttl`` seconds and, if ``shared`` is set,
+    in the default Django cache for ``ttl`` seconds.
+
+    A value read from Redis may already be stale when it is stored, if a late
+    write invalidated its key in the meantime. To catch that, ``get_many``
+    returns a generation that is taken before Redis is read, and
+    ``set_many`` stores the values with it:
+
+    * Shared values are stored along with the invalidation token their key
+      had, and are only used while the token is unchanged. Invalidating a
+      key replaces its token.
+    * Local values are not stored at all if any key has been invalidated by
+      the current process since.
+
+    Invalidations only reach the local cache of the current process, so other
+    processes may serve values that are up to ``local_ttl`` seconds old.
+    """
+
+    def __init__(self, local_size=0, shared=False, ttl=3600, local_ttl=60):
+        self.local = LRUCache(local_size) if local_size else None
+        self.local_generation = 0
+        self.shared = shared
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.lock = threading.Lock()
+
+    def make_shared_key(self, key):
+        return "tsdb:c:{}:{}".format(*key)
+
+    def make_token_key(self, key):
+        return "tsdb:ct:{}:{}".format(*key)
+
+    def get_many(self, keys):
+        """
+        Returns the cached values of ``keys`` and the generation to pass to
+        ``set_many`` along with the values of the missing keys.
+        """
+        results = {}
+        local_hits = 0
+
+        with self.lock:
+            local_generation = self.local_generation
+            if self.local is not None:
+                now = time.time()
+                for key in keys:
+                    item = self.local.get(key)
+                    if item is None:
+                        continue
+                    expires, value = item
+                    if expires > now:
+                        results[key] = value
+                        local_hits += 1
+                    else:
+                        del self.local[key]
+
+        tokens = {}
+        shared_hits = 0
+        if self.shared:
+            missing = [key for key in keys if key not in results]
+            if missing:
+                found = cache.get_many(
+                    [self.make_shared_key(key) for key in missing]
+                    + [self.make_token_key(key) for key in missing]
+                )
+                shared = {}
+                for key in missing:
+                    token = tokens[key] = found.get(self.make_token_key(key))
+                    item = found.get(self.make_shared_key(key))
+                    if item is not None and item[0] == token:
+                        shared[key] = item[1]
+                shared_hits = len(shared)
+                results.update(shared)
+                self.set_local(shared, local_generation)
+
+        if local_hits:
+            metrics.incr("tsdb.read_cache.hit", amount=local_hits, tags={"tier": "local"})
+        if shared_hits:
+            metrics.incr("tsdb.read_cache.hit", amount=shared_hits, tags={"tier": "shared"})
+        if len(keys) > len(results):
+            metrics.incr("tsdb.read_cache.miss", amount=len(keys) - len(results))
+        return results, (local_generation, tokens)
+
+    def set_local(self, values, local_generation):
+        if self.local is None or not values:
+            return
+        expires = time.time() + self.local_ttl
+        with self.lock:
+            if local_generation != self.local_generation:
+                return
+            for key, value in values.items():
+                self.local[key] = (expires, value)
+
+    def set_many(self, values, generation):
+        local_generation, tokens = generation
+        self.set_local(values, local_generation)
+        if self.shared and values:
+            cache.set_many(
+                {
+                    self.make_shared_key(key): (tokens.get(key), value)
+                    for key, value in values.items()
+                },
+                self.ttl,
+            )
+
+    def delete_many(self, keys):
+        with self.lock:
+            self.local_generation += 1
+            if self.local is not None:
+                for key in keys:
+                    self.local.pop(key, None)
+        if self.shared and keys:
+            # Tokens outlive the values stored with them, so that a value
+            # stored without a token can't become valid again.
+            token = uuid.uuid4().hex
+            cache.set_many({self.make_token_key(key): token for key in keys}, self.ttl * 2)
+
+
 class RedisTSDB(BaseTSDB):
     """
     A time series storage backend for Redis.
@@ -103,6 +236,14 @@ class RedisTSDB(BaseTSDB):
     frequency table can be displayed as percentages of the whole data set.
     (Additional documentation and the bulk of the logic for implementing the
     frequency table API can be found in the ``cmsketch.lua`` script.)
+
+    Counter reads can be served from a ``CounterReadCache``: buckets that
+    ended more than ``read_cache_grace`` seconds ago are considered closed and
+    cached after they have been read once, only open buckets are always read
+    from Redis. Set ``read_cache_size`` to the number of values kept per
+    process and/or ``read_cache_shared`` to also use the default Django cache.
+    Writes to closed buckets (late events), merges and deletions invalidate
+    the cached values they touch.
     """
 
     DEFAULT_SKETCH_PARAMETERS = SketchParameters(3, 128, 50)
@@ -112,6 +253,21 @@ class RedisTSDB(BaseTSDB):
         self.prefix = prefix
         self.vnodes = vnodes
         self.enable_frequency_sketches = options.pop("enable_frequency_sketches", False)
+        # cluster -> {(host id, script sha)}, see ``execute_pipelined``
+        self._loaded_scripts = defaultdict(set)
+
+        read_cache_size = options.pop("read_cache_size", 0)
+        read_cache_shared = options.pop("read_cache_shared", False)
+        read_cache_ttl = options.pop("read_cache_ttl", 3600)
+        read_cache_local_ttl = options.pop("read_cache_local_ttl", 60)
+        self.read_cache_grace = options.pop("read_cache_grace", 300)
+        if read_cache_size or read_cache_shared:
+            self.read_cache = CounterReadCache(
+                read_cache_size, read_cache_shared, read_cache_ttl, read_cache_local_ttl
+            )
+        else:
+            self.read_cache = None
+
         super().__init__(**options)
 
     def validate(self):
@@ -212,14 +368,10 @@ class RedisTSDB(BaseTSDB):
         >>> incr_multi([(TimeSeriesModel.project, 1, {"timestamp": ...}),
         ...             (TimeSeriesModel.group, 5, {"timestamp": ...})])
         """
-
-        default_timestamp = timestamp
-        default_count = count
-
         self.validate_arguments([item[0] for item in items], [environment_id])
 
-        if default_timestamp is None:
-            default_timestamp = timezone.now()
+        if timestamp is None:
+            timestamp = timezone.now()
 
         for (cluster, durable), environment_ids in self.get_cluster_groups({None, environment_id}):
             manager = cluster.map()
@@ -227,38 +379,74 @@ class RedisTSDB(BaseTSDB):
                 manager = SuppressionWrapper(manager)
 
             with manager as client:
-                # (hash_key, hash_field) -> count
-                key_operations = defaultdict(lambda: 0)
-                # (hash_key) -> "max expiration encountered"
-                key_expiries = defaultdict(lambda: 0.0)
+                for _, command in self.make_incr_commands(items, timestamp, count, environment_ids):
+                    client.execute_command(*command)
 
-                for rollup, max_values in self.rollups.items():
-                    for item in items:
-                        if len(item) == 2:
-                            model, key = item
-                            options = {}
-                        else:
-                            model, key, options = item
+        if self.read_cache is not None:
+            self.invalidate_closed_counters(items, timestamp, {None, environment_id})
 
-                        count = options.get("count", default_count)
-                        timestamp = options.get("timestamp", default_timestamp)
+    def make_incr_commands(self, items, default_timestamp, default_count, environment_ids):
+        """
+        Returns the commands for ``incr_multi`` as a list of
+        ``(routing key, command)`` pairs.
+        """
+        # (hash_key, hash_field) -> count
+        key_operations = defaultdict(lambda: 0)
+        # (hash_key) -> "max expiration encountered"
+        key_expiries = defaultdict(lambda: 0.0)
+
+        for rollup, max_values in self.rollups.items():
+            for item in items:
+                if len(item) == 2:
+                    model, key = item
+                    options = {}
+                else:
+                    model, key, options = item
 
-                        expiry = self.calculate_expiry(rollup, max_values, timestamp)
+                count = options.get("count", default_count)
+                timestamp = options.get("timestamp", default_timestamp)
 
-                        for environment_id in environment_ids:
-                            hash_key, hash_field = self.make_counter_key(
-                                model, rollup, timestamp, key, environment_id
-                            )
+                expiry = self.calculate_expiry(rollup, max_values, timestamp)
 
-                            if key_expiries[hash_key] < expiry:
-                                key_expiries[hash_key] = expiry
+                for environment_id in environment_ids:
+                    hash_key, hash_field = self.make_counter_key(
+                        model, rollup, timestamp, key, environment_id
+                    )
 
-                            key_operations[(hash_key, hash_field)] += count
+                    if key_expiries[hash_key] < expiry:
+                        key_expiries[hash_key] = expiry
 
-                for (hash_key, hash_field), count in key_operations.items():
-                    client.hincrby(hash_key, hash_field, count)
-                    if key_expiries.get(hash_key):
-                        client.expireat(hash_key, key_expiries.pop(hash_key))
+                    key_operations[(hash_key, hash_field)] += count
+
+        commands = []
+        for (hash_key, hash_field), count in key_operations.items():
+            commands.append((hash_key, ("HINCRBY", hash_key, hash_field, count)))
+            if key_expiries.get(hash_key):
+                commands.append((hash_key, ("EXPIREAT", hash_key, key_expiries.pop(hash_key))))
+        return commands
+
+    def invalidate_closed_counters(self, items, default_timestamp, environment_ids):
+        """
+        Drops the cached values of closed buckets that ``incr_multi`` has
+        written to, which happens when events arrive late.
+        """
+        closed_before = time.time() - self.read_cache_grace
+
+        counter_keys = []
+        for rollup in self.rollups:
+            for item in items:
+                model, key = item[:2]
+                options = item[2] if len(item) > 2 else {}
+                timestamp = options.get("timestamp", default_timestamp)
+                if self.normalize_to_epoch(timestamp, rollup) + rollup > closed_before:
+                    continue
+                for environment_id in environment_ids:
+                    counter_keys.append(
+                        self.make_counter_key(model, rollup, timestamp, key, environment_id)
+                    )
+
+        if counter_keys:
+            self.read_cache.delete_many(counter_keys)
 
     def get_range(
         self, model, keys, start, end, rollup=None, environment_ids=None, use_cache=False
@@ -281,21 +469,38 @@ class RedisTSDB(BaseTSDB):
         rollup, series = self.get_optimal_rollup_series(start, end, rollup)
         series = map(to_datetime, series)
 
-        results = []
+        points = []
+        for key in keys:
+            for timestamp in series:
+                points.append(
+                    (
+                        to_timestamp(timestamp),
+                        key,
+                        self.make_counter_key(model, rollup, timestamp, key, environment_id),
+                    )
+                )
+
+        cached = {}
+        closed = set()
+        if self.read_cache is not None:
+            closed_before = time.time() - rollup - self.read_cache_grace
+            closed = {counter_key for epoch, _, counter_key in points if epoch <= closed_before}
+            cached, generation = self.read_cache.get_many(list(closed))
+
+        results = {}
         cluster, _ = self.get_cluster(environment_id)
         with cluster.map() as client:
-            for key in keys:
-                for timestamp in series:
-                    hash_key, hash_field = self.make_counter_key(
-                        model, rollup, timestamp, key, environment_id
-                    )
-                    results.append(
-                        (to_timestamp(timestamp), key, client.hget(hash_key, hash_field))
-                    )
+            for _, _, counter_key in points:
+                if counter_key not in cached and counter_key not in results:
+                    results[counter_key] = client.hget(*counter_key)
+
+        results = {counter_key: int(count.value or 0) for counter_key, count in results.items()}
+        if closed:
+            self.read_cache.set_many({k: v for k, v in results.items() if k in closed}, generation)
 
         results_by_key = defaultdict(dict)
-        for epoch, key, count in results:
-            results_by_key[key][epoch] = int(count.value or 0)
+        for epoch, key, counter_key in points:
+            results_by_key[key][epoch] = cached.get(counter_key, results.get(counter_key))
 
         for key, points in results_by_key.items():
             results_by_key[key] = sorted(points.items())
@@ -317,6 +522,7 @@ class RedisTSDB(BaseTSDB):
 
             with manager as client:
                 data = {}
+                counter_keys = []
                 for rollup, series in rollups.items():
                     data[rollup] = {}
                     for timestamp in series:
@@ -326,6 +532,7 @@ class RedisTSDB(BaseTSDB):
                                 source_hash_key, source_hash_field = self.make_counter_key(
                                     model, rollup, timestamp, source, environment_id
                                 )
+                                counter_keys.append((source_hash_key, source_hash_field))
                                 results[environment_id].append(
                                     client.hget(source_hash_key, source_hash_field)
                                 )
@@ -348,6 +555,10 @@ class RedisTSDB(BaseTSDB):
                                     destination_hash_key,
                                     self.calculate_expiry(rollup, self.rollups[rollup], timestamp),
                                 )
+                                counter_keys.append((destination_hash_key, destination_hash_field))
+
+            if self.read_cache is not None:
+                self.read_cache.delete_many(counter_keys)
 
     def delete(self, models, keys, start=None, end=None, timestamp=None, environment_ids=None):
         environment_ids = (set(environment_ids) if environment_ids is not None else set()).union(
@@ -363,6 +574,7 @@ class RedisTSDB(BaseTSDB):
             if not durable:
                 manager = SuppressionWrapper(manager)
 
+            counter_keys = []
             with manager as client:
                 for rollup, series in rollups.items():
                     for timestamp in series:
@@ -374,6 +586,10 @@ class RedisTSDB(BaseTSDB):
                                     )
 
                                     client.hdel(hash_key, hash_field)
+                                    counter_keys.append((hash_key, hash_field))
+
+            if self.read_cache is not None:
+                self.read_cache.delete_many(counter_keys)
 
     def record(self, model, key, values, timestamp=None, environment_id=None):
         self.validate_arguments([model], [environment_id])
@@ -389,21 +605,32 @@ class RedisTSDB(BaseTSDB):
         if timestamp is None:
             timestamp = timezone.now()
 
-        ts = int(to_timestamp(timestamp))  # ``timestamp`` is not actually a timestamp :(
-
         for (cluster, durable), environment_ids in self.get_cluster_groups({None, environment_id}):
             manager = cluster.fanout()
             if not durable:
                 manager = SuppressionWrapper(manager)
 
             with manager as client:
-                for model, key, values in items:
-                    c = client.target_key(key)
-                    for rollup, max_values in self.rollups.items():
-                        for environment_id in environment_ids:
-                            k = self.make_key(model, rollup, ts, key, environment_id)
-                            c.pfadd(k, *values)
-                            c.expireat(k, self.calculate_expiry(rollup, max_values, timestamp))
+                for key, command in self.make_record_commands(items, timestamp, environment_ids):
+                    client.target_key(key).execute_command(*command)
+
+    def make_record_commands(self, items, timestamp, environment_ids):
+        """
+        Returns the commands for ``record_multi`` as a list of
+        ``(routing key, command)`` pairs.
+        """
+        ts = int(to_timestamp(timestamp))  # ``timestamp`` is not actually a timestamp :(
+
+        commands = []
+        for model, key, values in items:
+            for rollup, max_values in self.rollups.items():
+                for environment_id in environment_ids:
+                    k = self.make_key(model, rollup, ts, key, environment_id)
+                    commands.append((key, ("PFADD", k) + tuple(values)))
+                    commands.append(
+                        (key, ("EXPIREAT", k, self.calculate_expiry(rollup, max_values, timestamp)))
+                    )
+        return commands
 
     def get_distinct_counts_series(
         self, model, keys, start, end=None, rollup=None, environment_id=None
@@ -655,46 +882,161 @@ class RedisTSDB(BaseTSDB):
         if timestamp is None:
             timestamp = timezone.now()
 
-        ts = int(to_timestamp(timestamp))  # ``timestamp`` is not actually a timestamp :(
-
         for (cluster, durable), environment_ids in self.get_cluster_groups({None, environment_id}):
             commands = {}
+            for key, command in self.make_frequency_commands(requests, timestamp, environment_ids):
+                commands.setdefault(key, []).append(command)
 
-            for model, request in requests:
-                for key, items in request.items():
-                    keys = []
-                    expirations = {}
+            try:
+                cluster.execute_commands(commands)
+            except Exception:
+                if durable:
+                    raise
 
-                    # Figure out all of the keys we need to be incrementing, as
-                    # well as their expiration policies.
-                    for rollup, max_values in self.rollups.items():
-                        for environment_id in environment_ids:
-                            chunk = self.make_frequency_table_keys(
-                                model, rollup, ts, key, environment_id
-                            )
-                            keys.extend(chunk)
+    def make_frequency_commands(self, requests, timestamp, environment_ids):
+        """
+        Returns the commands for ``record_frequency_multi`` as a list of
+        ``(routing key, command)`` pairs.
+        """
+        ts = int(to_timestamp(timestamp))  # ``timestamp`` is not actually a timestamp :(
+
+        commands = []
+        for model, request in requests:
+            for key, items in request.items():
+                keys = []
+                expirations = {}
 
-                        expiry = self.calculate_expiry(rollup, max_values, timestamp)
-                        for k in chunk:
-                            expirations[k] = expiry
+                # Figure out all of the keys we need to be incrementing, as
+                # well as their expiration policies.
+                for rollup, max_values in self.rollups.items():
+                    for environment_id in environment_ids:
+                        chunk = self.make_frequency_table_keys(
+                            model, rollup, ts, key, environment_id
+                        )
+                        keys.extend(chunk)
 
-                    arguments = ["INCR"] + list(self.DEFAULT_SKETCH_PARAMETERS)
-                    for member, score in items.items():
-                        arguments.extend((score, member))
+                    expiry = self.calculate_expiry(rollup, max_values, timestamp)
+                    for k in chunk:
+                        expirations[k] = expiry
 
-                    # Since we're essentially merging dictionaries, we need to
-                    # append this to any value that already exists at the key.
-                    cmds = commands.setdefault(key, [])
-                    cmds.append((CountMinScript, keys, arguments))
-                    for k, t in expirations.items():
-                        cmds.append(("EXPIREAT", k, t))
+                arguments = ["INCR"] + list(self.DEFAULT_SKETCH_PARAMETERS)
+                for member, score in items.items():
+                    arguments.extend((score, member))
 
+                # Since we're essentially merging dictionaries, commands for
+                # the same key are appended and executed in order.
+                commands.append((key, (CountMinScript, keys, arguments)))
+                for k, t in expirations.items():
+                    commands.append((key, ("EXPIREAT", k, t)))
+        return commands
+
+    def flush_write_batch(self, operations):
+        """
+        Sends all operations of a write batch in a single pipeline per Redis
+        host instead of one cluster round-trip per operation.
+        """
+        default_timestamp = timezone.now()
+
+        commands = defaultdict(list)
+        incrs = []
+        for method, args, kwargs in operations:
+            (items,) = args
+            timestamp = kwargs.get("timestamp") or default_timestamp
+            environment_id = kwargs.get("environment_id")
+
+            if method == "incr_multi":
+                self.validate_arguments([item[0] for item in items], [environment_id])
+                make_commands = functools.partial(
+                    self.make_incr_commands, items, timestamp, kwargs.get("count", 1)
+                )
+                incrs.append((items, timestamp, {None, environment_id}))
+            elif method == "record_multi":
+                self.validate_arguments([model for model, key, values in items], [environment_id])
+                make_commands = functools.partial(self.make_record_commands, items, timestamp)
+            elif method == "record_frequency_multi":
+                self.validate_arguments([model for model, request in items], [environment_id])
+                if not self.enable_frequency_sketches:
+                    continue
+                make_commands = functools.partial(self.make_frequency_commands, items, timestamp)
+            else:
+                raise ValueError(f"Unsupported write batch operation: {method}")
+
+            for cluster_group, environment_ids in self.get_cluster_groups({None, environment_id}):
+                commands[cluster_group].extend(make_commands(environment_ids))
+
+        for (cluster, durable), cluster_commands in commands.items():
             try:
-                cluster.execute_commands(commands)
+                self.execute_pipelined(cluster, cluster_commands)
             except Exception:
                 if durable:
                     raise
 
+        if self.read_cache is not None:
+            for items, timestamp, environment_ids in incrs:
+                self.invalidate_closed_counters(items, timestamp, environment_ids)
+
+    def execute_pipelined(self, cluster, commands):
+        """
+        Executes ``(routing key, command)`` pairs with one pipeline per host.
+        Commands routed to the same host are executed in order.
+
+        Unlike ``cluster.execute_commands``, scripts aren't checked for with
+        ``SCRIPT EXISTS`` up front, which would cost another round-trip.
+        Instead they are loaded in the same pipeline the first time a host is
+        written to. If the script cache of a host has been flushed since (by
+        a restart, a failover or ``SCRIPT FLUSH``), the evaluations fail
+        without aborting the rest of the pipeline and are retried once with
+        ``EVAL``, after the other commands.
+        """
+        router = cluster.get_router()
+        loaded_scripts = self._loaded_scripts[cluster]
+        newly_loaded_scripts = set()
+        evaluations = []
+
+        try:
+            with cluster.fanout() as client:
+                targets = {}
+                for routing_key, command in commands:
+                    host_id = router.get_host_for_key(routing_key)
+                    target = targets.get(host_id)
+                    if target is None:
+                        target = targets[host_id] = client.target([host_id])
+
+                    if isinstance(command[0], Script):
+                        script, keys, arguments = command
+                        loaded = (host_id, script.sha)
+                        if loaded not in loaded_scripts and loaded not in newly_loaded_scripts:
+                            target.execute_command("SCRIPT LOAD", script.script)
+                            newly_loaded_scripts.add(loaded)
+                        promise = target.execute_command(
+                            "EVALSHA",
+                            script.sha,
+                            len(keys),
+                            *itertools.chain(keys, arguments),
+                            **{EMPTY_RESPONSE: SCRIPT_FAILED},
+                        )
+                        evaluations.append((host_id, command, promise))
+                    else:
+                        target.execute_command(*command)
+
+            loaded_scripts.update(newly_loaded_scripts)
+
+            failed = [
+                (host_id, command)
+                for host_id, command, promise in evaluations
+                if promise.value[host_id] is SCRIPT_FAILED
+            ]
+            if failed:
+                metrics.incr("tsdb.write_batch.script_retry", amount=len(failed))
+                with cluster.fanout() as client:
+                    for host_id, (script, keys, arguments) in failed:
+                        client.target([host_id]).execute_command(
+                            "EVAL", script.script, len(keys), *itertools.chain(keys, arguments)
+                        )
+        except Exception:
+            loaded_scripts.clear()
+            raise
+
     def get_most_frequent(
         self, model, keys, start, end=None, rollup=None, limit=None, environment_id=None
     ):
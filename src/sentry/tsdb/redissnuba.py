@@ -1,5 +1,6 @@
 import inspect
 import time
+from collections import defaultdict
 
 from sentry.tsdb.base import BaseTSDB
 from sentry.tsdb.dummy import DummyTSDB
@@ -121,3 +122,17 @@ class RedisSnubaTSDB(BaseTSDB, metaclass=RedisSnubaTSDBMeta):
             "snuba": SnubaTSDB(**options.pop("snuba", {})),
         }
         super().__init__(**options)
+
+    def flush_write_batch(self, operations):
+        """
+        Splits the operations of a write batch by the backend they are
+        directed to, so that writes going to Redis are still sent together.
+        """
+        backend_operations = defaultdict(list)
+        for method, args, kwargs in operations:
+            callargs = inspect.getcallargs(getattr(BaseTSDB, method), self, *args, **kwargs)
+            backend = selector_func(method, callargs, self.switchover_timestamp)
+            backend_operations[backend].append((method, args, kwargs))
+
+        for backend, operations in backend_operations.items():
+            self.backends[backend].flush_write_batch(operations)
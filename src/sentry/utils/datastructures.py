@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from collections.abc import Hashable, MutableMapping
 
 __unset__ = object()
@@ -59,3 +60,62 @@ class BidirectionalMapping(MutableMapping):
 
     def inverse(self):
         return self.__inverse.copy()
+
+
+class LRUCache(MutableMapping):
+    """\
+    A mapping that holds at most ``max_size`` worth of items, evicting the
+    least recently used ones first.
+
+    Every item counts as ``1`` towards ``max_size`` unless ``sizeof`` is
+    provided, in which case it is called with each value to determine its
+    weight (e.g. an approximate size in bytes). Items heavier than
+    ``max_size`` are not stored at all. ``on_evict`` is called with
+    ``(key, value)`` for every item that is pushed out of the cache.
+
+    This class is not thread-safe.
+    """
+
+    def __init__(self, max_size, sizeof=None, on_evict=None):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.size = 0
+        self.__data = OrderedDict()
+        self.__sizes = {}
+
+    def __getitem__(self, key):
+        value = self.__data[key]
+        self.__data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.__data:
+            del self[key]
+
+        size = self.sizeof(value) if self.sizeof is not None else 1
+        if size > self.max_size:
+            return
+
+        self.__data[key] = value
+        self.__sizes[key] = size
+        self.size += size
+
+        while self.size > self.max_size:
+            evicted_key, evicted_value = self.__data.popitem(last=False)
+            self.size -= self.__sizes.pop(evicted_key)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted_value)
+
+    def __delitem__(self, key):
+        del self.__data[key]
+        self.size -= self.__sizes.pop(key)
+
+    def __contains__(self, key):
+        return key in self.__data
+
+    def __iter__(self):
+        return iter(self.__data)
+
+    def __len__(self):
+        return len(self.__data)
@@ -36,7 +36,7 @@ from sentry.models import (
 from sentry.net.http import connection_from_url
 from sentry.snuba.dataset import Dataset
 from sentry.snuba.events import Columns
-from sentry.utils import json, metrics
+from sentry.utils import json, metrics, snuba_coalescing
 from sentry.utils.compat import map
 from sentry.utils.dates import outside_retention_with_modified_start, to_timestamp
 
@@ -137,6 +137,21 @@ def parse_snuba_datetime(value):
     return parse_datetime(value)
 
 
+def parse_snuba_timestamp(value) -> int:
+    """
+    Parses a datetime value from snuba into a POSIX timestamp. Snuba returns
+    ISO 8601 datetimes with an offset, which are parsed without going through
+    dateutil, as time columns are parsed for every row of a result.
+    """
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        dt = None
+    if dt is None or dt.tzinfo is None:
+        dt = parse_snuba_datetime(value)
+    return int(to_timestamp(dt))
+
+
 class SnubaError(Exception):
     pass
 
@@ -725,7 +740,14 @@ def _apply_cache_and_build_results(
         to_query = [(query_pos, query_params, None) for query_pos, query_params in query_param_list]
 
     if to_query:
-        query_results = _bulk_snuba_query(map(itemgetter(1), to_query), headers)
+        if snuba_coalescing.is_enabled():
+            query_results = snuba_coalescing.coalesce(
+                [get_cache_key(query_params[0]) for _, query_params, _ in to_query],
+                lambda positions: _bulk_snuba_query([to_query[i][1] for i in positions], headers),
+                referrer=referrer,
+            )
+        else:
+            query_results = _bulk_snuba_query(map(itemgetter(1), to_query), headers)
         for result, (query_pos, _, cache_key) in zip(query_results, to_query):
             if cache_key:
                 cache.set(cache_key, json.dumps(result), settings.SENTRY_SNUBA_CACHE_TTL_SECONDS)
@@ -1069,7 +1091,23 @@ def aliased_query(**kwargs):
         return _aliased_query_impl(**kwargs)
 
 
-def _aliased_query_impl(
+def bulk_aliased_query(queries, referrer=None):
+    """
+    Same as `aliased_query` for several queries, which are sent to snuba
+    concurrently. Returns the results in the order of `queries`.
+    """
+    with sentry_sdk.start_span(op="sentry.snuba.bulk_aliased_query"):
+        snuba_param_list = [
+            SnubaQueryParams(**_resolve_aliased_query_params(**query)) for query in queries
+        ]
+        return bulk_raw_query(snuba_param_list, referrer=referrer)
+
+
+def _aliased_query_impl(**kwargs):
+    return raw_query(**_resolve_aliased_query_params(**kwargs))
+
+
+def _resolve_aliased_query_params(
     start=None,
     end=None,
     groupby=None,
@@ -1122,7 +1160,7 @@ def _aliased_query_impl(
             updated_order.append("{}{}".format("-" if order.startswith("-") else "", order_field))
         orderby = updated_order
 
-    return raw_query(
+    return dict(
         start=start,
         end=end,
         groupby=groupby,
@@ -1390,16 +1428,14 @@ def get_snuba_translators(filter_keys, is_grouprelease=False):
     # Extra reverse translator for time column.
     reverse = compose(
         reverse,
-        lambda row: replace(row, "time", int(to_timestamp(parse_datetime(row["time"]))))
+        lambda row: replace(row, "time", parse_snuba_timestamp(row["time"]))
         if "time" in row
         else row,
     )
     # Extra reverse translator for bucketed_end column.
     reverse = compose(
         reverse,
-        lambda row: replace(
-            row, "bucketed_end", int(to_timestamp(parse_datetime(row["bucketed_end"])))
-        )
+        lambda row: replace(row, "bucketed_end", parse_snuba_timestamp(row["bucketed_end"]))
         if "bucketed_end" in row
         else row,
     )
@@ -0,0 +1,253 @@
+"""
+Coalesces identical Snuba queries that are running at the same time.
+
+A busy dashboard or a shared issue stream sends the very same queries many
+times at once, and the query cache only helps once the first response has
+been written. Instead, the first request for a query (the leader) sends it,
+while all other requests for it (the followers) wait for its result.
+
+Within a process, leaders register a future per query that followers wait
+on. With ``SENTRY_SNUBA_QUERY_COALESCING_REDIS_CLUSTER`` set, leaders also
+take a short lease in Redis, so that followers in other processes can pick up
+the result once the leader published it. Remote followers fall back to
+sending the query themselves if the leader gives up or takes longer than the
+lease, so Redis never holds up a query for longer than a Snuba timeout.
+
+Errors are shared with local followers only, every other follower retries.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from sentry.utils import json, metrics
+from sentry.utils.redis import redis_clusters
+
+logger = logging.getLogger(__name__)
+
+# Published results only have to be around until the followers polled them.
+RESULT_TTL = 10
+POLL_INTERVAL = 0.05
+
+_flights: Dict[str, "_Flight"] = {}
+_flights_lock = threading.Lock()
+
+
+class _Flight:
+    """
+    A query sent by a leader in this process. The future resolves to the
+    serialized result, or to ``None`` if nobody followed.
+    """
+
+    def __init__(self) -> None:
+        self.future: "Future[Optional[str]]" = Future()
+        self.followers = 0
+
+
+def is_enabled() -> bool:
+    return bool(settings.SENTRY_SNUBA_QUERY_COALESCING)
+
+
+def _get_redis_client():
+    cluster = settings.SENTRY_SNUBA_QUERY_COALESCING_REDIS_CLUSTER
+    return redis_clusters.get(cluster) if cluster else None
+
+
+def _get_lease_key(key: str) -> str:
+    return f"{key}:lease"
+
+
+def _get_result_key(key: str, flight_id: str) -> str:
+    return f"{key}:result:{flight_id}"
+
+
+def _resolve(
+    key: str,
+    flight: _Flight,
+    result: Any = None,
+    error: Optional[BaseException] = None,
+    publish: bool = False,
+) -> Optional[str]:
+    """
+    Resolves the local flight of ``key`` and returns the serialized result if
+    it's needed, by local followers or to be published.
+    """
+    with _flights_lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+        followers = flight.followers
+
+    if error is not None:
+        flight.future.set_exception(error)
+        return None
+
+    value = json.dumps(result) if followers or publish else None
+    flight.future.set_result(value)
+    return value
+
+
+def _acquire_leases(client, keys: Sequence[str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Returns the flight IDs of the leases taken for ``keys``, and the flight IDs
+    of the leases other processes hold.
+    """
+    leases: Dict[str, str] = {}
+    remote: Dict[str, str] = {}
+    for key in keys:
+        flight_id = uuid.uuid4().hex
+        if client.set(_get_lease_key(key), flight_id, nx=True, ex=settings.SENTRY_SNUBA_TIMEOUT):
+            leases[key] = flight_id
+            continue
+
+        current = client.get(_get_lease_key(key))
+        # The lease has been released in the meantime, the query is sent
+        # without one.
+        if current is not None:
+            remote[key] = current
+    return leases, remote
+
+
+def _release_leases(client, leases: Mapping[str, str], values: Mapping[str, str]) -> None:
+    try:
+        for key, flight_id in leases.items():
+            value = values.get(key)
+            if value is not None:
+                client.set(_get_result_key(key, flight_id), value, ex=RESULT_TTL)
+            # The result is published before the lease is gone, followers rely
+            # on that. A leader that outlived its lease could delete the lease
+            # of the next leader here, which only leads to the query being
+            # sent again.
+            client.delete(_get_lease_key(key))
+    except Exception:
+        logger.warning("snuba.query_coalescing.redis_error", exc_info=True)
+
+
+def _wait_for_remote(client, remote: Mapping[str, str]) -> Dict[str, Any]:
+    """
+    Polls the results of the flights in other processes, and returns the ones
+    that were published before their leases were released or timed out.
+    """
+    rv = {}
+    pending = dict(remote)
+    deadline = time.monotonic() + settings.SENTRY_SNUBA_TIMEOUT
+    while pending:
+        for key, flight_id in list(pending.items()):
+            # Reading the lease first guarantees to find the result of a
+            # leader that released it successfully.
+            lease = client.get(_get_lease_key(key))
+            value = client.get(_get_result_key(key, flight_id))
+            if value is not None:
+                rv[key] = json.loads(value)
+                del pending[key]
+            elif lease != flight_id:
+                del pending[key]
+
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(POLL_INTERVAL)
+    return rv
+
+
+def coalesce(
+    keys: Sequence[str],
+    run: Callable[[Sequence[int]], Sequence[Any]],
+    referrer: Optional[str] = None,
+) -> List[Any]:
+    """
+    Returns the results of the queries identified by ``keys``. ``run`` is
+    called with the positions of the queries that have to be sent, and returns
+    their results in the same order. Queries that are in flight elsewhere are
+    waited for instead.
+    """
+    tags = {"referrer": referrer or "<unknown>"}
+    results: List[Any] = [None] * len(keys)
+
+    # key -> (flight, position)
+    leading: Dict[str, Tuple[_Flight, int]] = {}
+    following: List[Tuple[int, _Flight]] = []
+    with _flights_lock:
+        for position, key in enumerate(keys):
+            flight = _flights.get(key)
+            if flight is None:
+                flight = _flights[key] = _Flight()
+                leading[key] = (flight, position)
+            else:
+                flight.followers += 1
+                following.append((position, flight))
+
+    if following:
+        metrics.incr(
+            "snuba.query_coalescing.coalesced",
+            amount=len(following),
+            tags=dict(tags, scope="local"),
+        )
+
+    client = _get_redis_client()
+    leases: Dict[str, str] = {}
+    remote: Dict[str, str] = {}
+    values: Dict[str, str] = {}
+    try:
+        if client is not None and leading:
+            try:
+                leases, remote = _acquire_leases(client, list(leading))
+            except Exception:
+                logger.warning("snuba.query_coalescing.redis_error", exc_info=True)
+                client = None
+
+        if remote:
+            metrics.incr(
+                "snuba.query_coalescing.coalesced",
+                amount=len(remote),
+                tags=dict(tags, scope="remote"),
+            )
+
+        to_run = [key for key in leading if key not in remote]
+        if to_run:
+            for key, result in zip(to_run, run([leading[key][1] for key in to_run])):
+                results[leading[key][1]] = result
+                value = _resolve(key, leading[key][0], result, publish=key in leases)
+                if value is not None:
+                    values[key] = value
+
+        # Leases are released before waiting for other processes, which may
+        # be waiting for the queries leased here at the same time.
+        if leases:
+            _release_leases(client, leases, values)
+            leases = {}
+
+        if remote:
+            with metrics.timer("snuba.query_coalescing.wait", tags=dict(tags, scope="remote")):
+                try:
+                    remote_results = _wait_for_remote(client, remote)
+                except Exception:
+                    logger.warning("snuba.query_coalescing.redis_error", exc_info=True)
+                    remote_results = {}
+
+            fallback = [key for key in remote if key not in remote_results]
+            if fallback:
+                metrics.incr("snuba.query_coalescing.fallback", amount=len(fallback), tags=tags)
+                remote_results.update(zip(fallback, run([leading[key][1] for key in fallback])))
+
+            for key in remote:
+                results[leading[key][1]] = remote_results[key]
+                _resolve(key, leading[key][0], remote_results[key])
+    except BaseException as e:
+        for key, (flight, _) in leading.items():
+            if not flight.future.done():
+                _resolve(key, flight, error=e)
+        raise
+    finally:
+        if leases:
+            _release_leases(client, leases, values)
+
+    if following:
+        with metrics.timer("snuba.query_coalescing.wait", tags=dict(tags, scope="local")):
+            for position, flight in following:
+                results[position] = json.loads(flight.future.result())
+
+    return results
@@ -1,6 +1,7 @@
 import datetime
 import os
 from datetime import timedelta
+from unittest.mock import patch
 
 import pytest
 from django.test import SimpleTestCase
@@ -13,12 +14,15 @@ from sentry.api.event_search import (
     SearchFilter,
     SearchKey,
     SearchValue,
+    SearchVisitor,
     parse_search_query,
 )
 from sentry.constants import MODULE_ROOT
 from sentry.exceptions import InvalidSearchQuery
 from sentry.search.utils import parse_datetime_string, parse_duration, parse_numeric_value
+from sentry.testutils.skips import requires_benchmark
 from sentry.utils import json
+from sentry.utils.datastructures import LRUCache
 
 fixture_path = "tests/fixtures/search-syntax"
 abs_fixtures_path = os.path.join(MODULE_ROOT, os.pardir, os.pardir, fixture_path)
@@ -441,6 +445,33 @@ class ParseSearchQueryBackendTest(SimpleTestCase):
         # the extra slash should be removed in the final value
         assert search_filter.value.value == "a\\"
 
+    def test_parse_cache(self):
+        config = SearchConfig()
+        query = "user.email:foo@example.com release:1.2.1 (a:b OR c:d)"
+        result = parse_search_query(query, config=config)
+
+        with patch.object(SearchVisitor, "visit", side_effect=AssertionError):
+            assert parse_search_query(query, config=config) == result
+
+        other_config = SearchConfig(key_mappings={"email": ["user.email"]})
+        assert parse_search_query(query, config=other_config)[0] == SearchFilter(
+            key=SearchKey(name="email"), operator="=", value=SearchValue("foo@example.com")
+        )
+
+    def test_parse_cache_rel_time_filter(self):
+        now = timezone.now()
+        with freeze_time(now):
+            parse_search_query("first_seen:-2w")
+
+        with freeze_time(now + timedelta(days=1)):
+            assert parse_search_query("first_seen:-2w") == [
+                SearchFilter(
+                    key=SearchKey(name="first_seen"),
+                    operator=">=",
+                    value=SearchValue(raw_value=now - timedelta(days=13)),
+                )
+            ]
+
     def test_escaping_quotes(self):
         search_filter = parse_search_query(r"title:a\"b")
         assert search_filter == [
@@ -476,3 +507,30 @@ class ParseSearchQueryBackendTest(SimpleTestCase):
 def test_search_value(raw, result):
     search_value = SearchValue(raw)
     assert search_value.value == result
+
+
+def load_benchmark_queries():
+    queries = []
+    for file in sorted(os.listdir(abs_fixtures_path)):
+        with open(os.path.join(abs_fixtures_path, file)) as fp:
+            queries.extend(case["query"] for case in json.load(fp) if not case.get("raisesError"))
+    return queries
+
+
+@requires_benchmark
+@pytest.mark.parametrize("cached", [True, False], ids=["cached", "uncached"])
+def test_benchmark_parse_search_query(cached, benchmark, monkeypatch):
+    queries = load_benchmark_queries()
+
+    def run():
+        for query in queries:
+            try:
+                parse_search_query(query)
+            except InvalidSearchQuery:
+                pass
+
+    if not cached:
+        monkeypatch.setattr("sentry.api.event_search._parse_tree_cache", LRUCache(0))
+        monkeypatch.setattr("sentry.api.event_search._parse_result_cache", LRUCache(0))
+
+    benchmark(run)
@@ -73,3 +73,80 @@ class BufferTest(TestCase):
         self.buf.process(Group, columns, filters, {"last_seen": the_date}, signal_only=True)
         group.refresh_from_db()
         assert group.times_seen == prev_times_seen
+
+    @mock.patch("sentry.buffer.base.buffer_incr_complete")
+    def test_process_batch_updates_rows(self, buffer_incr_complete):
+        project = self.create_project()
+        group_a = self.create_group(project=project, times_seen=1)
+        group_b = self.create_group(project=project, times_seen=5)
+        the_date = timezone.now() + timedelta(days=5)
+        self.buf.process_batch(
+            [
+                (Group, {"times_seen": 2}, {"id": group_a.id}, {"last_seen": the_date}, None),
+                (Group, {"times_seen": 3}, {"id": group_b.id}, {"last_seen": the_date}, None),
+            ]
+        )
+        group_a.refresh_from_db()
+        group_b.refresh_from_db()
+        assert group_a.times_seen == 3
+        assert group_b.times_seen == 8
+        assert group_a.last_seen == group_b.last_seen == the_date
+        assert len(buffer_incr_complete.send_robust.mock_calls) == 2
+        buffer_incr_complete.send_robust.assert_any_call(
+            model=Group,
+            columns={"times_seen": 2},
+            filters={"id": group_a.id},
+            extra={"last_seen": the_date},
+            created=False,
+            sender=Group,
+        )
+
+    def test_process_batch_falls_back_for_missing_rows(self):
+        group = Group.objects.create(project=Project(id=1))
+        missing_id = group.id + 1000
+        with mock.patch.object(
+            self.buf, "_bulk_update", wraps=self.buf._bulk_update
+        ) as bulk_update:
+            self.buf.process_batch(
+                [
+                    (Group, {"times_seen": 1}, {"id": group.id, "project_id": 1}, None, None),
+                    (Group, {"times_seen": 1}, {"id": missing_id, "project_id": 1}, None, None),
+                ]
+            )
+        # Both rows go through one bulk update, the missing one is created.
+        assert bulk_update.call_count == 1
+        assert Group.objects.get(id=group.id).times_seen == group.times_seen + 1
+        assert Group.objects.get(id=missing_id).times_seen == 2
+
+    def test_process_batch_failure(self):
+        group_a = Group.objects.create(project=Project(id=1))
+        group_b = Group.objects.create(project=Project(id=1))
+        payloads = [
+            (Group, {"times_seen": 1}, {"id": group_a.id}, None, None),
+            (Group, {"times_seen": 1}, {"id": group_b.id}, None, None),
+            (Group, {"times_seen": 1}, {"id": group_a.id, "project_id": 1}, None, None),
+        ]
+        process = Buffer.process
+
+        def broken_process(buf, model, columns, filters, extra=None, signal_only=None):
+            if filters == {"id": group_b.id}:
+                raise ValueError("boom")
+            return process(buf, model, columns, filters, extra, signal_only)
+
+        with mock.patch.object(
+            self.buf, "_bulk_update", side_effect=ValueError("boom")
+        ), mock.patch.object(Buffer, "process", broken_process):
+            self.buf.process_batch(payloads)
+
+        # Failures only lose their own increments
+        assert Group.objects.get(id=group_a.id).times_seen == group_a.times_seen + 2
+        assert Group.objects.get(id=group_b.id).times_seen == group_b.times_seen
+
+    @mock.patch("sentry.models.Group.objects.create_or_update")
+    def test_process_batch_signal_only(self, create_or_update):
+        group = Group.objects.create(project=Project(id=1))
+        prev_times_seen = group.times_seen
+        self.buf.process_batch([(Group, {"times_seen": 1}, {"id": group.id}, None, True)])
+        group.refresh_from_db()
+        assert group.times_seen == prev_times_seen
+        assert not create_or_update.called
@@ -0,0 +1,66 @@
+import pytest
+
+from sentry.buffer.redis import CoalescingBuffer, RedisBuffer
+from sentry.models import Group
+from sentry.testutils.skips import requires_benchmark
+
+INCR_COMMANDS = ("hsetnx", "hincrby", "hset", "expire", "zadd")
+
+
+def count_incr_commands(buf):
+    total = 0
+    with buf.cluster.all() as conn:
+        results = conn.info("commandstats")
+    for stats in results.value.values():
+        for command in INCR_COMMANDS:
+            total += stats.get(f"cmdstat_{command}", {}).get("calls", 0)
+    return total
+
+
+def reset_stats(buf):
+    with buf.cluster.all() as conn:
+        conn.config_resetstat()
+
+
+def run_hot_groups(buf, events=1000, groups=10):
+    for i in range(events):
+        buf.incr(
+            Group,
+            {"times_seen": 1},
+            {"id": i % groups},
+            extra={"message": "hello world"},
+        )
+    if buf.coalescing_buffer is not None:
+        buf.flush_coalesced()
+
+
+def make_buffer(coalesce):
+    buf = RedisBuffer()
+    if coalesce:
+        buf.coalescing_buffer = CoalescingBuffer(max_keys=1000, max_age=60)
+    return buf
+
+
+@pytest.mark.django_db
+def test_coalescing_reduces_redis_commands():
+    buf = make_buffer(coalesce=False)
+    reset_stats(buf)
+    run_hot_groups(buf)
+    uncoalesced = count_incr_commands(buf)
+
+    buf = make_buffer(coalesce=True)
+    reset_stats(buf)
+    run_hot_groups(buf)
+    coalesced = count_incr_commands(buf)
+
+    # one pipeline worth of commands per hot key instead of per event
+    assert uncoalesced == 1000 * 6
+    assert coalesced == 10 * 6
+
+
+@requires_benchmark
+@pytest.mark.django_db
+@pytest.mark.parametrize("coalesce", [False, True], ids=["direct", "coalesced"])
+def test_benchmark_incr(coalesce, benchmark):
+    buf = make_buffer(coalesce)
+    benchmark(run_hot_groups, buf)
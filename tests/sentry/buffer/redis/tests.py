@@ -1,10 +1,11 @@
 import pickle
 from datetime import datetime
+from time import time
 
 from django.utils import timezone
 from django.utils.encoding import force_text
 
-from sentry.buffer.redis import RedisBuffer
+from sentry.buffer.redis import CoalescingBuffer, RedisBuffer
 from sentry.models import Group, Project
 from sentry.testutils import TestCase
 from sentry.utils.compat import mock
@@ -45,6 +46,32 @@ class RedisBufferTest(TestCase):
         client = self.buf.cluster.get_routing_client()
         assert client.zrange("b:p", 0, -1) == []
 
+    @mock.patch("sentry.buffer.redis.process_incr")
+    def test_process_pending_in_chunks(self, process_incr):
+        self.buf.incr_batch_size = 5
+        self.buf.pending_chunk_size = 2
+        with self.buf.cluster.map() as client:
+            client.zadd("b:p", {"foo": 1, "bar": 2, "baz": 3})
+        with mock.patch.object(
+            self.buf.cluster, "get_local_client", wraps=self.buf.cluster.get_local_client
+        ) as get_local_client:
+            self.buf.process_pending()
+        assert process_incr.apply_async.mock_calls == [
+            mock.call(kwargs={"batch_keys": ["foo", "bar", "baz"]})
+        ]
+        assert get_local_client.call_count == len(self.buf.cluster.hosts)
+        client = self.buf.cluster.get_routing_client()
+        assert client.zrange("b:p", 0, -1) == []
+
+    @mock.patch("sentry.buffer.redis.process_incr")
+    def test_process_pending_respects_horizon(self, process_incr):
+        with self.buf.cluster.map() as client:
+            client.zadd("b:p", {"foo": 1, "bar": time() + 3600})
+        self.buf.process_pending()
+        assert process_incr.apply_async.mock_calls == [mock.call(kwargs={"batch_keys": ["foo"]})]
+        client = self.buf.cluster.get_routing_client()
+        assert client.zrange("b:p", 0, -1) == [b"bar"]
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.base.Buffer.process")
     def test_process_does_bubble_up_json(self, process):
@@ -183,6 +210,101 @@ class RedisBufferTest(TestCase):
         self.buf.process("foo")
         process.assert_called_once_with(mock.Mock, {"times_seen": 1}, {"pk": 1}, {}, True)
 
+    @mock.patch("sentry.buffer.base.Buffer.process_batch")
+    def test_process_bulk_reads_all_keys(self, process_batch):
+        self.buf.bulk_process = True
+        client = self.buf.cluster.get_routing_client()
+        client.hmset(
+            "foo",
+            {"f": '{"pk": ["i","1"]}', "i+times_seen": "2", "m": "sentry.models.Group"},
+        )
+        client.hmset(
+            "bar",
+            {
+                "e+foo": '["s","bar"]',
+                "f": '{"pk": ["i","2"]}',
+                "i+times_seen": "1",
+                "m": "sentry.models.Group",
+            },
+        )
+        client.zadd("b:p", {"foo": 1, "bar": 2})
+        self.buf.process(batch_keys=["foo", "bar", "baz"])
+        process_batch.assert_called_once_with(
+            [
+                (Group, {"times_seen": 2}, {"pk": 1}, {}, None),
+                (Group, {"times_seen": 1}, {"pk": 2}, {"foo": "bar"}, None),
+            ]
+        )
+        assert client.zrange("b:p", 0, -1) == []
+        assert not client.exists("foo")
+        assert not client.exists("bar")
+        assert not client.exists("l:foo")
+
+    @mock.patch("sentry.buffer.base.Buffer.process_batch")
+    def test_process_bulk_skips_locked_keys(self, process_batch):
+        self.buf.bulk_process = True
+        client = self.buf.cluster.get_routing_client()
+        client.hmset(
+            "foo",
+            {"f": '{"pk": ["i","1"]}', "i+times_seen": "2", "m": "sentry.models.Group"},
+        )
+        client.hmset(
+            "bar",
+            {"f": '{"pk": ["i","2"]}', "i+times_seen": "1", "m": "sentry.models.Group"},
+        )
+        client.set("l:bar", "1")
+        self.buf.process(batch_keys=["foo", "bar"])
+        process_batch.assert_called_once_with([(Group, {"times_seen": 2}, {"pk": 1}, {}, None)])
+        assert client.exists("bar")
+        assert client.get("l:bar") == b"1"
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    def test_incr_coalesces_locally(self):
+        now = datetime(2017, 5, 3, 6, 6, 6, tzinfo=timezone.utc)
+        self.buf.coalescing_buffer = CoalescingBuffer(max_keys=10, max_age=60)
+        client = self.buf.cluster.get_routing_client()
+        model = mock.Mock()
+        model.__name__ = "Mock"
+        filters = {"pk": 1}
+        self.buf.incr(model, {"times_seen": 1}, filters, extra={"foo": "bar"})
+        self.buf.incr(model, {"times_seen": 2}, filters, extra={"foo": "baz", "datetime": now})
+        assert client.hgetall("foo") == {}
+        assert client.zrange("b:p", 0, -1) == []
+
+        self.buf.flush_coalesced()
+        result = {force_text(k): v for k, v in client.hgetall("foo").items()}
+        assert pickle.loads(result.pop("f")) == {"pk": 1}
+        assert pickle.loads(result.pop("e+foo")) == "baz"
+        assert pickle.loads(result.pop("e+datetime")) == now
+        assert result == {"i+times_seen": b"3", "m": b"mock.mock.Mock"}
+        assert client.zrange("b:p", 0, -1) == [b"foo"]
+        assert self.buf.coalescing_buffer.empty()
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer.flush_coalesced")
+    def test_incr_coalesce_flushes_when_full(self, flush_coalesced):
+        self.buf.coalescing_buffer = CoalescingBuffer(max_keys=2, max_age=60)
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 1})
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 1})
+        assert not flush_coalesced.called
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 2})
+        assert flush_coalesced.call_count == 1
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    @mock.patch("sentry.buffer.base.Buffer.process")
+    def test_compact_values_roundtrip(self, process):
+        now = datetime(2017, 5, 3, 6, 6, 6, tzinfo=timezone.utc)
+        self.buf.compact_values = True
+        client = self.buf.cluster.get_routing_client()
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 1}, extra={"foo": "bar", "datetime": now})
+        result = {force_text(k): v for k, v in client.hgetall("foo").items()}
+        assert result["f"].startswith(b"\x00")
+        assert result["e+foo"].startswith(b"\x00")
+
+        self.buf.process("foo")
+        process.assert_called_once_with(
+            Group, {"times_seen": 1}, {"pk": 1}, {"foo": "bar", "datetime": now}, None
+        )
+
     """
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     def test_incr_uses_signal_only(self):
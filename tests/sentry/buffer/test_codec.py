@@ -0,0 +1,94 @@
+import pickle
+from datetime import datetime
+
+import pytest
+from django.utils import timezone
+
+from sentry.buffer.codec import BufferValueCodec, is_compact_value
+from sentry.event_manager import ScoreClause
+from sentry.models import Group, Project
+from sentry.testutils.skips import requires_benchmark
+
+codec = BufferValueCodec()
+
+NOW = datetime(2017, 5, 3, 6, 6, 6, 123456, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "bar",
+        "”",
+        1,
+        -(2 ** 40),
+        2 ** 64,
+        -(2 ** 100),
+        1.5,
+        None,
+        True,
+        NOW,
+        datetime(2017, 5, 3, 6, 6, 6),
+        (1, "foo"),
+        [(1, 2), ((3,),)],
+        {"pk": 1, "datetime": NOW},
+        {("foo", 1): (NOW, 2 ** 70)},
+        {"data": {"type": "error", "metadata": {"value": "foo"}}},
+    ],
+)
+def test_roundtrip(value):
+    encoded = codec.encode(value)
+    assert is_compact_value(encoded)
+    decoded = codec.decode(encoded)
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+def test_roundtrip_model_reference():
+    decoded = codec.decode(codec.encode({"project": Project(id=42), "key": "foo"}))
+    assert isinstance(decoded["project"], Project)
+    assert decoded["project"].id == 42
+    assert decoded["key"] == "foo"
+
+
+def test_roundtrip_score_clause():
+    decoded = codec.decode(codec.encode(ScoreClause(Group(id=1))))
+    assert isinstance(decoded, ScoreClause)
+    assert decoded.group is None
+
+
+def test_falls_back_to_pickle():
+    value = {1, 2, 3}
+    assert codec.decode(codec.encode(value)) == value
+
+
+def test_legacy_formats_are_not_compact():
+    assert not is_compact_value(pickle.dumps({"pk": 1}))
+    assert not is_compact_value(pickle.dumps({"pk": 1}, protocol=0))
+    assert not is_compact_value(b'{"pk": ["i","1"]}')
+    assert not is_compact_value(b'["s","bar"]')
+
+
+def test_unknown_version():
+    with pytest.raises(ValueError):
+        codec.decode(b"\x00\xff" + codec.encode(1)[2:])
+
+
+def test_smaller_than_pickle():
+    filters = {"id": 12345}
+    extra = {"last_seen": NOW, "message": "foo bar", "project": Project(id=1)}
+    assert len(codec.encode(filters)) < len(pickle.dumps(filters))
+    for value in extra.values():
+        assert len(codec.encode(value)) < len(pickle.dumps(value))
+
+
+@requires_benchmark
+@pytest.mark.parametrize("encoding", ["pickle", "compact"])
+def test_benchmark_roundtrip(encoding, benchmark):
+    value = {"id": 12345, "last_seen": NOW, "project": Project(id=1), "level": 40}
+    if encoding == "pickle":
+        dumps, loads = pickle.dumps, pickle.loads
+    else:
+        dumps, loads = codec.encode, codec.decode
+
+    benchmark.extra_info["bytes"] = len(dumps(value))
+    benchmark(lambda: loads(dumps(value)))
@@ -1,6 +1,8 @@
 import copy
 
-from sentry.eventstore.compressor import assemble, deduplicate
+import pytest
+
+from sentry.eventstore.compressor import MissingPatchsets, assemble, deduplicate
 
 
 def _assert_roundtrip(data, assert_extra_keys=None):
@@ -52,3 +54,49 @@ def test_basic():
             }
         },
     )
+
+
+def test_modules_sdk_contexts():
+    _assert_roundtrip({"modules": None})
+    _assert_roundtrip({"modules": {}})
+    _assert_roundtrip({"sdk": None})
+    _assert_roundtrip({"sdk": {"name": "sentry.python"}})
+    _assert_roundtrip({"contexts": {"trace": {"trace_id": "a" * 32}}})
+
+    data = {
+        "modules": {"django": "2.2.24", "celery": "4.4.7"},
+        "sdk": {
+            "name": "sentry.python",
+            "version": "1.4.3",
+            "packages": [{"name": "pypi:sentry-sdk", "version": "1.4.3"}],
+            "integrations": ["django", "celery"],
+        },
+        "contexts": {
+            "os": {"name": "Linux"},
+            "runtime": {"name": "CPython", "version": "3.8.12"},
+            "trace": {"trace_id": "a" * 32},
+        },
+    }
+    new_data, extra_keys = deduplicate(copy.deepcopy(data))
+    assert len(extra_keys) == 3
+    assert new_data.keys() == {"__nodestore_patchsets"}
+    inlined = {key: value for key, _, value in new_data["__nodestore_patchsets"]}
+    assert inlined == {
+        "modules": None,
+        "sdk": {"name": "sentry.python", "version": "1.4.3"},
+        "contexts": {"trace": {"trace_id": "a" * 32}},
+    }
+    _assert_roundtrip(data)
+
+
+def test_deduplicate_does_not_mutate():
+    data = {"debug_meta": {"images": [{"debug_id": "1234abcdef", "image_addr": "0x1"}]}}
+    original = copy.deepcopy(data)
+    deduplicate(data)
+    assert data == original
+
+
+def test_assemble_missing_patchset():
+    new_data, extra_keys = deduplicate({"modules": {"django": "2.2.24"}, "message": "foo"})
+    with pytest.raises(MissingPatchsets):
+        assemble(new_data, lambda checksums: {})
@@ -1,22 +1,16 @@
 import pytest
 
 from sentry.grouping.api import get_default_grouping_config_dict
+from sentry.grouping.enhancer.compiler import RuleIndex
+from sentry.grouping.fingerprinting import FingerprintingRules, Rule
 from sentry.grouping.strategies.configurations import CONFIGURATIONS
+from sentry.testutils.skips import requires_benchmark
 from tests.sentry.grouping import grouping_input as grouping_inputs
 
 CONFIGS = {key: get_default_grouping_config_dict(key) for key in sorted(CONFIGURATIONS.keys())}
 
 
-def benchmark_available():
-    try:
-        import pytest_benchmark  # NOQA
-    except ModuleNotFoundError:
-        return False
-    else:
-        return True
-
-
-@pytest.mark.skipif(not benchmark_available(), reason="requires pytest-benchmark")
+@requires_benchmark
 @pytest.mark.parametrize(
     "config_name", sorted(CONFIGURATIONS.keys()), ids=lambda x: x.replace("-", "_")
 )
@@ -30,6 +24,56 @@ def test_benchmark_grouping(config_name, benchmark):
     benchmark.pedantic(run_configuration, setup=setup, rounds=len(grouping_inputs))
 
 
+@requires_benchmark
+@pytest.mark.parametrize("indexed", [True, False], ids=["indexed", "unindexed"])
+def test_benchmark_enhancer_rule_index(indexed, benchmark, monkeypatch):
+    if not indexed:
+        monkeypatch.setattr(
+            RuleIndex, "get_candidate_frames", lambda self, match_frames: [None] * self.size
+        )
+
+    config = CONFIGS[sorted(CONFIGURATIONS.keys())[-1]]
+    input_iter = iter(grouping_inputs)
+
+    def setup():
+        return (next(input_iter), config), {}
+
+    benchmark.pedantic(run_configuration, setup=setup, rounds=len(grouping_inputs))
+
+
+def make_fingerprinting_rules(count):
+    # Server-side rules of a project that has accumulated a few hundred of
+    # them, most of which don't match a given event.
+    templates = [
+        "error.type:Generated{i}Error -> generated-type-{i}",
+        'error.value:"generated {i} failed*" -> generated-value-{i}',
+        'stack.function:"generated_{i}_*" -> generated-function-{i}',
+        'stack.module:"com.example.generated{i}.*" -> generated-module-{i}',
+        'stack.abs_path:"**/generated{i}/*.py" -> generated-path-{i}',
+        'logger:"generated.{i}.*" level:error -> generated-logger-{i}',
+        'tags.server_name:"generated-{i}-*" -> generated-server-{i}',
+    ]
+    return FingerprintingRules.from_config_string(
+        "\n".join(templates[i % len(templates)].format(i=i) for i in range(count))
+    )
+
+
+@requires_benchmark
+@pytest.mark.parametrize("anchored", [True, False], ids=["anchored", "unanchored"])
+def test_benchmark_fingerprinting(anchored, benchmark, monkeypatch):
+    if not anchored:
+        monkeypatch.setattr(Rule, "get_anchor", lambda self: None)
+
+    rules = make_fingerprinting_rules(500)
+    events = [grouping_input.data for grouping_input in grouping_inputs]
+
+    def run():
+        for event in events:
+            rules.get_fingerprint_values_for_event(event)
+
+    benchmark(run)
+
+
 def run_configuration(grouping_input, config):
     event = grouping_input.create_event(config)
 
@@ -1,7 +1,10 @@
 import pytest
 
+from sentry.grouping.api import load_grouping_config
 from sentry.grouping.component import GroupingComponent
 from sentry.grouping.enhancer import Enhancements, InvalidEnhancerConfig, create_match_frame
+from sentry.grouping.enhancer.compiler import RuleIndex
+from sentry.projectoptions.defaults import DEFAULT_GROUPING_CONFIG
 
 
 def dump_obj(obj):
@@ -71,7 +74,16 @@ def _get_matching_frame_actions(rule, frames, platform, exception_data=None, cac
 
     match_frames = [create_match_frame(frame, platform) for frame in frames]
 
-    return rule.get_matching_frame_actions(match_frames, platform, exception_data, cache)
+    rv = rule.get_matching_frame_actions(match_frames, platform, exception_data, cache)
+
+    # The rule index must never hide a matching frame
+    (frame_indexes,) = RuleIndex([rule]).get_candidate_frames(match_frames)
+    assert (
+        rule.get_matching_frame_actions(match_frames, platform, exception_data, {}, frame_indexes)
+        == rv
+    )
+
+    return rv
 
 
 def test_basic_path_matching():
@@ -418,3 +430,48 @@ def test_sentinel_and_prefix(action, type):
     actions[0][1].update_frame_components_contributions([component], frames, 0)
     expected = True if action == "+" else False
     assert getattr(component, f"is_{type}_frame") is expected
+
+
+def test_rule_index():
+    enhancements = Enhancements.from_config_string(
+        """
+        function:foo                    +app
+        family:native module:std::*     -app
+        family:native package:/usr/lib/**  -app
+        path:**/test.js                 -app
+        family:javascript app:yes       -group
+        !function:foo                   +group
+        """
+    )
+    frames = [
+        {"function": "foo", "platform": "python"},
+        {"function": "bar", "module": "std::vec", "platform": "native"},
+        {"function": "baz", "package": "C:\\usr\\lib\\libc.so", "platform": "native"},
+        {"function": "baz", "package": "usr/lib/libc.so", "platform": "native"},
+        {"function": "baz", "filename": "test.js", "platform": "javascript"},
+    ]
+    match_frames = [create_match_frame(frame, "python") for frame in frames]
+
+    assert RuleIndex(enhancements.rules).get_candidate_frames(match_frames) == [
+        # literal function
+        [0],
+        # module prefix, preferred over the family
+        [1],
+        # package prefix, normalized and with a leading slash
+        [3],
+        # no literal prefix
+        None,
+        # family
+        [4],
+        # negated matchers are never used
+        None,
+    ]
+
+
+def test_loaded_enhancements_are_shared():
+    enhancements = Enhancements.from_config_string("function:foo +app").dumps()
+    config = load_grouping_config({"id": DEFAULT_GROUPING_CONFIG, "enhancements": enhancements})
+    other = load_grouping_config({"id": DEFAULT_GROUPING_CONFIG, "enhancements": enhancements})
+
+    # Rule indexes are only built once for all events with the same rules.
+    assert config.enhancements is other.enhancements
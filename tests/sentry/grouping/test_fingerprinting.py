@@ -1,7 +1,7 @@
 import pytest
 
 from sentry.grouping.api import get_default_grouping_config_dict
-from sentry.grouping.fingerprinting import FingerprintingRules, InvalidFingerprintingConfig
+from sentry.grouping.fingerprinting import FingerprintingRules, InvalidFingerprintingConfig, Rule
 from tests.sentry.grouping import with_fingerprint_input
 
 GROUPING_CONFIG = get_default_grouping_config_dict()
@@ -121,6 +121,58 @@ logger:test2 -> logger-, {{ logger }}, -, {{ level }}
     }
 
 
+ANCHOR_TEST_RULES = r"""
+error.type:DatabaseUnavailable                   -> database-unavailable
+error.value:"*timeout*"                          -> timeout
+error.value:"Connection refused*"                -> refused
+stack.function:assertion_failed stack.module:foo -> assertion-failed
+stack.abs_path:"src/app/*.py"                    -> app
+family:native !stack.module:"std::*" message:"Pan*" -> panic
+logger:"celery.*"                                -> celery
+tags.server_name:"web-*"                         -> web
+app:yes                                          -> in-app
+"""
+
+
+def test_rule_anchors():
+    rules = FingerprintingRules.from_config_string(ANCHOR_TEST_RULES)
+    assert [rule.get_anchor() for rule in rules.rules] == [
+        ("exceptions", ("type",), False, "databaseunavailable"),
+        None,
+        ("exceptions", ("value",), False, "connection refused"),
+        ("frames", ("function",), False, "assertion_failed"),
+        ("frames", ("abs_path", "filename"), True, "src/app/"),
+        ("toplevel", ("message", "value"), False, "pan"),
+        ("log_info", ("logger",), False, "celery."),
+        ("tags", ("tags.server_name",), False, "web-"),
+        None,
+    ]
+
+
+@pytest.mark.parametrize("anchored", [True, False], ids=["anchored", "unanchored"])
+@pytest.mark.parametrize(
+    "event,fingerprint",
+    [
+        ({"exception": {"values": [{"type": "DatabaseUnavailable"}]}}, "database-unavailable"),
+        (
+            {"exception": {"values": [{"type": "ValueError", "value": "connection REFUSED"}]}},
+            "refused",
+        ),
+        ({"stacktrace": {"frames": [{"function": "index", "filename": "src/app/a.py"}]}}, "app"),
+        ({"logger": "celery.worker", "level": "error"}, "celery"),
+        ({"logger": "django", "tags": [["server_name", "web-1"]]}, "web"),
+        ({"logger": "django", "tags": [["server_name", "db-1"]]}, None),
+    ],
+)
+def test_rule_anchors_match(event, fingerprint, anchored, monkeypatch):
+    if not anchored:
+        monkeypatch.setattr(Rule, "get_anchor", lambda self: None)
+
+    rules = FingerprintingRules.from_config_string(ANCHOR_TEST_RULES)
+    rv = rules.get_fingerprint_values_for_event(event)
+    assert (rv[1] if rv is not None else None) == ([fingerprint] if fingerprint else None)
+
+
 def test_discover_field_parsing(insta_snapshot):
     rules = FingerprintingRules.from_config_string(
         """
@@ -1,7 +1,14 @@
 import pytest
+from django.test.utils import override_settings
 
+from sentry import eventstore
 from sentry.eventtypes.base import format_title_from_tree_label
-from sentry.grouping.api import detect_synthetic_exception, get_default_grouping_config_dict
+from sentry.grouping.api import (
+    detect_synthetic_exception,
+    get_default_grouping_config_dict,
+    get_grouping_components_cache_key,
+    load_grouping_config,
+)
 from sentry.grouping.component import GroupingComponent
 from sentry.grouping.strategies.configurations import CONFIGURATIONS
 from sentry.utils import json
@@ -76,3 +83,37 @@ def test_event_hash_variant(config_name, grouping_input, insta_snapshot, log):
     assert evt.get_grouping_config() == grouping_config
 
     insta_snapshot(output)
+
+
+@with_grouping_input("grouping_input")
+def test_component_cache(grouping_input):
+    grouping_config = get_default_grouping_config_dict()
+
+    def get_variants():
+        evt = grouping_input.create_event(dict(grouping_config))
+        evt.project = None
+        return {key: value.as_dict() for key, value in evt.get_grouping_variants().items()}
+
+    expected = get_variants()
+
+    with override_settings(SENTRY_GROUPING_COMPONENT_CACHE_SIZE=100):
+        # The first call populates the cache, the second one is served from it
+        assert get_variants() == expected
+        assert get_variants() == expected
+
+
+def test_component_cache_key():
+    config = load_grouping_config(get_default_grouping_config_dict())
+
+    def get_key(**frame):
+        frame.setdefault("function", "foo")
+        evt = eventstore.create_event(
+            data={"platform": "python", "stacktrace": {"frames": [frame]}}
+        )
+        return get_grouping_components_cache_key(evt, config)
+
+    assert get_key() == get_key()
+    # Grouping never looks at local variables
+    assert get_key(vars={"x": 1}) == get_key(vars={"x": 2})
+    assert get_key(function="bar") != get_key()
+    assert get_key(in_app=True) != get_key(in_app=False)
@@ -2,16 +2,23 @@ import time
 import uuid
 
 import pytest
+from django.core.cache import cache
 
+from sentry import nodestore
 from sentry.event_manager import EventManager
+from sentry.eventstore.models import Event
 from sentry.ingest.ingest_consumer import (
+    EventSaveBatch,
+    IngestConsumerWorker,
     process_attachment_chunk,
     process_event,
     process_individual_attachment,
     process_userreport,
 )
 from sentry.models import EventAttachment, EventUser, File, UserReport
+from sentry.tasks.store import EventBatchNotSaved
 from sentry.utils import json
+from sentry.utils.compat import mock
 
 
 def get_normalized_event(data, project):
@@ -60,6 +67,159 @@ def test_deduplication_works(default_project, task_runner, preprocess_event):
     }
 
 
+@pytest.mark.django_db
+def test_batch_save(default_project, task_runner, preprocess_event):
+    now = time.time()
+    transaction = get_normalized_event(
+        {
+            "type": "transaction",
+            "transaction": "/hello",
+            "timestamp": now,
+            "start_timestamp": now - 1,
+            "contexts": {"trace": {"trace_id": uuid.uuid4().hex, "span_id": "bf5be759039ede9a"}},
+            "spans": [],
+        },
+        default_project,
+    )
+    error = get_normalized_event({"message": "hello world"}, default_project)
+    project_id = default_project.id
+    projects = {project_id: default_project}
+    save_batch = EventSaveBatch()
+
+    for payload in (transaction, transaction, error):
+        process_event(
+            {
+                "payload": json.dumps(payload),
+                "start_time": now,
+                "event_id": payload["event_id"],
+                "project_id": project_id,
+                "remote_addr": "127.0.0.1",
+            },
+            projects=projects,
+            save_batch=save_batch,
+        )
+
+    # Only the error goes through preprocess_event, the duplicate is dropped.
+    (kwargs,) = preprocess_event
+    assert kwargs["event_id"] == error["event_id"]
+    assert len(save_batch) == 1
+
+    node_id = Event.generate_node_id(project_id, transaction["event_id"])
+    assert nodestore.get(node_id) is None
+    assert cache.get(f"ev:{project_id}:{transaction['event_id']}") is None
+
+    with task_runner():
+        save_batch.save(projects)
+
+    assert nodestore.get(node_id)["transaction"] == "/hello"
+    assert cache.get(f"ev:{project_id}:{transaction['event_id']}") is not None
+
+
+@pytest.mark.django_db
+def test_batch_save_bad_event(default_project, task_runner, monkeypatch):
+    from sentry import event_manager
+
+    get_event_user_many = event_manager._get_event_user_many
+
+    def broken_get_event_user_many(jobs, projects):
+        if any(job["data"]["transaction"] == "/bad" for job in jobs):
+            raise ValueError("bad event")
+        return get_event_user_many(jobs, projects)
+
+    monkeypatch.setattr(event_manager, "_get_event_user_many", broken_get_event_user_many)
+
+    now = time.time()
+    project_id = default_project.id
+    save_batch = EventSaveBatch()
+    finished = []
+    for name in ("/good", "/bad"):
+        transaction = get_normalized_event(
+            {
+                "type": "transaction",
+                "transaction": name,
+                "timestamp": now,
+                "start_timestamp": now - 1,
+                "contexts": {
+                    "trace": {"trace_id": uuid.uuid4().hex, "span_id": "bf5be759039ede9a"}
+                },
+                "spans": [],
+            },
+            default_project,
+        )
+        save_batch.add(
+            f"e:{transaction['event_id']}:{project_id}",
+            transaction,
+            now,
+            transaction["event_id"],
+            lambda name=name: finished.append(name),
+        )
+
+    # The batch fails before storing anything, the good event is saved alone
+    with task_runner():
+        save_batch.save({project_id: default_project})
+    assert finished == ["/good"]
+    good, bad = save_batch.events
+    assert nodestore.get(Event.generate_node_id(project_id, good["event_id"])) is not None
+    assert nodestore.get(Event.generate_node_id(project_id, bad["event_id"])) is None
+
+
+def make_save_batch(event_ids, finished):
+    save_batch = EventSaveBatch()
+    for event_id in event_ids:
+        save_batch.add(
+            f"e:{event_id}",
+            {"event_id": event_id},
+            time.time(),
+            event_id,
+            lambda event_id=event_id: finished.append(event_id),
+        )
+    return save_batch
+
+
+def test_batch_save_failure(monkeypatch):
+    saved = []
+
+    def save_event_batch(events, projects):
+        if any(event["event_id"] == "bad" for event in events):
+            if len(events) > 1:
+                raise EventBatchNotSaved()
+            raise ValueError("bad event")
+        saved.extend(event["event_id"] for event in events)
+
+    monkeypatch.setattr("sentry.ingest.ingest_consumer.save_event_batch", save_event_batch)
+    finished = []
+    save_batch = make_save_batch(("a", "bad", "b"), finished)
+
+    # The bad event doesn't keep the others from being saved
+    save_batch.save({})
+    assert saved == ["a", "b"]
+    assert finished == ["a", "b"]
+
+
+def test_batch_save_late_failure(monkeypatch):
+    calls = []
+
+    def save_event_batch(events, projects):
+        calls.append([event["event_id"] for event in events])
+        raise ValueError("eventstream is down")
+
+    monkeypatch.setattr("sentry.ingest.ingest_consumer.save_event_batch", save_event_batch)
+    finished = []
+    save_batch = make_save_batch(("a", "b"), finished)
+
+    # Events may have been counted already, so they aren't saved again
+    save_batch.save({})
+    assert calls == [["a", "b"]]
+    assert finished == []
+
+
+@pytest.mark.django_db
+def test_flush_batch_clears_nodestore_cache():
+    with mock.patch("sentry.ingest.ingest_consumer.clear_local_cache") as clear_local_cache:
+        IngestConsumerWorker().flush_batch([])
+    assert clear_local_cache.call_count == 1
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize("missing_chunks", (True, False))
 def test_with_attachments(default_project, task_runner, missing_chunks, monkeypatch):
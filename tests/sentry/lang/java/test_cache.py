@@ -0,0 +1,126 @@
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+from django.test import override_settings
+
+from sentry.lang.java import cache as cache_module
+from sentry.lang.java.cache import open_mapping_view
+from sentry.testutils.skips import requires_benchmark
+from sentry.utils.compat import mock
+
+PROGUARD_UUID = "6dc7fdb0-d2fb-4c8e-9d6b-bb1aa98929b1"
+
+
+def write_mapping(path, classes=10, methods=10):
+    # Obfuscated classes ``a.a{i}`` with methods ``m{j}``, each of which got
+    # ``foo`` inlined into it.
+    with open(path, "w") as f:
+        for i in range(classes):
+            f.write(f"com.example.app.Class{i} -> a.a{i}:\n")
+            for j in range(methods):
+                line = j * 10 + 1
+                f.write(f"    {line}:{line}:void foo():{line + 100}:{line + 100} -> m{j}\n")
+                f.write(f"    {line}:{line}:void method{j}():{line + 5}:{line + 5} -> m{j}\n")
+
+
+class MappingViewCacheTest(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, "proguard.txt")
+        write_mapping(self.path)
+
+        for lru in (cache_module._mapper_cache, cache_module._remap_cache):
+            lru.clear()
+            self.addCleanup(lru.clear)
+
+    def test_remap(self):
+        view = open_mapping_view(PROGUARD_UUID, self.path)
+        assert view.has_line_info
+        assert view.remap_class("a.a1") == "com.example.app.Class1"
+        assert view.remap_class("a.b") is None
+
+        mapped = view.remap_frame("a.a1", "m2", 21)
+        assert [(f.class_name, f.method, f.line) for f in mapped] == [
+            ("com.example.app.Class1", "foo", 121),
+            ("com.example.app.Class1", "method2", 26),
+        ]
+
+    def test_disabled(self):
+        assert open_mapping_view(PROGUARD_UUID, self.path) is not open_mapping_view(
+            PROGUARD_UUID, self.path
+        )
+        assert len(cache_module._mapper_cache) == 0
+
+    @override_settings(SENTRY_PROGUARD_MAPPER_CACHE_SIZE=1024 * 1024)
+    def test_shared(self):
+        view = open_mapping_view(PROGUARD_UUID, self.path)
+        assert open_mapping_view(PROGUARD_UUID, self.path) is view
+        assert view.size == os.path.getsize(self.path)
+
+        # The same mapping of another project is opened on its own
+        other_path = self.path + ".other"
+        shutil.copy(self.path, other_path)
+        assert open_mapping_view(PROGUARD_UUID, other_path) is not view
+
+    def test_evicted_views_stay_usable(self):
+        other_path = self.path + ".other"
+        shutil.copy(self.path, other_path)
+
+        with override_settings(SENTRY_PROGUARD_MAPPER_CACHE_SIZE=os.path.getsize(self.path)):
+            view = open_mapping_view(PROGUARD_UUID, self.path)
+            open_mapping_view(PROGUARD_UUID, other_path)
+
+        assert list(cache_module._mapper_cache) == [(PROGUARD_UUID, other_path)]
+        assert view.remap_class("a.a1") == "com.example.app.Class1"
+
+    @override_settings(SENTRY_PROGUARD_REMAP_CACHE_SIZE=10)
+    def test_remap_memo(self):
+        view = open_mapping_view(PROGUARD_UUID, self.path)
+        with mock.patch.object(view, "mapper", wraps=view.mapper) as mapper:
+            for _ in range(3):
+                assert view.remap_class("a.a1") == "com.example.app.Class1"
+                assert view.remap_class("a.b") is None
+                assert len(view.remap_frame("a.a1", "m2", 21)) == 2
+            assert mapper.remap_class.call_count == 2
+            assert mapper.remap_frame.call_count == 1
+
+
+@requires_benchmark
+@pytest.mark.parametrize(
+    "cache_sizes",
+    [(0, 0), (64 * 1024 * 1024, 0), (64 * 1024 * 1024, 10000)],
+    ids=["uncached", "mappers", "mappers-and-remaps"],
+)
+def test_benchmark_remap_android_crashes(cache_sizes, tmpdir, benchmark):
+    # A batch of 50 crashes of an app with 5000 classes, with 30 frames each.
+    # Like in real crash reports, most frames are in a few hot classes.
+    path = str(tmpdir.join("proguard.txt"))
+    write_mapping(path, classes=5000, methods=20)
+    rng = random.Random(42)
+    events = [
+        [(f"a.a{int(rng.paretovariate(1.2)) % 5000}", rng.randrange(20)) for _ in range(30)]
+        for _ in range(50)
+    ]
+
+    def run():
+        for frames in events:
+            view = open_mapping_view(PROGUARD_UUID, path)
+            for module, method in frames:
+                view.remap_class(module)
+                view.remap_frame(module, f"m{method}", method * 10 + 1)
+
+    mapper_cache_size, remap_cache_size = cache_sizes
+    try:
+        with override_settings(
+            SENTRY_PROGUARD_MAPPER_CACHE_SIZE=mapper_cache_size,
+            SENTRY_PROGUARD_REMAP_CACHE_SIZE=remap_cache_size,
+        ):
+            benchmark(run)
+    finally:
+        cache_module._mapper_cache.clear()
+        cache_module._remap_cache.clear()
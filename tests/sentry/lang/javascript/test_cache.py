@@ -1,6 +1,10 @@
 from unittest import TestCase
 
-from sentry.lang.javascript.cache import SourceCache
+from django.test import override_settings
+
+from sentry.lang.javascript import cache as cache_module
+from sentry.lang.javascript.cache import SourceCache, get_parsed_view
+from sentry.utils.compat.mock import Mock
 
 
 class BasicCacheTest(TestCase):
@@ -37,3 +41,42 @@ class BasicCacheTest(TestCase):
         # fall back to utf-8
         cache.add(url, "foobar".encode("utf-32"), encoding="utf-32")
         assert cache.get(url)[0] == "foobar"
+
+
+class ParsedViewCacheTest(TestCase):
+    def setUp(self):
+        cache_module._parsed_cache.clear()
+        self.addCleanup(cache_module._parsed_cache.clear)
+        self.release = Mock(id=1)
+        self.parse = Mock(side_effect=lambda body: object())
+
+    def get_view(self, body=b"foo", ident="http://example.com/foo.js", release=None):
+        return get_parsed_view("source", ident, body, self.parse, release=release or self.release)
+
+    def test_disabled(self):
+        assert self.get_view() is not self.get_view()
+        assert self.parse.call_count == 2
+        assert len(cache_module._parsed_cache) == 0
+
+    @override_settings(SENTRY_JS_PARSED_SOURCE_CACHE_SIZE=10)
+    def test_shared(self):
+        view = self.get_view()
+        assert self.get_view() is view
+        assert self.parse.call_count == 1
+
+        # Different contents, files or releases are parsed on their own
+        assert self.get_view(body=b"bar") is not view
+        assert self.get_view(ident="http://example.com/bar.js") is not view
+        assert self.get_view(release=Mock(id=2)) is not view
+        assert self.parse.call_count == 4
+
+    @override_settings(SENTRY_JS_PARSED_SOURCE_CACHE_SIZE=10)
+    def test_size(self):
+        view = self.get_view(body=b"x" * 6)
+        self.get_view(body=b"y" * 6)
+        assert self.get_view(body=b"x" * 6) is not view
+
+        # Files larger than the cache are never kept
+        self.get_view(body=b"x" * 11)
+        self.get_view(body=b"x" * 11)
+        assert self.parse.call_count == 5
@@ -1,16 +1,23 @@
 import errno
+import os
 import re
+import threading
+import time
 import unittest
 import zipfile
 from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import BytesIO
 
 import pytest
 import responses
+from django.test import override_settings
 from requests.exceptions import RequestException
 from symbolic import SourceMapTokenMatch
 
 from sentry import http, options
+from sentry.lang.javascript import cache as js_cache
+from sentry.lang.javascript import processor as js_processor
 from sentry.lang.javascript.errormapping import REACT_MAPPING_URL, rewrite_exception
 from sentry.lang.javascript.processor import (
     CACHE_CONTROL_MAX,
@@ -21,9 +28,11 @@ from sentry.lang.javascript.processor import (
     discover_sourcemap,
     fetch_file,
     fetch_release_archive_for_url,
+    fetch_release_artifact,
     fetch_release_file,
     fetch_sourcemap,
     generate_module,
+    get_cache_keys,
     get_max_age,
     get_release_file_cache_key,
     get_release_file_cache_key_meta,
@@ -34,12 +43,50 @@ from sentry.models import EventError, File, Release, ReleaseFile
 from sentry.models.releasefile import ARTIFACT_INDEX_FILENAME, update_artifact_index
 from sentry.testutils import TestCase
 from sentry.testutils.helpers.options import override_options
+from sentry.testutils.skips import requires_benchmark
 from sentry.utils import json
 from sentry.utils.compat.mock import ANY, MagicMock, call, patch
 from sentry.utils.strings import truncatechars
 
 base64_sourcemap = "data:application/json;base64,eyJ2ZXJzaW9uIjozLCJmaWxlIjoiZ2VuZXJhdGVkLmpzIiwic291cmNlcyI6WyIvdGVzdC5qcyJdLCJuYW1lcyI6W10sIm1hcHBpbmdzIjoiO0FBQUEiLCJzb3VyY2VzQ29udGVudCI6WyJjb25zb2xlLmxvZyhcImhlbGxvLCBXb3JsZCFcIikiXX0="
 
+
+def add_release_file(release, name, body, content_type):
+    file = File.objects.create(
+        name=name, type="release.file", headers={"Content-Type": content_type}
+    )
+    file.putfile(BytesIO(body))
+    return ReleaseFile.objects.create(
+        name=name, release_id=release.id, organization_id=release.organization_id, file=file
+    )
+
+
+def add_minified_release_files(release, lines=1000):
+    """
+    Adds ``app.min.js`` with a source map that maps every line to the same
+    line of ``app.js``.
+    """
+    source = "\n".join(f"function f{i}(a) {{ return a + {i}; }}" for i in range(lines))
+    minified = source + "\n//# sourceMappingURL=app.min.js.map"
+    sourcemap = {
+        "version": 3,
+        "file": "app.min.js",
+        "sources": ["app.js"],
+        "sourcesContent": [source],
+        "names": [],
+        "mappings": ";".join(["AAAA"] + ["AACA"] * (lines - 1)),
+    }
+    add_release_file(
+        release, "http://example.com/app.min.js", minified.encode("utf-8"), "text/javascript"
+    )
+    add_release_file(
+        release,
+        "http://example.com/app.min.js.map",
+        json.dumps(sourcemap).encode("utf-8"),
+        "application/json",
+    )
+
+
 unicode_body = b"""function add(a, b) {
     "use strict";
     return a + b; // f\xc3\xb4o
@@ -579,6 +626,59 @@ class FetchFileTest(TestCase):
         result2 = fetch_file("/example.js", release=release)
         assert result2 == result
 
+    def test_non_url_with_release_archive_index(self):
+        js_processor._archive_index_cache.clear()
+        self.addCleanup(js_processor._archive_index_cache.clear)
+
+        compressed = BytesIO()
+        with zipfile.ZipFile(compressed, mode="w") as zip_file:
+            zip_file.writestr("example.js", b"foo")
+            zip_file.writestr("other.js", b"bar", compress_type=zipfile.ZIP_DEFLATED)
+            zip_file.writestr(
+                "manifest.json",
+                json.dumps(
+                    {
+                        "files": {
+                            "example.js": {
+                                "url": "/example.js",
+                                "headers": {"content-type": "application/json"},
+                            },
+                            "other.js": {"url": "~/other.js"},
+                        }
+                    }
+                ),
+            )
+
+        release = Release.objects.create(version="1", organization_id=self.project.organization_id)
+        release.add_project(self.project)
+
+        compressed.seek(0)
+        file_ = File.objects.create(name="foo", type="release.bundle")
+        file_.putfile(compressed)
+        update_artifact_index(release, None, file_)
+
+        with override_settings(SENTRY_RELEASE_ARCHIVE_INDEX_CACHE_SIZE=1024 * 1024), patch(
+            "sentry.lang.javascript.processor.ReleaseArchiveIndex",
+            side_effect=js_processor.ReleaseArchiveIndex,
+        ) as archive_index, patch(
+            "sentry.lang.javascript.processor.fetch_release_archive_for_url"
+        ) as fetch_release_archive:
+            with pytest.raises(http.BadSource):
+                fetch_file("does-not-exist.js", release=release)
+
+            result = fetch_file("/example.js", release=release)
+            assert result.url == "/example.js"
+            assert result.body == b"foo"
+            assert result.headers == {"content-type": "application/json"}
+            assert result.encoding == "utf-8"
+
+            result = fetch_file("http://example.com/other.js", release=release)
+            assert result.body == b"bar"
+
+            # The archive is only indexed once, and never loaded as a whole
+            assert archive_index.call_count == 1
+            assert fetch_release_archive.call_count == 0
+
     def _create_archive(self, release, url):
         pseudo_archive = File.objects.create(name="", type="release.bundle")
         pseudo_archive.putfile(BytesIO(b"0123456789"))
@@ -1372,3 +1472,201 @@ class CacheSourceTest(TestCase):
         # now we have an error
         assert len(processor.cache.get_errors(abs_path)) == 1
         assert processor.cache.get_errors(abs_path)[0] == {"url": map_url, "type": "js_no_source"}
+
+    def test_parsed_views_are_shared(self):
+        js_cache._parsed_cache.clear()
+        self.addCleanup(js_cache._parsed_cache.clear)
+
+        project = self.create_project()
+        release = self.create_release(project=project, version="12.31.12")
+        add_minified_release_files(release)
+        abs_path = "http://example.com/app.min.js"
+
+        def get_views():
+            processor = JavaScriptStacktraceProcessor(
+                data={"release": release.version}, stacktrace_infos=None, project=project
+            )
+            processor.release = release
+            processor.cache_source(abs_path)
+            return processor.cache.get(abs_path), processor.sourcemaps.get_link(abs_path)[1]
+
+        assert get_views()[0] is not get_views()[0]
+
+        with override_settings(SENTRY_JS_PARSED_SOURCE_CACHE_SIZE=10 * 1024 * 1024):
+            source_view, sourcemap_view = get_views()
+            assert get_views() == (source_view, sourcemap_view)
+            assert sourcemap_view.lookup(9, 0).src_line == 9
+
+
+class FakeCDNHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        name = self.path.rsplit("/", 1)[-1]
+        if name.endswith(".map"):
+            body = json.dumps(
+                {
+                    "version": 3,
+                    "sources": [name[: -len(".min.js.map")] + ".js"],
+                    "sourcesContent": [f"// {name}"],
+                    "names": [],
+                    "mappings": "AAAA",
+                }
+            ).encode("utf-8")
+        else:
+            body = f"// {name}\n//# sourceMappingURL={name}.map".encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeCDN(ThreadingHTTPServer):
+    """Serves minified bundles and their source maps, each one after ``delay`` seconds."""
+
+    daemon_threads = True
+
+    def __init__(self, delay):
+        super().__init__(("127.0.0.1", 0), FakeCDNHandler)
+        self.delay = delay
+
+
+class PopulateSourceCacheTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeCDN(delay=0.1)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def populate(self, prefix, concurrency, bundles=10, max_fetches=None):
+        # Every call fetches from its own URLs, which aren't cached yet
+        base_url = f"http://127.0.0.1:{self.server.server_port}/{prefix}"
+        urls = [f"{base_url}/bundle{i}.min.js" for i in range(bundles)]
+        processor = JavaScriptStacktraceProcessor(
+            data={}, stacktrace_infos=None, project=self.project
+        )
+        if max_fetches is not None:
+            processor.max_fetches = max_fetches
+
+        start = time.monotonic()
+        with override_options({"processing.javascript-fetch-concurrency": concurrency}):
+            processor.populate_source_cache([{"abs_path": url, "lineno": 1} for url in urls])
+        duration = time.monotonic() - start
+
+        results = []
+        for url in urls:
+            source_view = processor.cache.get(url)
+            sourcemap_url, sourcemap_view = processor.sourcemaps.get_link(url)
+            inline_source = processor.cache.get(url[: -len(".min.js")] + ".js")
+            results.append(
+                (
+                    source_view and source_view[0],
+                    sourcemap_url and sourcemap_url[len(base_url) :],
+                    sourcemap_view is not None,
+                    inline_source and inline_source[0],
+                    processor.cache.get_errors(url),
+                )
+            )
+        return results, duration
+
+    def test_concurrent_fetches(self):
+        serial, serial_duration = self.populate("serial", 1)
+        concurrent, concurrent_duration = self.populate("concurrent", 10)
+
+        assert concurrent == serial
+        assert serial[0] == ("// bundle0.min.js", "/bundle0.min.js.map", True, "// bundle0.js", [])
+        # 10 bundles and 10 source maps one after the other, or all bundles and
+        # then all source maps at once
+        assert serial_duration >= 2.0
+        assert concurrent_duration < serial_duration / 2
+
+    def test_concurrent_fetches_max_fetches(self):
+        results, _ = self.populate("limited", 10, max_fetches=5)
+
+        assert len([result for result in results if result[0] is not None]) == 5
+        assert [result[4] for result in results if result[0] is None] == [
+            [{"type": EventError.JS_TOO_MANY_REMOTE_SOURCES}]
+        ] * 5
+
+    def test_concurrent_fetches_unexpected_error(self):
+        fetch_file = js_processor.fetch_file
+
+        def broken_fetch_file(url, **kwargs):
+            if url.endswith("/bundle3.min.js"):
+                raise RuntimeError("boom")
+            return fetch_file(url, **kwargs)
+
+        with patch.object(js_processor, "fetch_file", broken_fetch_file):
+            results, _ = self.populate("broken", 10)
+
+        # Only the broken fetch fails
+        assert results[3][0] is None
+        assert results[3][4] == [{"type": EventError.FETCH_GENERIC_ERROR, "url": ANY}]
+        assert len([result for result in results if result[0] is not None]) == 9
+
+
+@requires_benchmark
+@pytest.mark.django_db
+@pytest.mark.parametrize("cache_size", [0, 64 * 1024 * 1024], ids=["uncached", "cached"])
+def test_benchmark_symbolicate_release(cache_size, default_project, factories, benchmark):
+    # A batch of events with frames in the same 5000 line bundle of a release
+    release = factories.create_release(project=default_project, version="1.0")
+    add_minified_release_files(release, lines=5000)
+    abs_path = "http://example.com/app.min.js"
+    events = [[(i * 37 + j * 101) % 5000 + 1 for j in range(10)] for i in range(20)]
+
+    def run():
+        for linenos in events:
+            processor = JavaScriptStacktraceProcessor(
+                data={"release": release.version}, stacktrace_infos=None, project=default_project
+            )
+            processor.release = release
+            processor.get_sourceview(abs_path)
+            _, sourcemap_view = processor.sourcemaps.get_link(abs_path)
+            for lineno in linenos:
+                assert sourcemap_view.lookup(lineno - 1, 0).src_line == lineno - 1
+
+    js_cache._parsed_cache.clear()
+    try:
+        with override_settings(SENTRY_JS_PARSED_SOURCE_CACHE_SIZE=cache_size):
+            benchmark(run)
+    finally:
+        js_cache._parsed_cache.clear()
+
+
+@requires_benchmark
+@pytest.mark.django_db
+@pytest.mark.parametrize("index_cache_size", [0, 64 * 1024 * 1024], ids=["archive", "index"])
+def test_benchmark_release_archive(index_cache_size, default_project, factories, benchmark):
+    # A 100 MB bundle of 2000 files, of which a batch of events needs 20
+    release = factories.create_release(project=default_project, version="1.0")
+    compressed = BytesIO()
+    with zipfile.ZipFile(compressed, mode="w") as zip_file:
+        files = {}
+        for i in range(2000):
+            zip_file.writestr(f"file{i}.js", os.urandom(50 * 1024))
+            files[f"file{i}.js"] = {"url": f"~/file{i}.js"}
+        zip_file.writestr("manifest.json", json.dumps({"files": files}))
+
+    compressed.seek(0)
+    file_ = File.objects.create(name="bundle.zip", type="release.bundle")
+    file_.putfile(compressed)
+    update_artifact_index(release, None, file_)
+    urls = [f"http://example.com/file{i}.js" for i in range(0, 2000, 100)]
+
+    def run():
+        for url in urls:
+            assert fetch_release_artifact(url, release, None) is not None
+        # Only measure reading from the archive, not the cached artifacts
+        cache.delete_many([key for url in urls for key in get_cache_keys(url, release, None)])
+
+    js_processor._archive_index_cache.clear()
+    try:
+        with override_settings(SENTRY_RELEASE_ARCHIVE_INDEX_CACHE_SIZE=index_cache_size):
+            benchmark(run)
+    finally:
+        js_processor._archive_index_cache.clear()
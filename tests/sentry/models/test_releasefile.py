@@ -4,7 +4,7 @@ from datetime import datetime, timezone
 from io import BytesIO
 from threading import Thread
 from time import sleep
-from zipfile import ZipFile
+from zipfile import ZIP_BZIP2, ZIP_DEFLATED, ZIP_STORED, ZipFile
 
 import pytest
 
@@ -14,6 +14,7 @@ from sentry.models.distribution import Distribution
 from sentry.models.file import File
 from sentry.models.releasefile import (
     ARTIFACT_INDEX_FILENAME,
+    ReleaseArchiveIndex,
     _ArtifactIndexGuard,
     delete_from_artifact_index,
     read_artifact_index,
@@ -241,6 +242,51 @@ class ReleaseArchiveTestCase(TestCase):
 
 
 @pytest.mark.skip(reason="Causes 'There is 1 other session using the database.'")
+class CountingReader(BytesIO):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bytes_read = 0
+
+    def read(self, *args):
+        rv = super().read(*args)
+        self.bytes_read += len(rv)
+        return rv
+
+
+class ReleaseArchiveIndexTestCase(TestCase):
+    def test_read(self):
+        files = {f"file{i}.js": f"// {i}\n".encode() * 1000 for i in range(10)}
+        buffer = BytesIO()
+        with ZipFile(buffer, mode="w") as zf:
+            zf.writestr(
+                "manifest.json",
+                json.dumps(
+                    {
+                        "files": {
+                            filename: {"url": f"~/{filename}", "headers": {"x": filename}}
+                            for filename in files
+                        }
+                    }
+                ),
+            )
+            for i, (filename, content) in enumerate(files.items()):
+                zf.writestr(filename, content, [ZIP_STORED, ZIP_DEFLATED, ZIP_BZIP2][i % 3])
+
+        index = ReleaseArchiveIndex(buffer)
+        for i, (filename, content) in enumerate(files.items()):
+            assert index.get_filename_by_url(f"~/{filename}") == (filename, {"x": filename})
+
+            fileobj = CountingReader(buffer.getvalue())
+            assert index.read(filename, fileobj) == content
+            # Stored and deflated files are read on their own, everything
+            # else goes through ``zipfile``
+            if i % 3 != 2:
+                assert fileobj.bytes_read < len(content) + 100
+
+        with pytest.raises(KeyError):
+            index.get_filename_by_url("~/missing.js")
+
+
 class ArtifactIndexGuardTestCase(TransactionTestCase):
     tick = 0.1  # seconds
 
@@ -80,6 +80,15 @@ class TestDjangoNodeStorage:
         assert Node.objects.filter(id=node.id).exists()
         assert not Node.objects.filter(id=node2.id).exists()
 
+    def test_patchsets_outlive_nodes(self):
+        self.ns.deduplicate_interfaces = True
+        self.ns.set("a" * 32, {"message": "a", "modules": {"django": "2.2.24"}})
+
+        (patchset,) = Node.objects.filter(id__startswith="ps:")
+        node = Node.objects.get(id="a" * 32)
+        refresh_interval = timedelta(seconds=self.ns.patchset_refresh_interval)
+        assert patchset.timestamp >= node.timestamp + refresh_interval - timedelta(seconds=1)
+
     def test_cache(self):
         node_1 = ("a" * 32, {"foo": "a"})
         node_2 = ("b" * 32, {"foo": "b"})
@@ -3,10 +3,14 @@ Testsuite of backend-independent nodestore tests. Add your backend to the
 `ns` fixture to have it tested.
 """
 from contextlib import contextmanager
+from datetime import timedelta
 
 import pytest
 
+from sentry.nodestore.base import NodeStorage, clear_local_cache
 from sentry.nodestore.django.backend import DjangoNodeStorage
+from sentry.testutils.skips import requires_benchmark
+from sentry.utils.samples import load_data
 from tests.sentry.nodestore.bigtable.backend.tests import (
     MockedBigtableNodeStorage,
     get_temporary_bigtable_nodestorage,
@@ -36,6 +40,44 @@ def ns(request):
         yield ns
 
 
+@pytest.fixture
+def patchset_cache():
+    from sentry.nodestore import base
+
+    base._patchset_cache.clear()
+    yield base._patchset_cache
+    base._patchset_cache.clear()
+
+
+def test_deduplicate_interfaces(ns, patchset_cache):
+    ns.deduplicate_interfaces = True
+    modules = {"django": "2.2.24", "celery": "4.4.7"}
+    nodes = {
+        "node_1": {"message": "a", "modules": modules},
+        "node_2": {"message": "b", "modules": modules},
+    }
+    for id, data in nodes.items():
+        ns.set(id, data)
+    ns._delete_cache_items(list(nodes))
+    patchset_cache.clear()
+
+    stored = [ns._decode(ns._get_bytes(id), subkey=None) for id in nodes]
+    assert all("modules" not in data for data in stored)
+    assert (
+        len({checksum for data in stored for _, checksum, _ in data["__nodestore_patchsets"]}) == 1
+    )
+
+    assert ns.get("node_1") == nodes["node_1"]
+    ns._delete_cache_items(list(nodes))
+    assert ns.get_multi(list(nodes)) == nodes
+
+    # nodes written with deduplication stay readable once it is turned off
+    ns.deduplicate_interfaces = False
+    patchset_cache.clear()
+    ns._delete_cache_items(list(nodes))
+    assert ns.get_multi(list(nodes)) == nodes
+
+
 def test_get_multi(ns):
     nodes = [("a" * 32, {"foo": "a"}), ("b" * 32, {"foo": "b"})]
 
@@ -97,3 +139,123 @@ def test_set_subkeys(ns):
     ns.delete("node_1")
     assert ns.get("node_1") is None
     assert ns.get("node_1", subkey="other") is None
+
+
+class InMemoryNodeStorage(NodeStorage):
+    # no shared cache, so the local cache can be tested in isolation
+    cache = None
+
+    def __init__(self, storage, fetches=None, **options):
+        # ``NodeStorage`` is thread-local and re-runs ``__init__`` for every
+        # thread, so anything shared between threads is passed in.
+        super().__init__(**options)
+        self.storage = storage
+        self.fetches = fetches if fetches is not None else []
+
+    def _get_bytes(self, id):
+        return self.storage.get(id)
+
+    def _get_bytes_multi(self, id_list):
+        self.fetches.append(id_list)
+        return {id: self.storage.get(id) for id in id_list}
+
+    def _set_bytes(self, id, data, ttl=None):
+        self.storage[id] = data
+
+    def delete(self, id):
+        self.storage.pop(id, None)
+        self._delete_cache_item(id)
+
+
+def test_get_multi_concurrent():
+    fetches = []
+    ns = InMemoryNodeStorage({}, fetches, fetch_concurrency=4, fetch_chunk_size=2)
+    nodes = {f"node_{i}": {"foo": i} for i in range(9)}
+    for id, data in nodes.items():
+        ns.set(id, data)
+
+    assert ns.get_multi(list(nodes)) == nodes
+    assert sorted(map(len, fetches)) == [1, 2, 2, 2, 2]
+
+
+def test_local_cache():
+    storage = {}
+    ns = InMemoryNodeStorage(storage, local_cache_size=2)
+    ns.set("node_1", {"foo": "a"})
+    ns.set("node_2", {"foo": "b"})
+
+    storage.clear()
+    assert ns.get("node_1") == {"foo": "a"}
+    assert ns.get_multi(["node_1", "node_2"]) == {"node_1": {"foo": "a"}, "node_2": {"foo": "b"}}
+
+    ns.delete("node_1")
+    assert ns.get("node_1") is None
+
+    clear_local_cache()
+    assert ns.get("node_2") is None
+
+
+def test_local_cache_copies():
+    ns = InMemoryNodeStorage({}, local_cache_size=2)
+    data = {"foo": {"bar": "a"}}
+    ns.set("node_1", data)
+    data["foo"]["bar"] = "b"
+
+    # Neither the writer nor readers see each other's changes
+    node = ns.get("node_1")
+    assert node == {"foo": {"bar": "a"}}
+    node["foo"]["bar"] = "c"
+    assert ns.get("node_1") == {"foo": {"bar": "a"}}
+    ns.get_multi(["node_1"])["node_1"]["foo"]["bar"] = "d"
+    assert ns.get_multi(["node_1"]) == {"node_1": {"foo": {"bar": "a"}}}
+
+    clear_local_cache()
+
+
+@requires_benchmark
+@pytest.mark.parametrize("local_cache_size", [0, 100], ids=["uncached", "cached"])
+def test_benchmark_local_cache(local_cache_size, benchmark):
+    ns = InMemoryNodeStorage({}, local_cache_size=local_cache_size)
+    nodes = {f"node_{i}": load_data("python") for i in range(100)}
+    for id, data in nodes.items():
+        ns.set(id, data)
+
+    try:
+        assert benchmark(ns.get_multi, list(nodes)) == nodes
+    finally:
+        clear_local_cache()
+
+
+def test_patchsets_per_ttl(patchset_cache):
+    storage = {}
+    ns = InMemoryNodeStorage(storage, deduplicate_interfaces=True)
+    data = {"message": "a", "modules": {"django": "2.2.24"}}
+    ns.set("node_1", data)
+    ns.set("node_2", data, ttl=timedelta(days=90))
+
+    # A patchset written with a shorter TTL must not replace one with a longer
+    # TTL, so nodes with an explicit TTL reference patchsets of their own.
+    default_id, ttl_id = sorted(id for id in storage if id.startswith("ps:"))
+    assert ttl_id == f"{default_id}.{90 * 86400}"
+
+    patchset_cache.clear()
+    assert ns.get_multi(["node_1", "node_2"]) == {"node_1": data, "node_2": data}
+
+
+def test_missing_patchset(patchset_cache):
+    storage = {}
+    ns = InMemoryNodeStorage(storage, deduplicate_interfaces=True)
+    ns.set("node_1", {"message": "a", "modules": {"django": "2.2.24"}})
+    for id in [id for id in storage if id.startswith("ps:")]:
+        del storage[id]
+    ns.set("node_2", {"message": "b", "modules": {"flask": "2.0.1"}})
+    ns.set("node_3", {"message": "c"})
+    patchset_cache.clear()
+
+    # Only the node that lost its patchset is gone
+    assert ns.get("node_1") is None
+    assert ns.get_multi(["node_1", "node_2", "node_3"]) == {
+        "node_1": None,
+        "node_2": {"message": "b", "modules": {"flask": "2.0.1"}},
+        "node_3": {"message": "c"},
+    }
@@ -0,0 +1,138 @@
+import pickle
+import time
+import uuid
+import zlib
+
+import pytest
+
+from sentry.nodestore.base import json_dumps
+from sentry.nodestore.encoding import (
+    HEADER_ZSTD,
+    HEADER_ZSTD_DICT,
+    NodeEncoder,
+    UnknownDictionary,
+    get_dictionary_filename,
+    load_dictionaries,
+    train_dictionary,
+)
+from sentry.testutils.skips import requires_benchmark
+from sentry.utils.samples import load_data
+
+PLATFORMS = ("javascript", "python", "java", "cocoa")
+
+
+def make_corpus(platform, count=200):
+    """
+    Variations of a sample event that differ the way real events of one
+    project do: ids, timestamps and messages.
+    """
+    rv = []
+    base = load_data(platform)
+    for i in range(count):
+        data = dict(base)
+        data["event_id"] = uuid.uuid4().hex
+        data["timestamp"] = time.time() + i
+        data["message"] = f"Error number {i} in {platform}"
+        rv.append(json_dumps(data).encode("utf8"))
+    return rv
+
+
+@pytest.fixture(scope="module")
+def dictionaries():
+    return {
+        platform: [train_dictionary(make_corpus(platform), dict_size=16384, dict_id=100000 + i)]
+        for i, platform in enumerate(PLATFORMS)
+    }
+
+
+def test_passthrough():
+    encoder = NodeEncoder()
+    value = b'{"foo":"bar"}'
+    assert encoder.encode(value, platform="python") == value
+    assert encoder.decode(value) == value
+
+    legacy = pickle.dumps({"foo": "bar"})
+    assert encoder.decode(legacy) == legacy
+
+
+def test_zstd():
+    encoder = NodeEncoder(compression="zstd")
+    value = b'{"foo":"bar"}' * 100
+    encoded = encoder.encode(value, platform="python")
+    assert encoded.startswith(HEADER_ZSTD)
+    assert len(encoded) < len(value)
+    # readers don't need compression enabled
+    assert NodeEncoder().decode(encoded) == value
+
+
+def test_zstd_dictionary(dictionaries):
+    encoder = NodeEncoder(compression="zstd", dictionaries=dictionaries)
+    value = make_corpus("python", count=1)[0]
+
+    encoded = encoder.encode(value, platform="python")
+    assert encoded.startswith(HEADER_ZSTD_DICT)
+    assert encoder.decode(encoded) == value
+    assert NodeEncoder(dictionaries=dictionaries).decode(encoded) == value
+    with pytest.raises(UnknownDictionary):
+        NodeEncoder().decode(encoded)
+
+    # platforms without a dictionary fall back to plain zstd
+    encoded = encoder.encode(value, platform="ruby")
+    assert encoded.startswith(HEADER_ZSTD)
+    assert encoder.decode(encoded) == value
+
+
+def test_retrained_dictionaries(tmpdir):
+    corpus = make_corpus("python", count=50)
+    old, new = (train_dictionary(corpus, dict_size=16384, dict_id=i) for i in (100000, 100001))
+    legacy = train_dictionary(corpus, dict_size=16384, dict_id=200000)
+    tmpdir.join("python.dict").write_binary(legacy.as_bytes())
+    for dictionary in (new, old):
+        tmpdir.join(get_dictionary_filename("python", dictionary)).write_binary(
+            dictionary.as_bytes()
+        )
+
+    dictionaries = load_dictionaries.__wrapped__(str(tmpdir))
+    assert [d.dict_id() for d in dictionaries["python"]] == [200000, 100000, 100001]
+
+    # Writes use the newest dictionary, payloads of the older ones stay readable
+    encoder = NodeEncoder(compression="zstd", dictionaries=dictionaries)
+    encoded = encoder.encode(corpus[0], platform="python")
+    assert encoded == NodeEncoder(compression="zstd", dictionaries={"python": [new]}).encode(
+        corpus[0], platform="python"
+    )
+    for dictionary in (old, legacy):
+        old_encoder = NodeEncoder(compression="zstd", dictionaries={"python": [dictionary]})
+        assert encoder.decode(old_encoder.encode(corpus[0], platform="python")) == corpus[0]
+
+
+def test_dictionary_compresses_better(dictionaries):
+    plain = NodeEncoder(compression="zstd")
+    encoder = NodeEncoder(compression="zstd", dictionaries=dictionaries)
+    for platform in PLATFORMS:
+        corpus = make_corpus(platform, count=20)
+        with_dict = sum(len(encoder.encode(v, platform=platform)) for v in corpus)
+        without_dict = sum(len(plain.encode(v, platform=platform)) for v in corpus)
+        zlib_size = sum(len(zlib.compress(v)) for v in corpus)
+        assert with_dict < without_dict
+        assert with_dict < zlib_size
+
+
+@requires_benchmark
+@pytest.mark.parametrize("platform", PLATFORMS)
+@pytest.mark.parametrize("codec", ["zlib", "zstd", "zstd-dict"])
+def test_benchmark_decode(platform, codec, dictionaries, benchmark):
+    corpus = make_corpus(platform, count=50)
+    if codec == "zlib":
+        encoded = [zlib.compress(v) for v in corpus]
+        decode = zlib.decompress
+    else:
+        encoder = NodeEncoder(
+            compression="zstd", dictionaries=dictionaries if codec == "zstd-dict" else None
+        )
+        encoded = [encoder.encode(v, platform=platform) for v in corpus]
+        decode = encoder.decode
+
+    benchmark.extra_info["bytes"] = sum(map(len, encoded))
+    benchmark.extra_info["raw_bytes"] = sum(map(len, corpus))
+    benchmark(lambda: [decode(v) for v in encoded])
@@ -11,6 +11,7 @@ from sentry.ownership.grammar import (
     parse_code_owners,
     parse_rules,
 )
+from sentry.ownership.ruleset import OwnershipRuleset
 
 fixture_data = """
 # cool stuff comment
@@ -196,6 +197,9 @@ def _assert_matcher(matcher: Matcher, path_details, expected):
     frames = {"stacktrace": {"frames": path_details}}
     assert matcher.test(frames) == expected
 
+    rule = Rule(matcher, [])
+    assert OwnershipRuleset([rule]).get_matching_rules(frames) == ([rule] if expected else [])
+
 
 @pytest.mark.parametrize(
     "path_details, expected",
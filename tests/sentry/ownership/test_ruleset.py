@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from sentry.ownership.grammar import Matcher, Owner, Rule, dump_schema
+from sentry.ownership.ruleset import (
+    ANCHOR_SEGMENT_END,
+    ANCHOR_SEGMENT_START,
+    ANCHOR_START,
+    OwnershipRuleset,
+    get_codeowners_anchor,
+    get_ownership_ruleset,
+)
+from sentry.testutils.skips import requires_benchmark
+
+
+def make_codeowners_rules(count, seed=0):
+    """A CODEOWNERS file of a large monorepo, converted to ownership rules"""
+    rng = random.Random(seed)
+    dirs = ["src", "app", "lib", "core", "api", "utils", "components", "static", "tests"]
+    rules = []
+    for i in range(count):
+        parts = [f"{rng.choice(dirs)}{rng.randrange(20)}" for _ in range(rng.randint(1, 4))]
+        pattern = rng.choice(
+            [
+                "/" + "/".join(parts) + "/",
+                "/".join(parts) + "/*.py",
+                "/" + "/".join(parts) + "/**/test_*",
+                parts[-1] + "/",
+                f"*.ext{i}",
+            ]
+        )
+        rules.append(Rule(Matcher("codeowners", pattern), [Owner("team", f"team-{i % 50}")]))
+    return rules
+
+
+def make_event(paths):
+    return {"stacktrace": {"frames": [{"filename": path} for path in paths]}}
+
+
+def make_paths(count, seed=1):
+    rng = random.Random(seed)
+    dirs = ["src", "app", "lib", "core", "api", "utils", "components", "static", "tests"]
+    rv = []
+    for _ in range(count):
+        parts = [f"{rng.choice(dirs)}{rng.randrange(20)}" for _ in range(rng.randint(1, 5))]
+        rv.append(rng.choice(["", "/"]) + "/".join(parts) + rng.choice(["/foo.py", "/test_x.js"]))
+    return rv
+
+
+@pytest.mark.parametrize(
+    "pattern, anchor",
+    [
+        ("*", None),
+        ("**/foo", None),
+        ("\\foo", None),
+        ("*.py", (ANCHOR_SEGMENT_END, ".py")),
+        ("test.py", (ANCHOR_SEGMENT_START, "test.py")),
+        ("docs/", (ANCHOR_SEGMENT_START, "docs")),
+        ("/docs/", (ANCHOR_START, "docs")),
+        ("src/foo/*.py", (ANCHOR_START, "src/foo/")),
+        ("/src/f?o", (ANCHOR_START, "src/f")),
+    ],
+)
+def test_get_codeowners_anchor(pattern, anchor):
+    assert get_codeowners_anchor(pattern) == anchor
+
+
+def test_matches_like_rules():
+    rules = make_codeowners_rules(500)
+    rules += [
+        Rule(Matcher("path", "*.py"), [Owner("team", "python")]),
+        Rule(Matcher("module", "foo.*"), [Owner("team", "foo")]),
+        Rule(Matcher("tags.environment", "prod"), [Owner("team", "prod")]),
+    ]
+    ruleset = OwnershipRuleset(rules)
+
+    rng = random.Random(2)
+    paths = make_paths(200)
+    for _ in range(100):
+        data = make_event(rng.sample(paths, 10))
+        data["stacktrace"]["frames"].append({"module": "foo.bar"})
+        data["tags"] = [["environment", rng.choice(["prod", "dev"])]]
+        assert ruleset.get_matching_rules(data) == [rule for rule in rules if rule.test(data)]
+
+
+def test_get_ownership_ruleset():
+    schema = dump_schema(make_codeowners_rules(10))
+
+    ruleset = get_ownership_ruleset(("test", 1), schema)
+    assert get_ownership_ruleset(("test", 1), dict(schema)) is ruleset
+
+    schema["rules"] = schema["rules"][1:]
+    changed = get_ownership_ruleset(("test", 1), schema)
+    assert changed is not ruleset
+    assert len(changed.rules) == 9
+
+
+@requires_benchmark
+@pytest.mark.parametrize("compiled", [True, False], ids=["compiled", "rules"])
+def test_benchmark_codeowners(compiled, benchmark):
+    rules = make_codeowners_rules(5000)
+    ruleset = OwnershipRuleset(rules)
+    data = make_event(make_paths(30))
+
+    if compiled:
+        benchmark(ruleset.get_matching_rules, data)
+    else:
+        benchmark(lambda: [rule for rule in rules if rule.test(data)])
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import pytz
+
+from sentry.rules.conditions.event_frequency import FrequencyQueryBatch
+from sentry.tsdb.base import TSDBModel
+from sentry.tsdb.inmemory import InMemoryTSDB
+from sentry.utils.compat import mock
+
+
+class FrequencyQueryBatchTest(TestCase):
+    def setUp(self):
+        self.tsdb = InMemoryTSDB()
+        self.now = datetime(2021, 6, 1, 12, 30, 15, tzinfo=pytz.UTC)
+        for minutes in range(0, 60 * 24 * 2, 7):
+            self.tsdb.incr(TSDBModel.group, 1, self.now - timedelta(minutes=minutes))
+            self.tsdb.incr(
+                TSDBModel.group, 1, self.now - timedelta(minutes=minutes), environment_id=2
+            )
+
+    def get_batch(self):
+        return FrequencyQueryBatch(tsdb=self.tsdb, now=self.now)
+
+    def test_overlapping_windows_share_query(self):
+        batch = self.get_batch()
+        windows = [
+            (self.now - timedelta(hours=1), self.now),
+            (self.now - timedelta(hours=2), self.now - timedelta(hours=1)),
+            (self.now - timedelta(minutes=30), self.now),
+        ]
+        for start, end in windows:
+            batch.add_sums(TSDBModel.group, 1, start, end)
+
+        with mock.patch.object(self.tsdb, "get_range", wraps=self.tsdb.get_range) as get_range:
+            for start, end in windows:
+                assert batch.get_sums(TSDBModel.group, [1], start, end) == self.tsdb.get_sums(
+                    TSDBModel.group, [1], start, end
+                )
+            # the direct ``get_sums`` calls above go through ``get_range``, too
+            assert get_range.call_count == 1 + len(windows)
+
+    def test_windows_are_grouped_by_rollup_and_environment(self):
+        batch = self.get_batch()
+        windows = [
+            (self.now - timedelta(hours=1), self.now, None),
+            (self.now - timedelta(hours=1), self.now, 2),
+            (self.now - timedelta(days=1), self.now, None),
+        ]
+        for start, end, environment_id in windows:
+            batch.add_sums(TSDBModel.group, 1, start, end, environment_id)
+
+        with mock.patch.object(self.tsdb, "get_range", wraps=self.tsdb.get_range) as get_range:
+            results = [
+                batch.get_sums(TSDBModel.group, [1], start, end, environment_id=environment_id)
+                for start, end, environment_id in windows
+            ]
+            assert get_range.call_count == 3
+
+        assert results == [
+            self.tsdb.get_sums(TSDBModel.group, [1], start, end, environment_id=environment_id)
+            for start, end, environment_id in windows
+        ]
+
+    def test_unregistered_queries(self):
+        batch = self.get_batch()
+        start = self.now - timedelta(hours=1)
+        batch.add_sums(TSDBModel.group, 1, start, self.now)
+
+        with mock.patch.object(self.tsdb, "get_sums", wraps=self.tsdb.get_sums) as get_sums:
+            assert batch.get_sums(TSDBModel.group, [1], start, self.now - timedelta(minutes=1)) == (
+                self.tsdb.get_sums(TSDBModel.group, [1], start, self.now - timedelta(minutes=1))
+            )
+            assert get_sums.call_count == 2
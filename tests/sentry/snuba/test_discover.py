@@ -1,9 +1,12 @@
 from datetime import datetime, timedelta
+from random import Random
 
 import pytest
+import pytz
 from django.utils import timezone
 
 from sentry.discover.arithmetic import ArithmeticValidationError
+from sentry.eventstore import Filter
 from sentry.discover.models import TeamKeyTransaction
 from sentry.exceptions import InvalidSearchQuery
 from sentry.models import (
@@ -27,9 +30,10 @@ from sentry.search.events.constants import (
 from sentry.snuba import discover
 from sentry.testutils import SnubaTestCase, TestCase
 from sentry.testutils.helpers.datetime import before_now, iso_format
+from sentry.testutils.skips import requires_benchmark
 from sentry.utils.compat.mock import patch
 from sentry.utils.samples import load_data
-from sentry.utils.snuba import Dataset, get_array_column_alias
+from sentry.utils.snuba import Dataset, get_array_column_alias, get_snuba_translators
 
 ARRAY_COLUMNS = ["measurements", "span_op_breakdowns"]
 
@@ -6616,3 +6620,30 @@ class ArithmeticTest(SnubaTestCase, TestCase):
         results = discover.query(**query_params)
         assert len(results["data"]) == 3
         assert [result["equation[0]"] for result in results["data"]] == [None, None, 2]
+
+
+@requires_benchmark
+def test_benchmark_timeseries_post_processing(benchmark):
+    # 10 rows for each of 1000 buckets, with every 7th one missing
+    start = datetime(2021, 6, 1, tzinfo=pytz.utc)
+    rnd = Random(1)
+    rows = [
+        {
+            "time": (start + timedelta(minutes=i // 10)).isoformat(),
+            "transaction": f"/api/{i % 10}/",
+            "count": rnd.randint(0, 100),
+            "p95_transaction_duration": rnd.random() * 1000,
+        }
+        for i in range(10000)
+        if (i // 10) % 7
+    ]
+    snuba_filter = Filter(
+        start=start, end=start + timedelta(minutes=1000), rollup=60, orderby="time"
+    )
+    _, reverse = get_snuba_translators({})
+
+    def run():
+        result = {"data": [reverse(dict(row)) for row in rows], "meta": []}
+        discover.transform_data(result, {}, snuba_filter)
+
+    benchmark(run)
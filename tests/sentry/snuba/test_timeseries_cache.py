@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+
+import pytz
+from freezegun import freeze_time
+
+from sentry.snuba.dataset import Dataset
+from sentry.snuba.timeseries_cache import bulk_timeseries_query, get_fingerprint
+from sentry.testutils import TestCase
+from sentry.utils.compat import mock
+from sentry.utils.dates import to_timestamp
+from sentry.utils.snuba import SnubaQueryParams
+
+NOW = datetime(2021, 6, 1, 12, 34, 56, tzinfo=pytz.UTC)
+
+
+class FakeSnuba:
+    """
+    Counts events per bucket like Snuba does, only counting events within
+    the window of the query and already received at the time of the query.
+    """
+
+    def __init__(self, timestamps):
+        self.timestamps = [to_timestamp(ts) for ts in timestamps]
+        self.queries = []
+
+    def __call__(self, snuba_param_list, referrer=None):
+        now = to_timestamp(datetime.now(pytz.UTC))
+        rv = []
+        for query_params in snuba_param_list:
+            self.queries.append((query_params.start, query_params.end))
+            start, end = to_timestamp(query_params.start), to_timestamp(query_params.end)
+            counts = {}
+            for ts in self.timestamps:
+                if start <= ts < end and ts <= now:
+                    bucket = int(ts // query_params.rollup * query_params.rollup)
+                    counts[bucket] = counts.get(bucket, 0) + 1
+            rv.append(
+                {
+                    "data": [
+                        {"time": time, "count": count} for time, count in sorted(counts.items())
+                    ],
+                    "meta": [{"name": "count", "type": "UInt64"}],
+                }
+            )
+        return rv
+
+
+def make_query_params(start, end, rollup=3600, conditions=None):
+    return SnubaQueryParams(
+        dataset=Dataset.Discover,
+        start=start,
+        end=end,
+        rollup=rollup,
+        groupby=["time"],
+        orderby="time",
+        conditions=conditions or [],
+        aggregations=[["count()", "", "count"]],
+        limit=10000,
+    )
+
+
+class TimeseriesCacheTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.snuba = FakeSnuba(NOW - timedelta(minutes=m) for m in range(0, 60 * 48, 7))
+
+    def query(self, start, end, **kwargs):
+        with self.settings(
+            SENTRY_DISCOVER_TIMESERIES_CACHE_TTL_SECONDS=3600,
+            SENTRY_DISCOVER_TIMESERIES_CACHE_CLOSED_LAG_SECONDS=600,
+        ):
+            (result,) = bulk_timeseries_query(
+                [make_query_params(start, end, **kwargs)], query_fn=self.snuba
+            )
+        return result["data"]
+
+    def uncached_query(self, start, end, **kwargs):
+        (result,) = self.snuba([make_query_params(start, end, **kwargs)])
+        return result["data"]
+
+    def test_refresh_queries_open_buckets(self):
+        with freeze_time(NOW):
+            start = NOW - timedelta(hours=24)
+            result = self.query(start, NOW)
+            assert self.snuba.queries == [(start, NOW)]
+            assert result == self.uncached_query(start, NOW)
+
+        later = NOW + timedelta(minutes=5)
+        with freeze_time(later):
+            self.snuba.queries = []
+            start = later - timedelta(hours=24)
+            result = self.query(start, later)
+
+            # The partial first bucket, and everything from the first bucket
+            # that wasn't closed yet at the time of the first query.
+            hour = NOW.replace(minute=0, second=0)
+            assert self.snuba.queries == [
+                (start, hour - timedelta(hours=23)),
+                (hour, later),
+            ]
+            assert result == self.uncached_query(start, later)
+
+    def test_late_events(self):
+        start = NOW - timedelta(hours=6)
+        with freeze_time(NOW):
+            self.query(start, NOW, rollup=300)
+
+        # Buckets that closed less than the lag ago pick up late events.
+        self.snuba.timestamps.append(to_timestamp(NOW.replace(minute=24, second=0)))
+        with freeze_time(NOW):
+            assert self.query(start, NOW, rollup=300) == self.uncached_query(start, NOW, rollup=300)
+
+    def test_past_window(self):
+        hour = NOW.replace(minute=0, second=0)
+        start, end = NOW - timedelta(hours=30), hour - timedelta(hours=6)
+        with freeze_time(NOW):
+            expected = self.uncached_query(start, end)
+            assert self.query(start, end) == expected
+
+            self.snuba.queries = []
+            assert self.query(start, end) == expected
+            # Only the partial first bucket is left to query.
+            assert self.snuba.queries == [(start, hour - timedelta(hours=29))]
+
+    def test_comparison_query(self):
+        start = NOW - timedelta(hours=24)
+        previous_start, previous_end = start - timedelta(hours=24), NOW - timedelta(hours=24)
+        with freeze_time(NOW), mock.patch(
+            "sentry.snuba.timeseries_cache.MAX_CACHED_BUCKETS", 30
+        ), self.settings(
+            SENTRY_DISCOVER_TIMESERIES_CACHE_TTL_SECONDS=3600,
+            SENTRY_DISCOVER_TIMESERIES_CACHE_CLOSED_LAG_SECONDS=600,
+        ):
+            self.query(previous_start, previous_end)
+
+            # Both windows share a cache entry, the buckets of the current one
+            # push the ones of the previous window out of it.
+            result, previous_result = bulk_timeseries_query(
+                [make_query_params(start, NOW), make_query_params(previous_start, previous_end)],
+                query_fn=self.snuba,
+            )
+            assert result["data"] == self.uncached_query(start, NOW)
+            assert previous_result["data"] == self.uncached_query(previous_start, previous_end)
+
+    def test_fingerprint(self):
+        start = NOW - timedelta(hours=24)
+        query_params = make_query_params(start, NOW)
+        assert get_fingerprint(query_params) == get_fingerprint(
+            make_query_params(start - timedelta(days=1), NOW - timedelta(days=1))
+        )
+        assert get_fingerprint(query_params) != get_fingerprint(
+            make_query_params(start, NOW, rollup=300)
+        )
+        assert get_fingerprint(query_params) != get_fingerprint(
+            make_query_params(start, NOW, conditions=[["environment", "=", "prod"]])
+        )
+
+        query_params.groupby = ["project_id"]
+        assert get_fingerprint(query_params) is None
@@ -2,11 +2,15 @@ import pytest
 
 from sentry.grouping.api import get_default_grouping_config_dict, load_grouping_config
 from sentry.stacktraces.processing import (
+    StacktraceProcessor,
     find_stacktraces_in_data,
     get_crash_frame_from_event_data,
     normalize_stacktraces_for_grouping,
+    process_stacktraces,
 )
 from sentry.testutils import TestCase
+from sentry.utils.cache import cache
+from sentry.utils.compat import mock
 
 
 class FindStacktracesTest(TestCase):
@@ -419,3 +423,57 @@ class NormalizeInApptest(TestCase):
 )
 def test_get_crash_frame(event):
     assert get_crash_frame_from_event_data(event)["marco"] == "polo"
+
+
+class UppercaseProcessor(StacktraceProcessor):
+    """Uppercases function names"""
+
+    processed = 0
+
+    def handles_frame(self, frame, stacktrace_info):
+        return True
+
+    def preprocess_frame(self, processable_frame):
+        processable_frame.set_cache_key_from_values([processable_frame["function"]])
+
+    def process_frame(self, processable_frame, processing_task):
+        function = processable_frame.cache_value
+        if function is None:
+            UppercaseProcessor.processed += 1
+            function = processable_frame["function"].upper()
+            processable_frame.set_cache_value(function)
+        return [dict(processable_frame.frame, function=function)], None, None
+
+
+class FrameCacheTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        UppercaseProcessor.processed = 0
+        cache.clear()
+
+    def process(self, functions):
+        data = {
+            "platform": "python",
+            "stacktrace": {"frames": [{"function": function} for function in functions]},
+        }
+        process_stacktraces(
+            data,
+            make_processors=lambda data, infos: [UppercaseProcessor(data, infos, self.project)],
+        )
+        return [frame["function"] for frame in data["stacktrace"]["frames"]]
+
+    def test_batched(self):
+        functions = [f"fn{i % 20}" for i in range(50)]
+        with mock.patch.object(cache, "get", wraps=cache.get) as get, mock.patch.object(
+            cache, "get_many", wraps=cache.get_many
+        ) as get_many:
+            expected = [function.upper() for function in functions]
+            assert self.process(functions) == expected
+            assert UppercaseProcessor.processed == 50
+            assert get_many.call_count == 1
+            assert get.call_count == 0
+
+            # Frames with the same cache key all get the cached value
+            assert self.process(functions) == expected
+            assert UppercaseProcessor.processed == 50
+            assert get_many.call_count == 2
@@ -6,7 +6,7 @@ import pytz
 
 from sentry.testutils import TestCase
 from sentry.tsdb.base import ONE_DAY, ONE_HOUR, ONE_MINUTE, TSDBModel
-from sentry.tsdb.redis import CountMinScript, RedisTSDB, SuppressionWrapper
+from sentry.tsdb.redis import CountMinScript, CounterReadCache, RedisTSDB, SuppressionWrapper
 from sentry.utils.dates import to_datetime, to_timestamp
 
 
@@ -587,6 +587,124 @@ class RedisTSDBTest(TestCase):
             model, ("organization:1", "organization:2"), now, environment_id=1
         ) == {"organization:1": [], "organization:2": []}
 
+    def test_write_batch(self):
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(hours=4)
+        dts = [now + timedelta(hours=i) for i in range(4)]
+        model = TSDBModel.frequent_issues_by_project
+
+        with self.db.write_batch() as batch:
+            batch.incr(TSDBModel.project, 1, dts[0])
+            batch.incr_multi(
+                [(TSDBModel.project, 1), (TSDBModel.project, 2)], dts[1], count=2, environment_id=1
+            )
+            batch.record(TSDBModel.users_affected_by_project, 1, ("foo", "bar"), dts[0])
+            batch.record_multi(((TSDBModel.users_affected_by_project, 1, ("baz",)),), dts[1])
+            batch.record_frequency_multi(
+                ((model, {"organization:1": {"project:1": 1, "project:2": 2}}),), dts[0]
+            )
+
+            # Nothing is written before the batch exits.
+            assert self.db.get_sums(TSDBModel.project, [1], dts[0], dts[-1]) == {1: 0}
+
+        assert self.db.get_sums(TSDBModel.project, [1, 2], dts[0], dts[-1]) == {1: 3, 2: 2}
+        assert self.db.get_sums(TSDBModel.project, [1, 2], dts[0], dts[-1], environment_id=1) == {
+            1: 2,
+            2: 2,
+        }
+        assert self.db.get_distinct_counts_totals(
+            TSDBModel.users_affected_by_project, [1], dts[0], dts[-1]
+        ) == {1: 3}
+        assert self.db.get_most_frequent(model, ("organization:1",), dts[0], rollup=3600) == {
+            "organization:1": [("project:2", 2.0), ("project:1", 1.0)]
+        }
+
+    def test_write_batch_script_flush(self):
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+        model = TSDBModel.frequent_issues_by_project
+
+        def record(count):
+            with self.db.write_batch() as batch:
+                batch.incr(TSDBModel.project, 1, now, count=count)
+                batch.record_frequency_multi(
+                    ((model, {"organization:1": {"project:1": count}}),), now
+                )
+
+        record(1)
+
+        # The hosts forget their scripts, e.g. after a restart.
+        with self.db.cluster.all() as client:
+            client.execute_command("SCRIPT FLUSH")
+
+        record(2)
+        assert self.db.get_sums(TSDBModel.project, [1], now, now) == {1: 3}
+        assert self.db.get_most_frequent(model, ("organization:1",), now, rollup=3600) == {
+            "organization:1": [("project:1", 3.0)]
+        }
+
+    def test_read_cache(self):
+        db = RedisTSDB(
+            rollups=((ONE_HOUR, 24),),
+            read_cache_size=100,
+            read_cache_shared=True,
+            hosts={i - 6: {"db": i} for i in range(6, 9)},
+        )
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+        then = now - timedelta(hours=2)
+
+        def sneaky_incr(timestamp, count):
+            # Bypasses the invalidation of the read cache.
+            hash_key, hash_field = db.make_counter_key(
+                TSDBModel.project, ONE_HOUR, timestamp, 1, None
+            )
+            with db.cluster.map() as client:
+                client.hincrby(hash_key, hash_field, count)
+
+        db.incr(TSDBModel.project, 1, then)
+        db.incr(TSDBModel.project, 1, now)
+        assert db.get_sums(TSDBModel.project, [1], then, now) == {1: 2}
+
+        # Closed buckets are served from the cache, open ones are read live.
+        sneaky_incr(then, 5)
+        sneaky_incr(now, 5)
+        assert db.get_sums(TSDBModel.project, [1], then, now) == {1: 7}
+
+        # The shared cache is used once the local cache is gone.
+        db.read_cache.local.clear()
+        assert db.get_sums(TSDBModel.project, [1], then, now) == {1: 7}
+
+        # Late writes to closed buckets invalidate them.
+        db.incr(TSDBModel.project, 1, then)
+        assert db.get_sums(TSDBModel.project, [1], then, now) == {1: 13}
+
+        db.merge(TSDBModel.project, 2, [1], now)
+        assert db.get_sums(TSDBModel.project, [1], then, now) == {1: 0}
+        assert db.get_sums(TSDBModel.project, [2], then, now) == {2: 13}
+
+        db.delete([TSDBModel.project], [2], then, now)
+        assert db.get_sums(TSDBModel.project, [2], then, now) == {2: 0}
+
+    def test_read_cache_late_invalidation(self):
+        read_cache = CounterReadCache(local_size=100, shared=True)
+        key = ("ts:1:3600:0", "1")
+
+        # A late write invalidates the key while its old value is being read.
+        cached, generation = read_cache.get_many([key])
+        assert cached == {}
+        read_cache.delete_many([key])
+        read_cache.set_many({key: 1}, generation)
+        assert read_cache.get_many([key])[0] == {}
+
+        cached, generation = read_cache.get_many([key])
+        read_cache.set_many({key: 2}, generation)
+        assert read_cache.get_many([key])[0] == {key: 2}
+        read_cache.local.clear()
+        assert read_cache.get_many([key])[0] == {key: 2}
+
+        # Invalidations by other processes apply to the shared cache.
+        CounterReadCache(shared=True).delete_many([key])
+        read_cache.local.clear()
+        assert read_cache.get_many([key])[0] == {}
+
     def test_frequency_table_import_export_no_estimators(self):
         client = self.db.cluster.get_local_client_for_key("key")
 
@@ -1,5 +1,7 @@
+from unittest import mock
+
 from sentry.tsdb.base import TSDBModel
-from sentry.tsdb.redissnuba import READ, method_specifications, selector_func
+from sentry.tsdb.redissnuba import READ, RedisSnubaTSDB, method_specifications, selector_func
 from sentry.tsdb.snuba import SnubaTSDB
 
 
@@ -36,3 +38,21 @@ def test_redissnuba_connects_to_correct_backend():
                 assert "snuba" == selector_func(method, get_callargs(model))
             else:
                 assert "dummy" == selector_func(method, get_callargs(model))
+
+
+def test_redissnuba_write_batch():
+    tsdb = RedisSnubaTSDB()
+    tsdb.backends = {"dummy": mock.Mock(), "redis": mock.Mock(), "snuba": mock.Mock()}
+
+    with tsdb.write_batch() as batch:
+        batch.incr(TSDBModel.project_total_received, 1)
+        batch.incr_multi([(TSDBModel.users_affected_by_project, 1)])
+        batch.record(TSDBModel.users_affected_by_project, 1, ["foo"])
+
+    (dummy_operations,) = tsdb.backends["dummy"].flush_write_batch.call_args[0]
+    assert [method for method, args, kwargs in dummy_operations] == ["incr_multi"]
+
+    (redis_operations,) = tsdb.backends["redis"].flush_write_batch.call_args[0]
+    assert [method for method, args, kwargs in redis_operations] == ["incr_multi", "record_multi"]
+
+    assert not tsdb.backends["snuba"].flush_write_batch.called
@@ -1,6 +1,6 @@
 import pytest
 
-from sentry.utils.datastructures import BidirectionalMapping
+from sentry.utils.datastructures import BidirectionalMapping, LRUCache
 
 
 def test_bidirectional_mapping():
@@ -30,3 +30,33 @@ def test_bidirectional_mapping():
     del value["c"]
 
     assert len(value) == len(value.inverse()) == 2
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1  # "b" is now the least recently used item
+    cache["c"] = 3
+    assert "b" not in cache
+    assert dict(cache) == {"a": 1, "c": 3}
+
+    del cache["a"]
+    assert len(cache) == 1
+    assert cache.size == 1
+
+
+def test_lru_cache_sizeof():
+    evicted = []
+    cache = LRUCache(10, sizeof=len, on_evict=lambda k, v: evicted.append(k))
+    cache["a"] = b"12345"
+    cache["b"] = b"12345"
+    assert cache.size == 10
+    cache["c"] = b"1"
+    assert evicted == ["a"]
+    assert cache.size == 6
+
+    # too large to ever fit
+    cache["d"] = b"12345678901"
+    assert "d" not in cache
+    assert cache.size == 6
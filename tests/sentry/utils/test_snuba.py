@@ -17,6 +17,7 @@ from sentry.utils.snuba import (
     get_query_params_to_update_for_projects,
     get_snuba_column_name,
     get_snuba_translators,
+    parse_snuba_timestamp,
     quantize_time,
 )
 
@@ -354,3 +355,20 @@ class QuantizeTimeTest(unittest.TestCase):
                 break
 
         assert i != j
+
+
+class ParseSnubaTimestampTest(unittest.TestCase):
+    def test_formats(self):
+        for value in [
+            "2021-06-01T12:34:56+00:00",
+            "2021-06-01T12:34:56.789000+00:00",
+            "2021-06-01T14:34:56+02:00",
+            "2021-06-01T12:34:56Z",
+            "2021-06-01 12:34:56+00:00",
+        ]:
+            assert parse_snuba_timestamp(value) == 1622550896, value
+
+    def test_reverse_translation(self):
+        _, reverse = get_snuba_translators({})
+        row = {"time": "2021-06-01T12:00:00+00:00", "bucketed_end": "2021-06-01T13:00:00+00:00"}
+        assert reverse(row) == {"time": 1622548800, "bucketed_end": 1622552400}
@@ -0,0 +1,206 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from snuba_sdk.column import Column
+from snuba_sdk.conditions import Condition, Op
+from snuba_sdk.entity import Entity
+from snuba_sdk.function import Function
+from snuba_sdk.query import Query
+
+from sentry.net.http import connection_from_url
+from sentry.testutils import TestCase
+from sentry.utils import json, snuba, snuba_coalescing
+from sentry.utils.compat import mock
+from sentry.utils.redis import redis_clusters
+
+
+class FakeSnubaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            self.server.requests += 1
+            count = self.server.requests
+        self.server.release.wait(5)
+
+        body = json.dumps(
+            {"data": [{"count": count}], "meta": [{"name": "count", "type": "UInt64"}]}
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSnuba(ThreadingHTTPServer):
+    """
+    Answers every query with the number of queries received so far. Responses
+    are held back until ``release`` is set.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeSnubaHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.release = threading.Event()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class SnubaCoalescingTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeSnuba()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        pool = connection_from_url(f"http://127.0.0.1:{self.server.server_port}", maxsize=10)
+        patcher = mock.patch.object(snuba, "_snuba_pool", pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        now = datetime(2021, 6, 1, 12, 0, 0)
+        self.query = (
+            Query(dataset="events", match=Entity("events"))
+            .set_select([Function("count", [], "count")])
+            .set_where(
+                [
+                    Condition(Column("project_id"), Op.EQ, self.project.id),
+                    Condition(Column("timestamp"), Op.GTE, now - timedelta(days=1)),
+                    Condition(Column("timestamp"), Op.LT, now),
+                ]
+            )
+        )
+        self.key = snuba.get_cache_key(self.query)
+        self.redis = redis_clusters.get("default")
+
+    def run_queries(self, count):
+        results = [None] * count
+
+        def run(i):
+            results[i] = snuba.raw_snql_query(self.query, referrer="test")
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_local(self):
+        with self.settings(SENTRY_SNUBA_QUERY_COALESCING=True):
+            threads, results = self.run_queries(5)
+            wait_for(
+                lambda: self.key in snuba_coalescing._flights
+                and snuba_coalescing._flights[self.key].followers == 4
+            )
+            self.server.release.set()
+            for thread in threads:
+                thread.join()
+
+        assert self.server.requests == 1
+        assert [result["data"] for result in results] == [[{"count": 1}]] * 5
+        # Followers get their own copy of the result.
+        assert len({id(result) for result in results}) == 5
+        assert self.key not in snuba_coalescing._flights
+
+    def test_disabled(self):
+        self.server.release.set()
+        threads, results = self.run_queries(3)
+        for thread in threads:
+            thread.join()
+
+        assert self.server.requests == 3
+
+    def test_remote(self):
+        self.redis.set(f"{self.key}:lease", "other", ex=30)
+        with self.settings(
+            SENTRY_SNUBA_QUERY_COALESCING=True,
+            SENTRY_SNUBA_QUERY_COALESCING_REDIS_CLUSTER="default",
+        ):
+            threads, results = self.run_queries(2)
+            wait_for(
+                lambda: self.key in snuba_coalescing._flights
+                and snuba_coalescing._flights[self.key].followers == 1
+            )
+            # The leader in the other process publishes its result.
+            self.redis.set(
+                f"{self.key}:result:other", json.dumps({"data": [{"count": 42}], "meta": []})
+            )
+            self.redis.delete(f"{self.key}:lease")
+            for thread in threads:
+                thread.join()
+
+        assert self.server.requests == 0
+        assert [result["data"] for result in results] == [[{"count": 42}]] * 2
+
+    def test_remote_fallback(self):
+        self.redis.set(f"{self.key}:lease", "other", ex=30)
+        self.server.release.set()
+        with self.settings(
+            SENTRY_SNUBA_QUERY_COALESCING=True,
+            SENTRY_SNUBA_QUERY_COALESCING_REDIS_CLUSTER="default",
+        ):
+            threads, results = self.run_queries(1)
+            wait_for(lambda: self.key in snuba_coalescing._flights)
+            # The leader in the other process gives up without a result.
+            self.redis.delete(f"{self.key}:lease")
+            threads[0].join()
+
+        assert self.server.requests == 1
+        assert results[0]["data"] == [{"count": 1}]
+
+    def test_lease(self):
+        self.server.release.set()
+        with self.settings(
+            SENTRY_SNUBA_QUERY_COALESCING=True,
+            SENTRY_SNUBA_QUERY_COALESCING_REDIS_CLUSTER="default",
+        ), mock.patch.object(self.redis, "set", wraps=self.redis.set) as redis_set:
+            snuba.raw_snql_query(self.query, referrer="test")
+
+        # The result is published under the flight of the lease, which is
+        # released afterwards.
+        (lease_call, result_call) = redis_set.call_args_list
+        flight_id = lease_call[0][1]
+        assert lease_call[0][0] == f"{self.key}:lease"
+        assert result_call[0][0] == f"{self.key}:result:{flight_id}"
+        assert self.redis.get(f"{self.key}:lease") is None
+
+    def test_lease_released_before_waiting(self):
+        # The other process leads the second query and follows the first one.
+        self.redis.set("test:b:lease", "other", ex=30)
+        ran = threading.Event()
+        results = []
+
+        def run(positions):
+            ran.set()
+            return [1]
+
+        def coalesce():
+            results.extend(snuba_coalescing.coalesce(["test:a", "test:b"], run))
+
+        with self.settings(
+            SENTRY_SNUBA_QUERY_COALESCING=True,
+            SENTRY_SNUBA_QUERY_COALESCING_REDIS_CLUSTER="default",
+        ):
+            thread = threading.Thread(target=coalesce)
+            thread.start()
+            # The first result is published while the second one is awaited.
+            wait_for(lambda: ran.is_set() and self.redis.get("test:a:lease") is None)
+            assert thread.is_alive()
+            self.redis.set("test:b:result:other", json.dumps(2))
+            self.redis.delete("test:b:lease")
+            thread.join()
+
+        assert results == [1, 2]
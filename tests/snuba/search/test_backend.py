@@ -24,7 +24,7 @@ from sentry.search.snuba.backend import (
     CdcEventsDatasetSnubaSearchBackend,
     EventsDatasetSnubaSearchBackend,
 )
-from sentry.search.snuba.executors import InvalidQueryForExecutor
+from sentry.search.snuba.executors import InvalidQueryForExecutor, PostgresSnubaQueryExecutor
 from sentry.testutils import SnubaTestCase, TestCase, xfail_if_not_postgres
 from sentry.testutils.helpers.datetime import before_now, iso_format
 from sentry.utils.compat import mock
@@ -1311,6 +1311,49 @@ class EventsSnubaSearchTest(TestCase, SnubaTestCase):
         finally:
             options.set("snuba.search.max-pre-snuba-candidates", prev_max_pre)
 
+    def test_parallel_chunks(self):
+        groups = []
+        for i in range(8):
+            event = self.store_event(
+                data={
+                    "fingerprint": [f"put-me-in-chunk-group{i}"],
+                    "timestamp": iso_format(self.base_datetime - timedelta(days=1, hours=i)),
+                },
+                project_id=self.project.id,
+            )
+            groups.append(event.group)
+        GroupBookmark.objects.create(user=self.user, group=groups[-1], project=self.project)
+
+        # Post-filtering takes chunks of 2, 4 and 8 groups, the last one holds
+        # the first bookmarked group.
+        results = {}
+        for parallel_chunks in (1, 3):
+            with self.options(
+                {
+                    "snuba.search.max-pre-snuba-candidates": 1,
+                    "snuba.search.chunk-growth-rate": 2,
+                    "snuba.search.parallel-chunks": parallel_chunks,
+                }
+            ), mock.patch.object(
+                PostgresSnubaQueryExecutor,
+                "bulk_snuba_search",
+                autospec=True,
+                side_effect=PostgresSnubaQueryExecutor.bulk_snuba_search,
+            ) as bulk_snuba_search:
+                results[parallel_chunks] = self.make_query(
+                    search_filter_query="bookmarks:%s" % self.user.username, limit=1
+                )
+
+            if parallel_chunks == 1:
+                assert not bulk_snuba_search.called
+            else:
+                # The second and third chunk are fetched together.
+                assert bulk_snuba_search.call_count == 1
+                assert bulk_snuba_search.call_args[0][1] == [(4, 2), (8, 6), (16, 14)]
+
+        assert list(results[1]) == list(results[3]) == [groups[-1]]
+        assert results[1].next.has_results == results[3].next.has_results
+
     def test_optimizer_enabled(self):
         prev_optimizer_enabled = options.get("snuba.search.pre-snuba-candidates-optimizer")
         options.set("snuba.search.pre-snuba-candidates-optimizer", True)